@@ -6,17 +6,44 @@ type MessageHandler = (msg: WebSocketMessage) => void;
 // u32le turn_id
 // u32le seq
 // ... payload (raw bytes)
+//
+// Coalesced frame (several chunks in one message):
+// 4 bytes magic 'AUD1'
+// u32le turn_id
+// u32le count
+// count x { u32le seq, u32le len, payload[len] }
 const AUD_MAGIC = 0x30445541; // 'AUD0' little-endian in DataView getUint32(0,true)
+const AUD1_MAGIC = 0x31445541; // 'AUD1'
 
-function parseAudioFrame(u8: Uint8Array): WebSocketMessage | null {
+function parseAudioFrames(u8: Uint8Array): WebSocketMessage[] | null {
     if (u8.byteLength < 12) return null;
     const dv = new DataView(u8.buffer, u8.byteOffset, u8.byteLength);
     const magic = dv.getUint32(0, true);
-    if (magic !== AUD_MAGIC) return null;
     const turn_id = dv.getUint32(4, true);
-    const seq = dv.getUint32(8, true);
-    const payload = u8.subarray(12);
-    return { type: "audio_chunk_bin", turn_id, seq, payload };
+
+    if (magic === AUD_MAGIC) {
+        const seq = dv.getUint32(8, true);
+        const payload = u8.subarray(12);
+        return [{ type: "audio_chunk_bin", turn_id, seq, payload }];
+    }
+
+    if (magic === AUD1_MAGIC) {
+        const count = dv.getUint32(8, true);
+        const msgs: WebSocketMessage[] = [];
+        let off = 12;
+        for (let i = 0; i < count; i++) {
+            if (off + 8 > u8.byteLength) return null;
+            const seq = dv.getUint32(off, true);
+            const len = dv.getUint32(off + 4, true);
+            off += 8;
+            if (off + len > u8.byteLength) return null;
+            msgs.push({ type: "audio_chunk_bin", turn_id, seq, payload: u8.subarray(off, off + len) });
+            off += len;
+        }
+        return msgs;
+    }
+
+    return null;
 }
 
 export class WebSocketService {
@@ -93,19 +120,20 @@ export class WebSocketService {
             }
 
             const handleBinary = (u8: Uint8Array) => {
-                // try json-bytes first
+                // audio frames first: magic is checked in O(1), and PCM payloads
+                // can occasionally be valid UTF-8
+                const audioMsgs = parseAudioFrames(u8);
+                if (audioMsgs) {
+                    for (const m of audioMsgs) this.messageHandler?.(m);
+                    return;
+                }
+
+                // then json-bytes
                 try {
                     const s = new TextDecoder("utf-8", { fatal: true }).decode(u8);
                     handleJson(s);
                     return;
                 } catch {
-                    // then try audio frame
-                    const audioMsg = parseAudioFrame(u8);
-                    if (audioMsg) {
-                        this.messageHandler?.(audioMsg);
-                        return;
-                    }
-
                     // fallback
                     this.messageHandler?.({ type: "ws_binary", bytes: u8.length });
                 }
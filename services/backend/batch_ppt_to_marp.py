@@ -25,11 +25,19 @@ import sys
 import re
 import json
 import hashlib
+import mmap
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
 from pathlib import Path
+from types import SimpleNamespace
 from typing import Optional, Tuple, List, Dict, Any
 from dataclasses import dataclass, field, asdict
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache
+from operator import attrgetter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 try:
     from pptx import Presentation
@@ -44,6 +52,16 @@ except ImportError:
     print("=" * 60)
     sys.exit(1)
 
+try:
+    import numpy as np  # 可选：整份课件的密度分级向量化
+except ImportError:
+    np = None
+
+try:
+    import orjson  # 可选：_meta.json 序列化
+except ImportError:
+    orjson = None
+
 
 # =============================================================================
 # 数据结构定义
@@ -68,7 +86,7 @@ class ContentDensity(Enum):
     DENSE = "dense"       # 密集（可能需要拆分）
 
 
-@dataclass
+@dataclass(slots=True)
 class ImageInfo:
     """图片信息"""
     filename: str
@@ -96,7 +114,7 @@ class ImageInfo:
             return f"![bg right:35% fit]({asset_path})"
 
 
-@dataclass
+@dataclass(slots=True)
 class TextBlock:
     """文本块信息"""
     text: str
@@ -109,7 +127,7 @@ class TextBlock:
     shape_type: str         # "title", "body", "textbox", "other"
 
 
-@dataclass
+@dataclass(slots=True)
 class SlideData:
     """单张幻灯片的结构化数据"""
     index: int
@@ -143,11 +161,36 @@ class SlideData:
 # 工具函数
 # =============================================================================
 
+# 预编译正则（每张幻灯片都会调用，避免重复查编译缓存）
+_ILLEGAL_FS_RE = re.compile(r'[<>:"/\\|?*]')
+_WHITESPACE_RE = re.compile(r'\s+')
+_UNDERSCORES_RE = re.compile(r'_+')
+
+# 引号内容 | 英文缩写 (2-5个大写字母)，一次扫描
+_QUOTED_RE = re.compile(r'[""「」『』]([^""「」『』]+)[""「」『』]')
+_ABBREV_RE = re.compile(r'\b[A-Z]{2,5}\b')
+
+_CONTINUATION_RES = [
+    re.compile(r'[\(（][续继][\)）]'),
+    re.compile(r'cont[\'.]?d?'),
+    re.compile(r'continued'),
+    re.compile(r'part\s*\d+'),
+    re.compile(r'[（\(]\d+[）\)]$'),
+]
+
+_SECTION_RES = [
+    re.compile(r'^第[一二三四五六七八九十\d]+[章节讲课]', re.IGNORECASE),
+    re.compile(r'^\d+[\.\、]\s*\S', re.IGNORECASE),
+    re.compile(r'^[IVX]+[\.\、]\s*\S', re.IGNORECASE),
+    re.compile(r'^(Chapter|Lecture|Week|Part)\s*\d+', re.IGNORECASE),
+]
+
+
 def sanitize_filename(name: str) -> str:
     """清理文件名"""
-    sanitized = re.sub(r'[<>:"/\\|?*]', '_', name)
-    sanitized = re.sub(r'\s+', '_', sanitized)
-    sanitized = re.sub(r'_+', '_', sanitized)
+    sanitized = _ILLEGAL_FS_RE.sub('_', name)
+    sanitized = _WHITESPACE_RE.sub('_', sanitized)
+    sanitized = _UNDERSCORES_RE.sub('_', sanitized)
     return sanitized.strip('_')
 
 
@@ -164,59 +207,53 @@ def estimate_speak_time(text_content: str, notes: str) -> int:
     return max(30, int(total_chars * 0.4))
 
 
-def extract_key_terms(text: str) -> List[str]:
-    """提取关键术语（简单实现）"""
-    # 提取引号内容、大写缩写、专有名词等
-    terms = []
+@lru_cache(maxsize=4096)
+def _key_terms(text: str) -> Tuple[str, ...]:
+    # 提取引号内容、大写缩写：先全部引号内容，再全部缩写，去重（忽略大小写）并限制数量
+    unique_terms: Dict[str, str] = {}
+    for pattern in (_QUOTED_RE, _ABBREV_RE):
+        for t in pattern.findall(text):
+            if len(t) > 1:
+                unique_terms.setdefault(t.lower(), t)
+                if len(unique_terms) >= 10:
+                    return tuple(unique_terms.values())
     
-    # 引号内容
-    quoted = re.findall(r'[""「」『』]([^""「」『』]+)[""「」『』]', text)
-    terms.extend(quoted)
-    
-    # 英文缩写 (2-5个大写字母)
-    abbrevs = re.findall(r'\b[A-Z]{2,5}\b', text)
-    terms.extend(abbrevs)
-    
-    # 去重并限制数量
-    seen = set()
-    unique_terms = []
-    for t in terms:
-        t_lower = t.lower()
-        if t_lower not in seen and len(t) > 1:
-            seen.add(t_lower)
-            unique_terms.append(t)
-    
-    return unique_terms[:10]
+    return tuple(unique_terms.values())
+
+
+def extract_key_terms(text: str) -> List[str]:
+    """提取关键术语（简单实现；相同文本只扫描一次，如模板页、重复的页脚）"""
+    return list(_key_terms(text))
+
+
+# 布局名关键词：title 组 | blank 组 | end 组 | section 组，命中位记在 bitmask 里
+_LAYOUT_KW_RE = re.compile(r'(title|标题|封面)|(blank|空白)|(end|结束|thank|谢谢)|(section|节)')
+_LAYOUT_TITLE, _LAYOUT_BLANK, _LAYOUT_END, _LAYOUT_SECTION = 1, 2, 4, 8
+
+# 按 [has_text][has_images] 查表
+_CONTENT_SLIDE_TYPES = (
+    (SlideType.BLANK, SlideType.IMAGE_ONLY),
+    (SlideType.TEXT_ONLY, SlideType.MIXED),
+)
 
 
 def detect_slide_type(title: Optional[str], text_blocks: List[TextBlock], 
                       images: List[ImageInfo], layout_name: str) -> SlideType:
     """检测幻灯片类型"""
-    has_text = bool(text_blocks)
-    has_images = bool(images)
-    
-    # 检查布局名称中的关键词
-    layout_lower = layout_name.lower()
-    if any(kw in layout_lower for kw in ['title', '标题', '封面']):
-        if 'section' in layout_lower or '节' in layout_lower:
-            return SlideType.SECTION
-        return SlideType.TITLE
+    # 检查布局名称中的关键词（一次扫描，优先级 title > blank > end）
+    hits = 0
+    for m in _LAYOUT_KW_RE.finditer(layout_name.lower()):
+        hits |= 1 << (m.lastindex - 1)
     
-    if any(kw in layout_lower for kw in ['blank', '空白']):
+    if hits & _LAYOUT_TITLE:
+        return SlideType.SECTION if hits & _LAYOUT_SECTION else SlideType.TITLE
+    if hits & _LAYOUT_BLANK:
         return SlideType.BLANK
-    
-    if any(kw in layout_lower for kw in ['end', '结束', 'thank', '谢谢']):
+    if hits & _LAYOUT_END:
         return SlideType.ENDING
     
     # 基于内容判断
-    if not has_text and not has_images:
-        return SlideType.BLANK
-    elif has_images and not has_text:
-        return SlideType.IMAGE_ONLY
-    elif has_text and not has_images:
-        return SlideType.TEXT_ONLY
-    else:
-        return SlideType.MIXED
+    return _CONTENT_SLIDE_TYPES[bool(text_blocks)][bool(images)]
 
 
 def assess_content_density(text_blocks: List[TextBlock], images: List[ImageInfo]) -> ContentDensity:
@@ -232,19 +269,33 @@ def assess_content_density(text_blocks: List[TextBlock], images: List[ImageInfo]
         return ContentDensity.NORMAL
 
 
+# 密度分级码 -> 枚举（0=稀疏, 1=正常, 2=密集）
+_DENSITY_BY_CODE = (ContentDensity.SPARSE, ContentDensity.NORMAL, ContentDensity.DENSE)
+
+
+def assess_content_density_batch(text_lens: List[int], item_counts: List[int]) -> List[ContentDensity]:
+    """整份课件一次评估内容密度（规则同 assess_content_density）"""
+    if np is not None and text_lens:
+        lens = np.asarray(text_lens)
+        items = np.asarray(item_counts)
+        codes = np.where((lens < 50) & (items <= 2), 0,
+                         np.where((lens > 500) | (items > 8), 2, 1))
+        return [_DENSITY_BY_CODE[c] for c in codes.tolist()]
+    
+    return [
+        ContentDensity.SPARSE if n < 50 and k <= 2
+        else ContentDensity.DENSE if n > 500 or k > 8
+        else ContentDensity.NORMAL
+        for n, k in zip(text_lens, item_counts)
+    ]
+
+
 def is_continuation_title(title: str) -> bool:
     """检查是否是延续性标题（如 "xxx（续）"）"""
     if not title:
         return False
-    patterns = [
-        r'[\(（][续继][\)）]',
-        r'cont[\'.]?d?',
-        r'continued',
-        r'part\s*\d+',
-        r'[（\(]\d+[）\)]$',
-    ]
     title_lower = title.lower()
-    return any(re.search(p, title_lower) for p in patterns)
+    return any(r.search(title_lower) for r in _CONTINUATION_RES)
 
 
 def detect_section_start(title: str, layout_name: str, prev_title: Optional[str]) -> Tuple[bool, Optional[str]]:
@@ -259,15 +310,8 @@ def detect_section_start(title: str, layout_name: str, prev_title: Optional[str]
         return True, title
     
     # 标题格式检测：数字开头、"第X章/节" 等
-    section_patterns = [
-        r'^第[一二三四五六七八九十\d]+[章节讲课]',
-        r'^\d+[\.\、]\s*\S',
-        r'^[IVX]+[\.\、]\s*\S',
-        r'^(Chapter|Lecture|Week|Part)\s*\d+',
-    ]
-    
-    for pattern in section_patterns:
-        if re.match(pattern, title, re.IGNORECASE):
+    for pattern in _SECTION_RES:
+        if pattern.match(title):
             return True, title
     
     return False, None
@@ -307,18 +351,215 @@ def get_image_size_hint(width_emu: int, height_emu: int,
         return "small"
 
 
+# 图片扩展名归一化（与 python-pptx Image.ext 一致），只导出这些格式
+_IMAGE_EXTS = {"jpeg": "jpg", "jpe": "jpg", "tif": "tiff"}
+_SUPPORTED_IMAGE_EXTS = frozenset(("bmp", "gif", "jpg", "png", "tiff", "wmf"))
+
+# 单页图片数达到该值时才用 NumPy 批量分级（图片少时逐张计算更快）
+_NP_MIN_IMAGES = 16
+
+
+def classify_image_hints(geoms: List[Tuple[int, int, int, int]],
+                         slide_width: int, slide_height: int) -> Tuple[List[str], List[str]]:
+    """
+    批量计算图片的位置/大小提示（规则同 get_image_position_hint / get_image_size_hint）
+    
+    geoms: [(left, top, width, height), ...]
+    """
+    if np is None or len(geoms) < _NP_MIN_IMAGES:
+        positions = [get_image_position_hint(l, t, w, slide_width, slide_height) for l, t, w, h in geoms]
+        sizes = [get_image_size_hint(w, h, slide_width, slide_height) for l, t, w, h in geoms]
+        return positions, sizes
+    
+    arr = np.array(geoms, dtype=np.int64).T
+    left, width, height = arr[0], arr[2], arr[3]
+    center_x = left + width / 2
+    slide_center = slide_width / 2
+    positions = np.where(center_x < slide_center * 0.6, "left",
+                         np.where(center_x > slide_center * 1.4, "right", "center"))
+    area_ratio = (width * height) / (slide_width * slide_height)
+    sizes = np.select([area_ratio > 0.5, area_ratio > 0.25, area_ratio > 0.1],
+                      ["full", "large", "medium"], "small")
+    return positions.tolist(), sizes.tolist()
+
+
+# 枚举成员提前取出，避免每个形状都走一次枚举属性查找
+_PIC = MSO_SHAPE_TYPE.PICTURE
+_GROUP = MSO_SHAPE_TYPE.GROUP
+
+# 占位符类型：TITLE=1, CENTER_TITLE=3
+_TITLE_PH_TYPES = frozenset((1, 3))
+
+
+def iter_shapes(shapes):
+    """
+    按文档顺序遍历所有形状，包括任意层嵌套的组合形状（显式栈，不递归）
+    
+    Yields:
+        (shape, shape_type)，shape_type 只读一次；无法识别的形状为 None
+    """
+    stack = list(shapes)[::-1]
+    while stack:
+        shape = stack.pop()
+        try:
+            st = shape.shape_type
+        except Exception:
+            st = None
+        yield shape, st
+        if st == _GROUP:
+            try:
+                stack.extend(list(shape.shapes)[::-1])
+            except Exception:
+                pass
+
+
+def image_digest(blob: bytes) -> str:
+    """图片内容指纹（BLAKE2b，用于同一课件内的去重）"""
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+
+# 超过该大小的图片用 O_DIRECT 写出（不占页缓存，写完一般不会再读）
+_DIRECT_IO_MIN = 1 << 20
+_DIRECT_IO_ALIGN = 4096
+
+
+def _write_direct(path: Path, data: bytes):
+    """O_DIRECT 写出：数据拷进页对齐的匿名 mmap，按 4 KB 整块写入后截断到实际长度"""
+    size = len(data)
+    padded = -(-size // _DIRECT_IO_ALIGN) * _DIRECT_IO_ALIGN
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o644)
+    try:
+        with mmap.mmap(-1, padded) as buf:
+            buf[:size] = data
+            view = memoryview(buf)
+            try:
+                written = 0
+                while written < padded:
+                    written += os.write(fd, view[written:])
+            finally:
+                view.release()
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def write_blob(path: Path, data: bytes):
+    """直接用 os.open/os.write 写出二进制（不经过 Python io 缓冲）；大图优先走 O_DIRECT"""
+    if len(data) > _DIRECT_IO_MIN and hasattr(os, "O_DIRECT"):
+        try:
+            _write_direct(path, data)
+            return
+        except OSError:
+            pass  # 文件系统不支持（如 tmpfs）时退回普通写入
+    
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def stream_blob(src, path: Path, chunk_size: int = 1 << 20) -> str:
+    """按块从 src 拷贝到 path，同时计算内容指纹（与 image_digest 一致）"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'wb') as dst:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+            dst.write(chunk)
+    return h.hexdigest()
+
+
+class ImageWriter:
+    """
+    图片异步写出：submit_write 只登记，flush 把当前批次交给线程池（不等待），
+    wait 等待所有已提交的写入完成。这样下一页的解析可以和上一页的图片写盘重叠
+    （文件 I/O 释放 GIL）。
+    """
+    
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._pending: List[Tuple[Path, bytes]] = []
+        self._futures: List[Tuple[Path, Future]] = []
+        self._pool: Optional[ThreadPoolExecutor] = None
+    
+    def submit_write(self, path: Path, data: bytes):
+        self._pending.append((path, data))
+    
+    def flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._futures.extend((path, self._pool.submit(write_blob, path, data)) for path, data in batch)
+    
+    def wait(self) -> List[Tuple[Path, Exception]]:
+        """
+        等待全部写入完成，返回写失败的 (路径, 错误)。
+        和逐张同步写出时一样，单张图片写失败只跳过这张，不影响整份课件。
+        """
+        self.flush()
+        futures, self._futures = self._futures, []
+        failed: List[Tuple[Path, Exception]] = []
+        for path, fut in futures:
+            try:
+                fut.result()
+            except Exception as e:
+                failed.append((path, e))
+                # 写了一半的文件删掉，避免留下损坏的图片
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return failed
+    
+    def close(self):
+        self._pending = []
+        self._futures = []
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
 def extract_images_enhanced(slide, slide_num: int, output_dir: Path,
-                            slide_width: int, slide_height: int) -> List[ImageInfo]:
-    """增强版图片提取"""
-    images = []
+                            slide_width: int, slide_height: int,
+                            written: Optional[Dict[str, str]] = None,
+                            writer: Optional[ImageWriter] = None) -> List[ImageInfo]:
+    """
+    增强版图片提取
+    
+    written: 内容指纹 -> 已写出的文件名。传入同一个 dict 时，
+             重复出现的图片（Logo、背景等）只写一次，后续直接复用文件名。
+    writer: 批量写出图片（本页所有图片提取完后一次 flush，不等待写完）；不传则逐张同步写出。
+    """
+    found: List[Tuple[str, str, float, Tuple[int, int, int, int]]] = []
     img_counter = 1
     
-    def process_shape(shape):
+    # python-pptx：关系表每页取一次，图片直接按 rId 找到 ImagePart
+    # （绕开 shape.image，它每次新建 Image 并用 PIL 识别格式）；懒加载模式没有 part
+    part = getattr(slide, 'part', None)
+    rels = part.rels if part is not None else None
+    
+    def process_shape(shape, st):
         nonlocal img_counter
         try:
-            if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
-                image = shape.image
-                ext = image.ext.lstrip('.')
+            if st == _PIC:
+                if rels is not None:
+                    image = rels[shape._element.blip_rId].target_part
+                    ext = image.partname.ext.lower()
+                    orig_name = image.desc
+                else:
+                    image = shape.image
+                    ext = image.ext.lstrip('.').lower()
+                    orig_name = getattr(image, 'filename', None)
+                ext = _IMAGE_EXTS.get(ext, ext)
+                if ext not in _SUPPORTED_IMAGE_EXTS:
+                    return
                 
                 # 获取位置和尺寸
                 left = getattr(shape, 'left', 0)
@@ -331,42 +572,75 @@ def extract_images_enhanced(slide, slide_num: int, output_dir: Path,
                 
                 # 生成文件名
                 img_filename = f"slide_{slide_num:02d}_img_{img_counter:02d}.{ext}"
-                img_path = output_dir / img_filename
-                
-                # 保存图片
-                with open(img_path, 'wb') as f:
-                    f.write(image.blob)
-                
                 # 尝试获取原始文件名
-                orig_name = getattr(image, 'filename', img_filename)
+                if not orig_name:
+                    orig_name = img_filename
                 
-                info = ImageInfo(
-                    filename=img_filename,
-                    original_name=orig_name,
-                    width_emu=width,
-                    height_emu=height,
-                    left_emu=left,
-                    top_emu=top,
-                    aspect_ratio=round(aspect, 2),
-                    position_hint=get_image_position_hint(left, top, width, slide_width, slide_height),
-                    size_hint=get_image_size_hint(width, height, slide_width, slide_height)
-                )
+                if hasattr(image, 'open'):
+                    # 懒加载模式：从 zip 流式拷贝到目标文件，不把整张图读进内存
+                    img_path = output_dir / img_filename
+                    with image.open() as src:
+                        digest = stream_blob(src, img_path)
+                    if written is not None:
+                        if digest in written:
+                            os.remove(img_path)
+                            img_filename = written[digest]
+                        else:
+                            written[digest] = img_filename
+                    found.append((img_filename, orig_name, round(aspect, 2), (left, top, width, height)))
+                    img_counter += 1
+                    return
                 
-                images.append(info)
+                blob = image.blob
+                digest = image_digest(blob) if written is not None else None
+                if digest is not None and digest in written:
+                    img_filename = written[digest]
+                else:
+                    # 保存图片
+                    if writer is not None:
+                        writer.submit_write(output_dir / img_filename, blob)
+                    else:
+                        write_blob(output_dir / img_filename, blob)
+                    if digest is not None:
+                        written[digest] = img_filename
+                
+                # 位置/大小提示在整页收集完后批量计算
+                found.append((img_filename, orig_name, round(aspect, 2), (left, top, width, height)))
                 img_counter += 1
                 
         except Exception:
             pass
     
-    for shape in slide.shapes:
-        process_shape(shape)
-        # 处理组合形状
-        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
-            for sub_shape in shape.shapes:
-                process_shape(sub_shape)
+    # 组合形状逐层展开（shape_type 是 python-pptx 的 property，每个形状只读一次）
+    for shape, st in iter_shapes(slide.shapes):
+        process_shape(shape, st)
+    
+    if writer is not None:
+        writer.flush()
+    
+    try:
+        positions, sizes = classify_image_hints([f[3] for f in found], slide_width, slide_height)
+    except Exception:
+        return []
+    
+    images = [
+        ImageInfo(
+            filename=img_filename,
+            original_name=orig_name,
+            width_emu=width,
+            height_emu=height,
+            left_emu=left,
+            top_emu=top,
+            aspect_ratio=aspect,
+            position_hint=position,
+            size_hint=size
+        )
+        for (img_filename, orig_name, aspect, (left, top, width, height)), position, size
+        in zip(found, positions, sizes)
+    ]
     
     # 按位置排序（从左到右，从上到下）
-    images.sort(key=lambda x: (x.top_emu, x.left_emu))
+    images.sort(key=attrgetter("top_emu", "left_emu"))
     
     return images
 
@@ -386,8 +660,10 @@ def extract_text_enhanced(slide) -> Tuple[Optional[str], Optional[str], List[Tex
     title_found = False
     subtitle_found = False
     
-    for shape in slide.shapes:
+    # 组合形状内的文本框也要提取
+    for shape, _ in iter_shapes(slide.shapes):
         try:
+            # has_text_frame / is_placeholder / placeholder_format 都是 XML 查询，各读一次
             if not shape.has_text_frame:
                 continue
             
@@ -401,7 +677,7 @@ def extract_text_enhanced(slide) -> Tuple[Optional[str], Optional[str], List[Tex
                 try:
                     ph_type = shape.placeholder_format.type
                     # TITLE=1, CENTER_TITLE=3, SUBTITLE=4, BODY=2
-                    if ph_type in [1, 3]:
+                    if ph_type in _TITLE_PH_TYPES:
                         is_title_shape = True
                         shape_type = "title"
                     elif ph_type == 4:
@@ -413,26 +689,29 @@ def extract_text_enhanced(slide) -> Tuple[Optional[str], Optional[str], List[Tex
                     pass
             
             # 提取段落
-            for para_idx, para in enumerate(text_frame.paragraphs):
-                # 收集段落文本
-                para_text = ""
+            for para in text_frame.paragraphs:
+                # 收集段落文本（para.runs 每次访问都会重建，只取一次）
+                runs = para.runs
                 is_bold = False
                 font_size = None
                 
-                for run in para.runs:
-                    para_text += run.text
-                    # 获取格式信息
-                    if run.font.bold:
+                for run in runs:
+                    # 获取格式信息（已确定加粗就不再读 bold；字号取最后一个）
+                    font = run.font
+                    if not is_bold and font.bold:
                         is_bold = True
-                    if run.font.size:
-                        font_size = run.font.size.pt
+                    size = font.size
+                    if size:
+                        font_size = size.pt
                 
-                para_text = para_text.strip()
+                para_text = "".join([run.text for run in runs]).strip()
                 if not para_text:
                     continue
                 
                 # 获取缩进层级
-                level = para.level if para.level is not None else 0
+                level = para.level
+                if level is None:
+                    level = 0
                 
                 # 检查是否是列表项
                 is_bullet = level > 0 or (hasattr(para, 'bullet') and para.bullet is not None)
@@ -485,21 +764,224 @@ def extract_speaker_notes(slide) -> str:
     return ""
 
 
-def get_layout_name(slide) -> str:
-    """获取幻灯片布局名称"""
+def get_layout_name(slide, cache: Optional[Dict[int, Tuple[Any, str]]] = None) -> str:
+    """
+    获取幻灯片布局名称
+    
+    cache: id(布局) -> (布局, 名称)。同一份课件通常只有几种布局，传入同一个 dict 时
+           每种布局只解析一次（缓存持有布局对象，保证 id 不会被复用）。
+    """
     try:
-        return slide.slide_layout.name
+        layout = slide.slide_layout
+        if cache is None:
+            return layout.name
+        hit = cache.get(id(layout))
+        if hit is None:
+            hit = cache[id(layout)] = (layout, layout.name)
+        return hit[1]
     except:
         return "Unknown"
 
 
+# =============================================================================
+# 轻量 PPTX 读取（--lazy）
+# =============================================================================
+# 直接用 zipfile + ElementTree 逐页解析 slide XML，不构建 python-pptx 的完整
+# 对象模型；图片 blob 在访问时才从 zip 读取。只提供上面 extract_* 函数用到的
+# 属性，因此可以作为 Presentation 的替身传入，内存只与单页大小相关。
+
+_NS_P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+_NS_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_NS_R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# <p:ph type="..."> -> python-pptx PP_PLACEHOLDER 数值（其余按 OBJECT=7 处理）
+_PH_TYPES = {"title": 1, "body": 2, "ctrTitle": 3, "subTitle": 4}
+
+
+def _read_rels(zf: zipfile.ZipFile, partname: str) -> Dict[str, Tuple[str, str]]:
+    """读取 part 的关系表：rId -> (关系类型短名, 目标 partname)，忽略外部链接"""
+    folder, name = posixpath.split(partname)
+    try:
+        root = ET.fromstring(zf.read(f"{folder}/_rels/{name}.rels"))
+    except KeyError:
+        return {}
+    
+    rels = {}
+    for rel in root.iter(f"{_NS_PKG_REL}Relationship"):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            path = target.lstrip("/")
+        else:
+            path = posixpath.normpath(posixpath.join(folder, target))
+        rels[rel.get("Id")] = (rel.get("Type", "").rsplit("/", 1)[-1], path)
+    return rels
+
+
+def _lazy_text_frame(sp) -> SimpleNamespace:
+    tx_body = sp.find(f"{_NS_P}txBody")
+    if tx_body is None:
+        return SimpleNamespace(paragraphs=[])
+    
+    paragraphs = []
+    for p in tx_body.findall(f"{_NS_A}p"):
+        ppr = p.find(f"{_NS_A}pPr")
+        runs = []
+        for r in p.findall(f"{_NS_A}r"):
+            rpr = r.find(f"{_NS_A}rPr")
+            sz = rpr.get("sz") if rpr is not None else None
+            font = SimpleNamespace(
+                bold=rpr is not None and rpr.get("b") in ("1", "true"),
+                size=SimpleNamespace(pt=int(sz) / 100) if sz else None,
+            )
+            runs.append(SimpleNamespace(text=r.findtext(f"{_NS_A}t") or "", font=font))
+        level = int(ppr.get("lvl", 0)) if ppr is not None else 0
+        paragraphs.append(SimpleNamespace(runs=runs, level=level))
+    return SimpleNamespace(paragraphs=paragraphs)
+
+
+class _LazyImage:
+    """图片 part：blob 访问时才读取"""
+    
+    def __init__(self, zf: zipfile.ZipFile, partname: str):
+        self._zf = zf
+        self._partname = partname
+        self.filename = posixpath.basename(partname)
+        ext = posixpath.splitext(partname)[1].lstrip('.').lower()
+        self.ext = _IMAGE_EXTS.get(ext, ext)
+    
+    @property
+    def blob(self) -> bytes:
+        return self._zf.read(self._partname)
+    
+    def open(self):
+        """以流的方式读取图片（extract_images_enhanced 优先使用）"""
+        return self._zf.open(self._partname)
+
+
+class _LazyShape:
+    """python-pptx Shape 的最小替身"""
+    
+    def __init__(self, el, zf: zipfile.ZipFile, rels: Dict[str, Tuple[str, str]]):
+        tag = el.tag
+        nv = next((c for c in el if c.tag.startswith(_NS_P + "nv")), None)
+        ph = nv.find(f"{_NS_P}nvPr/{_NS_P}ph") if nv is not None else None
+        
+        self.is_placeholder = ph is not None
+        self.placeholder_format = SimpleNamespace(type=_PH_TYPES.get(ph.get("type", "obj"), 7)) if ph is not None else None
+        self.has_text_frame = tag == f"{_NS_P}sp"
+        self.text_frame = _lazy_text_frame(el) if self.has_text_frame else None
+        self.shapes: List["_LazyShape"] = []
+        self.image = None
+        
+        if ph is not None:
+            self.shape_type = MSO_SHAPE_TYPE.PLACEHOLDER
+        elif tag == f"{_NS_P}pic":
+            self.shape_type = MSO_SHAPE_TYPE.PICTURE
+            blip = el.find(f"{_NS_P}blipFill/{_NS_A}blip")
+            rel = rels.get(blip.get(f"{_NS_R}embed")) if blip is not None else None
+            if rel is not None:
+                self.image = _LazyImage(zf, rel[1])
+        elif tag == f"{_NS_P}grpSp":
+            self.shape_type = MSO_SHAPE_TYPE.GROUP
+            self.shapes = _lazy_shapes(el, zf, rels)
+        else:
+            self.shape_type = None
+        
+        # 位置和尺寸（缺省为 None，与 python-pptx 一致）
+        sp_pr = el.find(f"{_NS_P}grpSpPr" if self.shape_type == MSO_SHAPE_TYPE.GROUP else f"{_NS_P}spPr")
+        xfrm = sp_pr.find(f"{_NS_A}xfrm") if sp_pr is not None else None
+        off = xfrm.find(f"{_NS_A}off") if xfrm is not None else None
+        ext = xfrm.find(f"{_NS_A}ext") if xfrm is not None else None
+        self.left = int(off.get("x")) if off is not None else None
+        self.top = int(off.get("y")) if off is not None else None
+        self.width = int(ext.get("cx")) if ext is not None else None
+        self.height = int(ext.get("cy")) if ext is not None else None
+
+
+def _lazy_shapes(tree, zf: zipfile.ZipFile, rels: Dict[str, Tuple[str, str]]) -> List[_LazyShape]:
+    return [
+        _LazyShape(el, zf, rels) for el in tree
+        if el.tag not in (f"{_NS_P}nvGrpSpPr", f"{_NS_P}grpSpPr", f"{_NS_P}extLst")
+    ]
+
+
+class _LazySlide:
+    """python-pptx Slide 的最小替身"""
+    
+    def __init__(self, zf: zipfile.ZipFile, partname: str, layouts: Dict[str, SimpleNamespace]):
+        root = ET.fromstring(zf.read(partname))
+        rels = _read_rels(zf, partname)
+        sp_tree = root.find(f"{_NS_P}cSld/{_NS_P}spTree")
+        self.shapes = _lazy_shapes(sp_tree, zf, rels) if sp_tree is not None else []
+        
+        by_type = {rel_type: path for rel_type, path in rels.values()}
+        
+        # 布局按 layout part 缓存，多页共用同一个对象（与 python-pptx 一致）
+        layout_part = by_type.get("slideLayout")
+        if layout_part and layout_part not in layouts:
+            layout_root = ET.fromstring(zf.read(layout_part))
+            layouts[layout_part] = SimpleNamespace(name=layout_root.find(f"{_NS_P}cSld").get("name", ""))
+        self.slide_layout = layouts[layout_part] if layout_part else None
+        
+        notes_part = by_type.get("notesSlide")
+        self.has_notes_slide = notes_part is not None
+        self.notes_slide = None
+        if notes_part is not None:
+            notes_root = ET.fromstring(zf.read(notes_part))
+            body = next(
+                (sp for sp in notes_root.iter(f"{_NS_P}sp")
+                 if sp.find(f"{_NS_P}nvSpPr/{_NS_P}nvPr/{_NS_P}ph[@type='body']") is not None),
+                None,
+            )
+            self.notes_slide = SimpleNamespace(
+                notes_text_frame=_lazy_text_frame(body) if body is not None else None
+            )
+
+
+class _LazySlides:
+    def __init__(self, path: Path, partnames: List[str]):
+        self._path = path
+        self._partnames = partnames
+    
+    def __len__(self) -> int:
+        return len(self._partnames)
+    
+    def __iter__(self):
+        # 迭代期间保持 zip 打开，图片 blob 按需读取
+        with zipfile.ZipFile(self._path) as zf:
+            layouts: Dict[str, SimpleNamespace] = {}
+            for partname in self._partnames:
+                yield _LazySlide(zf, partname, layouts)
+
+
+class LazyPresentation:
+    """python-pptx Presentation 的轻量替身：逐页解析，用于大批量转换"""
+    
+    def __init__(self, path: Path):
+        with zipfile.ZipFile(path) as zf:
+            root = ET.fromstring(zf.read("ppt/presentation.xml"))
+            rels = _read_rels(zf, "ppt/presentation.xml")
+        
+        sld_sz = root.find(f"{_NS_P}sldSz")
+        self.slide_width = int(sld_sz.get("cx")) if sld_sz is not None else None
+        self.slide_height = int(sld_sz.get("cy")) if sld_sz is not None else None
+        
+        partnames = [rels[sld_id.get(f"{_NS_R}id")][1] for sld_id in root.iter(f"{_NS_P}sldId")]
+        self.slides = _LazySlides(path, partnames)
+
+
 # =============================================================================
 # Markdown 生成
 # =============================================================================
 
-def generate_marp_header(title: str, total_slides: int, source_file: str) -> str:
+def generate_marp_header(title: str, total_slides: int, source_file: str,
+                         timestamp: Optional[str] = None) -> str:
     """生成增强的 Marp YAML 头部"""
-    timestamp = datetime.now().isoformat()
+    if timestamp is None:
+        timestamp = datetime.now().isoformat()
     return f"""---
 marp: true
 theme: default
@@ -618,15 +1100,94 @@ def generate_slide_markdown(slide_data: SlideData, asset_folder: str) -> str:
     return "\n".join(lines)
 
 
+def slide_meta(sd: SlideData) -> Dict[str, Any]:
+    """单张幻灯片在 _meta.json 中的条目"""
+    return {
+        "index": sd.index,
+        "title": sd.title,
+        "subtitle": sd.subtitle,
+        "type": sd.slide_type.value,
+        "density": sd.content_density.value,
+        "layout": sd.layout_name,
+        "has_notes": bool(sd.speaker_notes),
+        "image_count": len(sd.images),
+        "text_block_count": len(sd.text_blocks),
+        "is_section_start": sd.is_section_start,
+        "section_title": sd.section_title,
+        "key_terms": sd.key_terms,
+        "est_time_sec": sd.estimated_speak_time_sec,
+        "continues_from_previous": sd.continues_from_previous,
+        "continues_to_next": sd.continues_to_next
+    }
+
+
+def _json_indent2(obj: Any) -> bytes:
+    """UTF-8 JSON，缩进 2 格（有 orjson 时用 orjson，输出与 json.dumps 一致）"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def write_meta_json(f, meta: Dict[str, Any], slides) -> None:
+    """
+    流式写出 meta + "slides" 数组：逐条序列化，不构造完整的 slides 列表。
+    f 为二进制文件；输出与 json.dump({**meta, "slides": [...]}, ensure_ascii=False, indent=2) 一致。
+    """
+    head = _json_indent2(meta)
+    f.write(head[:-2] + b',\n  "slides": [' if meta else b'{\n  "slides": [')
+    
+    first = True
+    for item in slides:
+        f.write(b"\n    " if first else b",\n    ")
+        # 字符串里的换行已被转义，这里的 \n 都是缩进换行
+        f.write(_json_indent2(item).replace(b"\n", b"\n    "))
+        first = False
+    
+    f.write(b"]\n}" if first else b"\n  ]\n}")
+
+
 # =============================================================================
 # 主处理函数
 # =============================================================================
 
+class _MappedFile:
+    """mmap 的只读文件视图：zipfile 需要 seekable()，mmap 在 Python 3.13 之前没有"""
+    
+    def __init__(self, mm: mmap.mmap):
+        self.read = mm.read
+        self.seek = mm.seek
+        self.tell = mm.tell
+    
+    def seekable(self) -> bool:
+        return True
+
+
+def open_presentation(pptx_path: Path):
+    """
+    用 mmap 打开 PPTX 交给 python-pptx：zip 目录和各 part 直接从页缓存读取，
+    不再经过 read() 拷贝到用户态缓冲。python-pptx 在打开时就读完所有 part，
+    返回前即可解除映射。
+    """
+    fd = os.open(pptx_path, os.O_RDONLY)
+    try:
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            return Presentation(_MappedFile(mm))
+    finally:
+        os.close(fd)
+
 def process_single_pptx(pptx_path: Path, assets_base_dir: Path, 
-                        verbose: bool = False) -> Tuple[bool, str, Dict[str, Any]]:
+                        verbose: bool = False, lazy: bool = False,
+                        sanitized_stem: Optional[str] = None) -> Tuple[bool, str, Dict[str, Any]]:
     """
     处理单个 PPTX 文件
     
+    lazy: 使用 LazyPresentation 逐页解析（省内存），否则使用 python-pptx
+    sanitized_stem: 输出文件名（.md / _meta.json / 资源子目录），默认由文件名清理得到；
+                    批量处理时由 plan_output_stems() 预先分配以避免重名
+    assets_base_dir / sanitized_stem 需事先存在（见 main()）
+    
     Returns:
         (成功标志, 消息, 统计信息)
     """
@@ -638,19 +1199,22 @@ def process_single_pptx(pptx_path: Path, assets_base_dir: Path,
         "warnings": []
     }
     
+    image_writer = ImageWriter()
     try:
         stem = pptx_path.stem
-        sanitized_stem = sanitize_filename(stem)
+        if sanitized_stem is None:
+            sanitized_stem = sanitize_filename(stem)
         
-        # 创建资源目录
+        # 资源目录（由 main() 在分发任务前统一创建）
         asset_dir = assets_base_dir / sanitized_stem
-        asset_dir.mkdir(parents=True, exist_ok=True)
         
-        # 输出文件
-        md_path = pptx_path.parent / f"{sanitized_stem}.md"
+        # 输出文件（与 PPTX 同目录；不用 with_suffix，文件名里可能本身带 "."）
+        out_dir = pptx_path.parent
+        md_path = out_dir / f"{sanitized_stem}.md"
+        meta_path = out_dir / f"{sanitized_stem}_meta.json"
         
         # 打开 PPT
-        prs = Presentation(str(pptx_path))
+        prs = LazyPresentation(pptx_path) if lazy else open_presentation(pptx_path)
         total_slides = len(prs.slides)
         stats["slides"] = total_slides
         
@@ -660,14 +1224,20 @@ def process_single_pptx(pptx_path: Path, assets_base_dir: Path,
         
         # === 第一遍：提取所有数据 ===
         slides_data: List[SlideData] = []
+        # 密度评估所需的原始数值按列收集，提取结束后一次分级
+        text_lens: List[int] = []
+        item_counts: List[int] = []
         prev_title = None
+        written_images: Dict[str, str] = {}
+        layout_names: Dict[int, Tuple[Any, str]] = {}
         
         for slide_idx, slide in enumerate(prs.slides, start=1):
             # 提取内容
-            images = extract_images_enhanced(slide, slide_idx, asset_dir, slide_width, slide_height)
+            images = extract_images_enhanced(slide, slide_idx, asset_dir, slide_width, slide_height,
+                                             written=written_images, writer=image_writer)
             title, subtitle, text_blocks = extract_text_enhanced(slide)
             notes = extract_speaker_notes(slide)
-            layout_name = get_layout_name(slide)
+            layout_name = get_layout_name(slide, layout_names)
             
             # 统计
             stats["images"] += len(images)
@@ -682,8 +1252,8 @@ def process_single_pptx(pptx_path: Path, assets_base_dir: Path,
             # 检测延续性
             continues_from = is_continuation_title(title) if title else False
             
-            # 构建全文用于分析
-            all_text = " ".join([title or "", subtitle or ""] + [tb.text for tb in text_blocks] + [notes])
+            # 构建全文用于分析（关键词需要整段文本；一次构建列表，不再拼接临时列表）
+            all_text = " ".join([title or "", subtitle or "", *(tb.text for tb in text_blocks), notes])
             
             # 创建数据对象
             slide_data = SlideData(
@@ -695,7 +1265,7 @@ def process_single_pptx(pptx_path: Path, assets_base_dir: Path,
                 images=images,
                 speaker_notes=notes,
                 slide_type=detect_slide_type(title, text_blocks, images, layout_name),
-                content_density=assess_content_density(text_blocks, images),
+                content_density=ContentDensity.NORMAL,  # 后面处理
                 has_animation=False,  # python-pptx 不直接支持动画检测
                 layout_name=layout_name,
                 is_section_start=is_section,
@@ -707,35 +1277,54 @@ def process_single_pptx(pptx_path: Path, assets_base_dir: Path,
             )
             
             slides_data.append(slide_data)
+            text_lens.append(sum(len(tb.text) for tb in text_blocks))
+            item_counts.append(len(text_blocks) + len(images))
             prev_title = title
         
-        # === 第二遍：标记延续关系 ===
+        # 图片写盘与解析重叠进行，这里确认全部写完；写失败的图片从引用它的页面里去掉
+        failed_images = image_writer.wait()
+        if failed_images:
+            bad = {path.name for path, _ in failed_images}
+            for path, e in failed_images:
+                stats["warnings"].append(f"image write failed, skipped: {path.name}: {e}")
+            for i, sd in enumerate(slides_data):
+                kept = [img for img in sd.images if img.filename not in bad]
+                dropped = len(sd.images) - len(kept)
+                if dropped:
+                    stats["images"] -= dropped
+                    item_counts[i] -= dropped
+                    sd.images = kept
+                    sd.slide_type = detect_slide_type(sd.title, sd.text_blocks, kept, sd.layout_name)
+        
+        # === 第二遍：标记延续关系、评估内容密度 ===
         for i in range(len(slides_data) - 1):
             if slides_data[i + 1].continues_from_previous:
                 slides_data[i].continues_to_next = True
         
-        # === 生成 Markdown ===
-        md_content = generate_marp_header(stem, total_slides, pptx_path.name)
+        for sd, density in zip(slides_data, assess_content_density_batch(text_lens, item_counts)):
+            sd.content_density = density
         
-        for i, sd in enumerate(slides_data):
-            md_content += generate_slide_markdown(sd, sanitized_stem)
-            
-            # 幻灯片分隔符
-            if i < len(slides_data) - 1:
-                md_content += "\n\n---\n\n"
-            else:
-                md_content += "\n"
+        # 同一份课件的 Markdown 头部和 _meta.json 共用一个提取时间
+        extracted_at = datetime.now().isoformat()
         
-        # 写入文件
-        with open(md_path, 'w', encoding='utf-8') as f:
-            f.write(md_content)
+        # === 生成 Markdown（逐页写出，不在内存里拼整篇文档）===
+        with open(md_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            f.write(generate_marp_header(stem, total_slides, pptx_path.name, extracted_at))
+            
+            for i, sd in enumerate(slides_data):
+                f.write(generate_slide_markdown(sd, sanitized_stem))
+                
+                # 幻灯片分隔符
+                if i < len(slides_data) - 1:
+                    f.write("\n\n---\n\n")
+                else:
+                    f.write("\n")
         
         # === 生成配套的 JSON 元数据（方便程序化处理）===
-        meta_path = pptx_path.parent / f"{sanitized_stem}_meta.json"
         meta = {
             "source": pptx_path.name,
             "output": md_path.name,
-            "extracted_at": datetime.now().isoformat(),
+            "extracted_at": extracted_at,
             "stats": stats,
             "structure": {
                 "total_slides": total_slides,
@@ -744,29 +1333,9 @@ def process_single_pptx(pptx_path: Path, assets_base_dir: Path,
                     for sd in slides_data if sd.is_section_start
                 ]
             },
-            "slides": [
-                {
-                    "index": sd.index,
-                    "title": sd.title,
-                    "subtitle": sd.subtitle,
-                    "type": sd.slide_type.value,
-                    "density": sd.content_density.value,
-                    "layout": sd.layout_name,
-                    "has_notes": bool(sd.speaker_notes),
-                    "image_count": len(sd.images),
-                    "text_block_count": len(sd.text_blocks),
-                    "is_section_start": sd.is_section_start,
-                    "section_title": sd.section_title,
-                    "key_terms": sd.key_terms,
-                    "est_time_sec": sd.estimated_speak_time_sec,
-                    "continues_from_previous": sd.continues_from_previous,
-                    "continues_to_next": sd.continues_to_next
-                }
-                for sd in slides_data
-            ]
         }
-        with open(meta_path, 'w', encoding='utf-8') as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
+        with open(meta_path, 'wb', buffering=1 << 20) as f:
+            write_meta_json(f, meta, (slide_meta(sd) for sd in slides_data))
         
         msg = f"✓ {total_slides} slides, {stats['images']} imgs, {stats['notes_count']} notes, {stats['sections']} sections"
         return True, msg, stats
@@ -774,6 +1343,26 @@ def process_single_pptx(pptx_path: Path, assets_base_dir: Path,
     except Exception as e:
         stats["warnings"].append(str(e))
         return False, f"✗ Error: {str(e)}", stats
+    finally:
+        image_writer.close()
+
+
+def plan_output_stems(pptx_files: List[Path]) -> List[Tuple[Path, str]]:
+    """
+    为每个 PPTX 分配输出文件名：清理后重名的（如 "foo bar" 与 "foo_bar"）依次加 _1、_2 ...，
+    避免并行处理时写到同一个 .md 和资源目录
+    """
+    used = set()
+    plan = []
+    for pptx_path in pptx_files:
+        base = out_stem = sanitize_filename(pptx_path.stem)
+        n = 1
+        while out_stem in used:
+            out_stem = f"{base}_{n}"
+            n += 1
+        used.add(out_stem)
+        plan.append((pptx_path, out_stem))
+    return plan
 
 
 def main():
@@ -785,6 +1374,9 @@ def main():
     )
     parser.add_argument("--verbose", "-v", action="store_true", help="显示详细输出")
     parser.add_argument("--output-dir", "-o", type=str, help="指定输出目录（默认为当前目录）")
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="并行进程数（默认 CPU 核数，1 为串行）")
+    parser.add_argument("--threads", action="store_true", help="用线程池代替进程池（lxml 解析释放 GIL 时更省开销）")
+    parser.add_argument("--lazy", action="store_true", help="逐页解析 XML（省内存，适合大批量；默认使用 python-pptx）")
     args = parser.parse_args()
     
     print()
@@ -818,6 +1410,10 @@ def main():
     # 创建 assets 目录
     assets_dir = current_dir / "assets"
     assets_dir.mkdir(exist_ok=True)
+    # 输出名在分发前统一分配（清理后重名的加序号），资源子目录一次建好，worker 里不再逐个 mkdir
+    out_stems = dict(plan_output_stems(pptx_files))
+    for out_stem in out_stems.values():
+        (assets_dir / out_stem).mkdir(exist_ok=True)
     
     # 处理统计
     results = {
@@ -832,25 +1428,43 @@ def main():
     print("Processing...")
     print("─" * 60)
     
-    for idx, pptx_file in enumerate(pptx_files, start=1):
-        prefix = f"[{idx:2d}/{len(pptx_files)}]"
-        print(f"{prefix} {pptx_file.name}")
-        
-        success, message, stats = process_single_pptx(pptx_file, assets_dir, args.verbose)
-        
-        print(f"       {message}")
-        
-        if success:
-            results["success"] += 1
-            results["total_slides"] += stats["slides"]
-            results["total_images"] += stats["images"]
-            results["total_notes"] += stats["notes_count"]
+    # 每个文件相互独立：多进程并行（绕过 GIL），按完成顺序实时输出
+    jobs = min(args.jobs or os.cpu_count() or 1, len(pptx_files))
+    pool_cls = ThreadPoolExecutor if args.threads else ProcessPoolExecutor
+    executor = pool_cls(max_workers=jobs) if jobs > 1 else None
+    try:
+        if executor:
+            futures = {
+                executor.submit(process_single_pptx, f, assets_dir, args.verbose, args.lazy, out_stems[f]): f
+                for f in pptx_files
+            }
+            outcomes = ((futures[fut], fut.result()) for fut in as_completed(futures))
         else:
-            results["failed"] += 1
+            outcomes = ((f, process_single_pptx(f, assets_dir, args.verbose, args.lazy, out_stems[f]))
+                        for f in pptx_files)
+        
+        for idx, (pptx_file, outcome) in enumerate(outcomes, start=1):
+            prefix = f"[{idx:2d}/{len(pptx_files)}]"
+            print(f"{prefix} {pptx_file.name}")
+            
+            success, message, stats = outcome
+            
+            print(f"       {message}")
+            
+            if success:
+                results["success"] += 1
+                results["total_slides"] += stats["slides"]
+                results["total_images"] += stats["images"]
+                results["total_notes"] += stats["notes_count"]
+            else:
+                results["failed"] += 1
         
-        if args.verbose and stats.get("warnings"):
-            for warn in stats["warnings"]:
-                print(f"       ⚠️  {warn}")
+            if args.verbose and stats.get("warnings"):
+                for warn in stats["warnings"]:
+                    print(f"       ⚠️  {warn}")
+    finally:
+        if executor:
+            executor.shutdown()
     
     # 最终报告
     print()
@@ -46,10 +46,22 @@ class Settings:
 
         # ---- TTS backend ----
         self.TTS_BACKEND = (os.getenv("TTS_BACKEND", "edge") or "edge").strip().lower()
+        # 同时合成的段落数（按段落顺序发送，当前段播放时后面几段已在合成）
+        self.TTS_CONCURRENCY = _int_env("TTS_CONCURRENCY", 3) or 3
 
         # ---- Piper common ----
         self.PIPER_USE_CUDA = _bool_env("PIPER_USE_CUDA", "0")
         self.PIPER_TARGET_SAMPLE_RATE = _int_env("PIPER_TARGET_SAMPLE_RATE", None)  # e.g. 16000
+        # 整个进程同时跑 Piper 推理的上限（所有会话、中英文音色共用；ONNX Runtime 多了会抢 CPU 线程）
+        self.PIPER_CONCURRENCY = _int_env("PIPER_CONCURRENCY", 2) or 2
+        # 合成结果 LRU 缓存的条数（问候语、固定提示语等重复文本直接回放 PCM）；0 关闭
+        self.PIPER_CACHE_N = _int_env("PIPER_CACHE_N", 128)
+        # 每个 Piper 推理 session 的 ONNX Runtime 线程数；不设时取 min(4, CPU 核数)
+        self.PIPER_INTRA_OP = _int_env("PIPER_INTRA_OP", None)
+        # Piper 输出音量增益（1.0 不处理；>1 放大，超出 int16 的部分饱和截断）
+        self.PIPER_GAIN = float(os.getenv("PIPER_GAIN") or 1.0)
+        # Piper 日志级别：DEBUG 打印每个请求的分块进度；生产环境可设 WARNING
+        self.PIPER_LOG_LEVEL = (os.getenv("PIPER_LOG_LEVEL") or "INFO").strip().upper()
 
         # ---- Piper ZH ----
         # 兼容老变量：如果没写 *_ZH，就回落到 PIPER_MODEL_PATH / PIPER_CONFIG_PATH
@@ -3,12 +3,15 @@ import asyncio
 import uuid
 from datetime import datetime, date
 
+_utcnow = datetime.utcnow
+_utcfromtimestamp = datetime.utcfromtimestamp
+
 def _utc_iso(ts: float | None = None) -> str:
     # ISO8601 with Z suffix
-    dt = datetime.utcnow() if ts is None else datetime.utcfromtimestamp(ts)
+    dt = _utcnow() if ts is None else _utcfromtimestamp(ts)
     return dt.isoformat(timespec="milliseconds") + "Z"
 
-@dataclass
+@dataclass(slots=True)
 class TurnMetrics:
     session_id: str
     turn_id: int
@@ -42,7 +45,7 @@ class TurnMetrics:
             "err": self.err_repr,
         }
 
-@dataclass
+@dataclass(slots=True)
 class SessionState:
     turn_id: int = 0
     workflow_task: asyncio.Task | None = None
@@ -1,10 +1,28 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from routers.health import router as health_router
-from routers.ws import router as ws_router
+from routers.ws import router as ws_router, flush_metrics, init_models, warmup_tts
+from config import settings
+from utils.log_queue import start_queue_logging
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Piper 生产者线程里的日志只入队，后台线程负责格式化输出
+    piper_log = start_queue_logging("piper_tts", settings.PIPER_LOG_LEVEL, fmt="[PiperTTS] %(message)s")
+    # 模型只在这里加载一次；首次推理的冷启动也放在启动阶段，而不是用户第一轮
+    init_models()
+    await warmup_tts()
+    yield
+    # 退出前把还在攒批的 metrics 写盘
+    await flush_metrics()
+    piper_log.stop()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,3 +34,17 @@ app.add_middleware(
 
 app.include_router(health_router)
 app.include_router(ws_router)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # 装了 uvloop（Linux/macOS）就用它跑事件循环；Windows 上没有 uvloop，退回默认 asyncio
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+
+    # 音频帧（PCM）几乎压不动，permessage-deflate 只会白白消耗 CPU
+    uvicorn.run(app, host="127.0.0.1", port=8000, loop=loop, ws_per_message_deflate=False)
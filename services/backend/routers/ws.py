@@ -1,10 +1,18 @@
 # services/backend/routers/ws.py
-import asyncio, json, uuid, os
+import asyncio, json, uuid, os, re, struct
+from collections import deque
 from pathlib import Path
 from datetime import date
 import time
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 import traceback
+try:
+    import orjson  # 可选：C 实现的 JSON 序列化，直接输出 UTF-8 bytes
+except ImportError:
+    orjson = None  # type: ignore
+
+# 收包解析走 orjson（其 JSONDecodeError 是 json.JSONDecodeError 的子类，异常处理不变）
+_json_loads = orjson.loads if orjson is not None else json.loads
 
 from core.session import TurnMetrics, SessionState
 
@@ -28,42 +36,381 @@ SERVER_INSTANCE_ID = settings.SERVER_INSTANCE_ID or uuid.uuid4().hex
 LOG_DIR: Path = settings.LOG_DIR
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
-def _metrics_path() -> Path:
-    return LOG_DIR / f"metrics_{date.today().isoformat()}.jsonl"
-
-def _append_line(path: Path, line: str):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+def _metrics_path(day: date) -> Path:
+    return LOG_DIR / f"metrics_{day.isoformat()}.jsonl"
+
+# 当天的 O_APPEND fd 只打开一次，跨天时关闭旧的再打开新文件；只有 writer task 会用到
+_metrics_fd: tuple[date, int] | None = None
+
+def _metrics_fd_today() -> int:
+    global _metrics_fd
+    today = date.today()
+    if _metrics_fd is not None:
+        fd_date, fd = _metrics_fd
+        if fd_date == today:
+            return fd
+        _metrics_fd = None
+        os.close(fd)
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    fd = os.open(_metrics_path(today), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    _metrics_fd = (today, fd)
+    return fd
+
+# 攒批：第一条到达后最多再等 METRICS_FLUSH_INTERVAL 秒或攒够 METRICS_BATCH_MAX 条再写；
+# fsync 不逐批做，距上次超过 METRICS_FSYNC_INTERVAL 秒才做一次
+METRICS_FLUSH_INTERVAL = 0.1
+METRICS_BATCH_MAX = 64
+METRICS_FSYNC_INTERVAL = 5.0
+_metrics_last_fsync = 0.0
+
+def _append_records(records: list[dict]):
+    # O_APPEND 下一次 os.write 即一次系统调用，不经过 Python io 缓冲
+    global _metrics_last_fsync
+    if orjson is not None:
+        data = b"".join(orjson.dumps(r) + b"\n" for r in records)
+    else:
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    fd = _metrics_fd_today()
+    os.write(fd, data)
+    now = time.monotonic()
+    if now - _metrics_last_fsync >= METRICS_FSYNC_INTERVAL:
+        os.fsync(fd)
+        _metrics_last_fsync = now
+
+# 单个后台 writer：批量写入（一次 os.write），序列化也放在线程里；None 是 flush_metrics 的结束标记
+_METRICS_Q: asyncio.Queue[dict | None] = asyncio.Queue()
+_metrics_writer_task: asyncio.Task | None = None
+
+async def _metrics_writer():
+    loop = asyncio.get_running_loop()
+    getter: asyncio.Future | None = None
+    while True:
+        item = await (getter or _METRICS_Q.get())
+        getter = None
+        deadline = loop.time() + METRICS_FLUSH_INTERVAL
+        records: list[dict] = []
+        while item is not None:
+            records.append(item)
+            if len(records) >= METRICS_BATCH_MAX:
+                break
+            try:
+                item = _METRICS_Q.get_nowait()
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            # 超时不取消 getter，下一轮接着等，避免取消时丢记录
+            getter = asyncio.ensure_future(_METRICS_Q.get())
+            done, _ = await asyncio.wait((getter,), timeout=timeout)
+            if not done:
+                break
+            item = getter.result()
+            getter = None
+        if records:
+            try:
+                await asyncio.to_thread(_append_records, records)
+            except Exception:
+                pass
+        if item is None:
+            return
 
 async def append_metrics(record: dict):
+    global _metrics_writer_task
     try:
-        line = json.dumps(record, ensure_ascii=False)
-        await asyncio.to_thread(_append_line, _metrics_path(), line)
+        if _metrics_writer_task is None or _metrics_writer_task.done():
+            _metrics_writer_task = asyncio.create_task(_metrics_writer())
+        _METRICS_Q.put_nowait(record)
     except Exception:
         pass
 
+async def flush_metrics():
+    """进程退出时调用：让 writer 写完队列里剩下的记录后退出，再 fsync、关闭文件。"""
+    global _metrics_writer_task, _metrics_fd
+    if _metrics_writer_task is not None and not _metrics_writer_task.done():
+        _METRICS_Q.put_nowait(None)
+        try:
+            await _metrics_writer_task
+        except Exception:
+            pass
+    _metrics_writer_task = None
+    if _metrics_fd is not None:
+        _, fd = _metrics_fd
+        _metrics_fd = None
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+# ------------------------
+# Segmentation
+# ------------------------
+# 句末标点：一次 C 层扫描找到最早的切分点（替代逐个标点 str.find）
+END_PUNCT_RE = re.compile(r"[。！？.!?]")
+
+# 送 TTS 前删掉的字符：markdown 标记 + 控制字符（保留 \t \n \r）；str.translate 一次 C 层遍历
+_TTS_CLEAN = str.maketrans("", "", "*_`~#>|" + "".join(map(chr, (*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F))))
+
+class TextSegmenter:
+    """
+    LLM 流式文本 -> TTS 段落的增量切分器。
+    delta 先攒在 list 里；记录已扫描过（且没有可切标点）的位置，
+    每次只扫描新增的部分；新 delta 里没有句末标点且未到 max_chars 时
+    连 join 都省掉，整体 O(N)。
+
+    切分规则（min = 当前段的最小长度，首段 first_min，之后每段翻倍直到 min_chars）：
+    1) len < soft_min(=min(soft_min_chars, min)): 不切
+    2) 如果在 min-1 之后出现句末标点：切（自然）
+    3) 否则如果在 soft_min-1 之后出现句末标点 且 < min：允许早切（解决短英文）
+    4) 否则 len >= max_chars：硬切
+    5) 否则不切
+    """
+
+    def __init__(self, *, first_min: int, min_chars: int, soft_min_chars: int, max_chars: int):
+        self.min_chars = min_chars
+        self.soft_min_chars = soft_min_chars
+        self.max_chars = max_chars
+        self.cur_min = first_min
+        self._parts: list[str] = []
+        self._len = 0
+        # [soft_min-1, _scanned) 区间内已确认没有句末标点
+        self._scanned = 0
+        # 上次扫描之后 push 进来的内容里有句末标点
+        self._new_punct = False
+
+    def push(self, delta: str):
+        self._parts.append(delta)
+        self._len += len(delta)
+        if not self._new_punct and END_PUNCT_RE.search(delta):
+            self._new_punct = True
+
+    def _find_cut(self, buf: str, pos: int, scanned: int) -> int:
+        """buf[pos:] 按当前 cur_min 找切分点（绝对下标），没有返回 -1"""
+        min_chars = self.cur_min
+        soft_min = min(self.soft_min_chars, min_chars)
+        n = len(buf) - pos
+        if n < soft_min:
+            return -1
+
+        # prefer natural cut at/after MIN
+        m = END_PUNCT_RE.search(buf, pos + max(min_chars - 1, scanned)) if n >= min_chars else None
+        if m is None:
+            # early cut for short answers (SOFT..MIN-1)
+            m = END_PUNCT_RE.search(buf, pos + max(soft_min - 1, scanned))
+            if m is not None and m.end() - pos >= min_chars:
+                m = None
+
+        if m is not None:
+            return m.end()
+        if n >= self.max_chars:
+            return pos + self.max_chars
+        return -1
+
+    def pop(self) -> str | None:
+        if self._len < min(self.soft_min_chars, self.cur_min):
+            return None
+        # 已扫描部分没有切分点，新增部分又没有标点：只可能是硬切
+        if self._scanned and not self._new_punct and self._len < self.max_chars:
+            return None
+
+        self._new_punct = False
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        buf = self._parts[0]
+
+        cut = self._find_cut(buf, 0, self._scanned)
+        if cut < 0:
+            self._scanned = self._len
+            return None
+
+        rest = buf[cut:]
+        self._parts = [rest] if rest else []
+        self._len = len(rest)
+        self._scanned = 0
+        self.cur_min = min(self.cur_min * 2, self.min_chars)
+        return buf[:cut]
+
+    def split_all(self, text: str) -> list[str]:
+        """
+        一次性切分完整文本（非流式）：只移动下标、不复制剩余部分，
+        返回所有完整段；剩余部分留在缓冲里，由 flush() 取出。
+        """
+        self.push(text)
+        buf = self.flush()
+        segs: list[str] = []
+        pos = 0
+        while (cut := self._find_cut(buf, pos, 0)) >= 0:
+            segs.append(buf[pos:cut])
+            pos = cut
+            self.cur_min = min(self.cur_min * 2, self.min_chars)
+        self.push(buf[pos:])
+        return segs
+
+    def flush(self) -> str:
+        tail = "".join(self._parts)
+        self._parts = []
+        self._len = 0
+        self._scanned = 0
+        self._new_punct = False
+        return tail
+
+# ------------------------
+# llm_worker -> tts_worker 段落队列
+# ------------------------
+class _SPSCQueue:
+    """
+    单生产者/单消费者的有界队列，接口与 asyncio.Queue 用到的部分一致。
+    deque 存数据，两端各最多一个等待者，用一个 Future 唤醒即可，
+    省去 asyncio.Queue 的 getters/putters 列表和 unfinished_tasks 计数。
+    """
+
+    def __init__(self, maxsize: int = 0):
+        self._dq: deque = deque()
+        self._maxsize = maxsize
+        self._getter: asyncio.Future | None = None
+        self._putter: asyncio.Future | None = None
+
+    @staticmethod
+    def _wake(fut: asyncio.Future | None):
+        if fut is not None and not fut.done():
+            fut.set_result(None)
+
+    def empty(self) -> bool:
+        return not self._dq
+
+    def full(self) -> bool:
+        return 0 < self._maxsize <= len(self._dq)
+
+    def put_nowait(self, item):
+        if self.full():
+            raise asyncio.QueueFull
+        self._dq.append(item)
+        self._wake(self._getter)
+
+    async def put(self, item):
+        while self.full():
+            self._putter = asyncio.get_running_loop().create_future()
+            await self._putter
+        self.put_nowait(item)
+
+    def get_nowait(self):
+        if not self._dq:
+            raise asyncio.QueueEmpty
+        item = self._dq.popleft()
+        self._wake(self._putter)
+        return item
+
+    async def get(self):
+        while not self._dq:
+            self._getter = asyncio.get_running_loop().create_future()
+            await self._getter
+        return self.get_nowait()
+
 # ------------------------
 # WebSocket send helpers
 # ------------------------
-async def send_json(ws: WebSocket, lock: asyncio.Lock, payload: dict):
-    async with lock:
-        await ws.send_json(payload)
+_SEND_KINDS = {"b": "bytes", "j": "json", "t": "text"}
+
+class WSOutbox:
+    """
+    单连接的发送队列：生产方 append 到 deque 后唤醒 writer（不抢锁、不等待），
+    由唯一的 writer 协程一次取空、按入队顺序调用 ws.send_*。
+    发送失败后 closed=True，之后的消息直接丢弃。
+    """
+
+    def __init__(self, ws: WebSocket):
+        self._ws = ws
+        self._dq: deque[tuple[str, dict | bytes | str, str]] = deque()
+        self._waiter: asyncio.Future | None = None
+        self.closed = False
+        self._task = asyncio.create_task(self._writer())
+
+    def _put(self, item: tuple[str, dict | bytes | str, str]):
+        if self.closed:
+            return
+        self._dq.append(item)
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
 
-async def safe_send_json(ws: WebSocket, lock: asyncio.Lock, payload: dict):
-    try:
-        await asyncio.shield(send_json(ws, lock, payload))
-    except Exception:
-        pass
+    def put_json(self, payload: dict):
+        self._put(("j", payload, ""))
 
-async def safe_send_bytes(ws: WebSocket, lock: asyncio.Lock, payload: bytes, *, tag: str = "") -> bool:
-    try:
-        async with lock:
-            await ws.send_bytes(payload)
-        return True
-    except Exception as e:
-        print(f"[ws] send_bytes failed {tag}: {type(e).__name__}: {e}")
+    def put_bytes(self, payload: bytes, tag: str = ""):
+        self._put(("b", payload, tag))
+
+    def put_text(self, payload: str):
+        # 已经序列化好的 JSON 文本
+        self._put(("t", payload, ""))
+
+    async def _writer(self):
+        ws = self._ws
+        dq = self._dq
+        loop = asyncio.get_running_loop()
+        while True:
+            if not dq:
+                self._waiter = loop.create_future()
+                await self._waiter
+                self._waiter = None
+            while dq:
+                kind, payload, tag = dq.popleft()
+                try:
+                    if kind == "b":
+                        await ws.send_bytes(payload)
+                    elif kind == "t":
+                        await ws.send_text(payload)
+                    elif orjson is not None:
+                        # 仍以文本帧发送（前端按 text JSON 解析）
+                        await ws.send_text(orjson.dumps(payload).decode())
+                    else:
+                        await ws.send_json(payload)
+                except Exception as e:
+                    print(f"[ws] send_{_SEND_KINDS[kind]} failed {tag}: {type(e).__name__}: {e}")
+                    self.closed = True
+                    dq.clear()
+                    return
+
+    def close(self):
+        self.closed = True
+        if not self._task.done():
+            self._task.cancel()
+
+# 二进制音频帧头：b"AUD0" + u32le turn_id + u32le seq，然后 payload
+# 合并帧：b"AUD1" + u32le turn_id + u32le count，然后 count 个 (u32le seq, u32le len, payload)
+# 两种帧头布局相同，一个预编译的 Struct 一次 C 调用打包
+_AUD_HDR = struct.Struct("<4sII")
+_AUD1_ITEM = struct.Struct("<II")
+
+def _pack_audio_frame(turn_id: int, seq: int, chunk: bytes) -> bytes:
+    return _AUD_HDR.pack(b"AUD0", turn_id, seq) + chunk
+
+def _pack_audio_frames(turn_id: int, first_seq: int, chunks: list[bytes]) -> bytes:
+    parts = [_AUD_HDR.pack(b"AUD1", turn_id, len(chunks))]
+    for seq, chunk in enumerate(chunks, first_seq):
+        parts.append(_AUD1_ITEM.pack(seq, len(chunk)))
+        parts.append(chunk)
+    return b"".join(parts)
+
+def send_json(out: WSOutbox, payload: dict):
+    out.put_json(payload)
+
+def send_text(out: WSOutbox, text: str):
+    out.put_text(text)
+
+def _json_str(value) -> str:
+    return orjson.dumps(value).decode() if orjson is not None else json.dumps(value, ensure_ascii=False)
+
+# 结构固定的控制消息直接拼 JSON 文本，不建 dict、不走序列化
+# （state 只取 thinking/speaking/idle，无需转义）
+def _state_text(turn_id: int, state: str) -> str:
+    return f'{{"type":"state_update","turn_id":{turn_id},"state":"{state}"}}'
+
+def safe_send_bytes(out: WSOutbox, payload: bytes, *, tag: str = "") -> bool:
+    if out.closed:
         return False
+    out.put_bytes(payload, tag)
+    return True
 
 # ------------------------
 # TTS selection (zh/en)
@@ -77,6 +424,10 @@ def _make_piper(model_path: Path, cfg_path: Path | None, *, target_sr: int | Non
         config_path=str(cfg_path) if cfg_path else None,
         use_cuda=bool(settings.PIPER_USE_CUDA),
         target_sample_rate=target_sr,
+        max_concurrency=settings.PIPER_CONCURRENCY,
+        cache_size=settings.PIPER_CACHE_N,
+        intra_op_threads=settings.PIPER_INTRA_OP,
+        gain=settings.PIPER_GAIN,
     )
 
 def _make_tts_pair():
@@ -112,7 +463,51 @@ def _make_tts_pair():
 
     return tts_zh, tts_en
 
-tts_zh, tts_en = _make_tts_pair()
+# 由 init_models() 在启动时赋值
+tts_zh = tts_en = None
+
+async def warmup_tts():
+    """
+    启动时让本地 TTS 各合成一句很短的话：ONNX Runtime 的图优化、CUDA 内核编译、
+    内存池分配都发生在第一次推理，不预热就会落在用户第一轮的首包音频上。
+    Edge 走网络，没有本地冷启动，跳过。
+    """
+    seen: set[int] = set()
+    for tts, text in ((tts_zh, "你好。"), (tts_en, "Hello.")):
+        if isinstance(tts, EdgeTTS) or id(tts) in seen:
+            continue
+        seen.add(id(tts))
+        t0 = time.perf_counter()
+        warmup = getattr(tts, "warmup", None)
+        if warmup is not None:
+            # PiperTTS：直接在线程里完整合成一句，不写合成缓存、不占推理槽位
+            try:
+                await asyncio.to_thread(warmup, text)
+                print(f"[TTS] warmup {type(tts).__name__} done in {(time.perf_counter() - t0) * 1000:.0f} ms")
+            except Exception as e:
+                print(f"[TTS] warmup failed: {type(e).__name__}: {e}")
+            continue
+        agen = tts.stream(text)
+        try:
+            await anext(agen, None)
+            print(f"[TTS] warmup {type(tts).__name__} done in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        except Exception as e:
+            print(f"[TTS] warmup failed: {type(e).__name__}: {e}")
+        finally:
+            await agen.aclose()
+
+def _audio_meta(tts) -> dict:
+    return {
+        "mime": getattr(tts, "mime_type", "audio/L16"),
+        "format": getattr(tts, "format", "pcm_s16le"),
+        "sample_rate": getattr(tts, "sample_rate", 16000),
+        "channels": getattr(tts, "channels", 1),
+    }
+
+# audio_begin 的元信息在 TTS 初始化后就固定了，按实例缓存（init_models 填充）
+TTS_META: dict[int, dict] = {}
+# 同一份元信息的 JSON 片段（不含花括号），audio_begin 直接拼接
+TTS_META_JSON: dict[int, str] = {}
 
 def _lang_score(sample: str) -> tuple[int, int]:
     # cheap heuristic: count CJK vs Latin letters
@@ -133,14 +528,30 @@ def _pick_tts_by_sample(sample: str):
 # ------------------------
 # LLM
 # ------------------------
-llm = CRAGAgentLLM(method=os.getenv("CRAG_AGENT_METHOD", "no_retrieval"))
-# llm = HFLocalLLM(model_dir=settings.LLM_MODEL_DIR)
+llm = None
+
+def init_models():
+    """
+    加载 TTS / LLM 模型，由 main.py 的 lifespan 在启动时调用一次（重复调用直接返回）。
+    放在 import 之外：只 import 本模块（工具脚本、reload 检查）不会触发 ONNX / HF 权重加载。
+    """
+    global tts_zh, tts_en, llm
+    if llm is not None:
+        return
+
+    tts_zh, tts_en = _make_tts_pair()
+    for t in (tts_zh, tts_en):
+        meta = _audio_meta(t)
+        TTS_META[id(t)] = meta
+        TTS_META_JSON[id(t)] = json.dumps(meta, separators=(",", ":"))[1:-1]
+
+    llm = CRAGAgentLLM(method=os.getenv("CRAG_AGENT_METHOD", "no_retrieval"))
+    # llm = HFLocalLLM(model_dir=settings.LLM_MODEL_DIR)
 # ------------------------
 # Strong interrupt helper
 # ------------------------
 async def cancel_workflow(
-    ws: WebSocket,
-    lock: asyncio.Lock,
+    out: WSOutbox,
     state: SessionState,
     old_turn: int,
     *,
@@ -174,14 +585,13 @@ async def cancel_workflow(
 
     if send_audio_cancel:
         print("SEND audio_cancel", old_turn, "reason=", reason)
-        await safe_send_json(ws, lock, {"type": "audio_cancel", "turn_id": old_turn})
+        send_json(out, {"type": "audio_cancel", "turn_id": old_turn})
 
 # ------------------------
 # Main workflow: LLM streaming + segmented TTS
 # ------------------------
 async def run_turn_workflow(
-    ws: WebSocket,
-    lock: asyncio.Lock,
+    out: WSOutbox,
     state: SessionState,
     turn_id: int,
     user_text: str,
@@ -191,114 +601,168 @@ async def run_turn_workflow(
     # segmentation
     MIN_CHARS = 70
     SOFT_MIN_CHARS = 30
+    # 首段用更小的 MIN 尽早出声（降低首包音频延迟），之后每段翻倍直到 MIN_CHARS
+    FIRST_MIN_CHARS = 20
     MAX_CHARS = 260
-    END_PUNCTS = set("。！？.!?")
+    # 小音频块合并成一帧发送：攒够 AUDIO_COALESCE_BYTES，或下一块 AUDIO_COALESCE_WAIT 秒内没到就先发
+    AUDIO_COALESCE_BYTES = 32 * 1024
+    AUDIO_COALESCE_WAIT = 0.005
+    # TTS 比 LLM 慢时最多积压几段（背压，防止取消后还在合成旧段落）
+    TTS_QUEUE_MAX = 4
 
     # auto tts selection
     AUTO_LANG = bool(settings.TTS_AUTO_LANG)
     DECIDE_CHARS = int(settings.TTS_LANG_DECIDE_CHARS or 120)
 
-    def _is_cancelled() -> bool:
-        return cancel_event.is_set() or (turn_id != state.turn_id)
-
-    def _find_boundary(buf: str, start: int) -> int:
-        # earliest end punct index at/after start
-        best = -1
-        for p in END_PUNCTS:
-            i = buf.find(p, start)
-            if i != -1 and (best == -1 or i < best):
-                best = i
-        return best
-
-    def _pop_segment(buf: str) -> tuple[str | None, str]:
-        """
-        更自然的版本：
-        1) len < SOFT_MIN: 不切
-        2) 如果在 MIN-1 之后出现句末标点：切（自然）
-        3) 否则如果在 SOFT_MIN-1 之后出现句末标点 且 < MIN：允许早切（解决短英文）
-        4) 否则 len >= MAX：硬切
-        5) 否则不切
-        """
-        n = len(buf)
-        if n < SOFT_MIN_CHARS:
-            return None, buf
-
-        # prefer natural cut at/after MIN
-        idx = _find_boundary(buf, MIN_CHARS - 1) if n >= MIN_CHARS else -1
-        if idx != -1:
-            cut = idx + 1
-            return buf[:cut], buf[cut:]
-
-        # early cut for short answers (SOFT..MIN-1)
-        idx2 = _find_boundary(buf, SOFT_MIN_CHARS - 1)
-        if idx2 != -1 and (idx2 + 1) >= SOFT_MIN_CHARS and (idx2 + 1) < MIN_CHARS:
-            cut = idx2 + 1
-            return buf[:cut], buf[cut:]
+    # 两个 worker 的内层循环每个 delta / chunk 都会检查，is_set 提前绑定
+    _ev_is_set = cancel_event.is_set
 
-        if n >= MAX_CHARS:
-            return buf[:MAX_CHARS], buf[MAX_CHARS:]
-
-        return None, buf
+    def _is_cancelled() -> bool:
+        return _ev_is_set() or (turn_id != state.turn_id)
 
-    tts_queue: asyncio.Queue[tuple[int, str] | None] = asyncio.Queue()
+    tts_queue = _SPSCQueue(maxsize=TTS_QUEUE_MAX)  # items: (seg_id, text) | None
     tts_seq = 0
     audio_started = False
 
     chosen_tts = tts_zh  # default
     decided = False
     decided_event = asyncio.Event()
-    sample_buf = ""
+    # 语言判定样本：delta 先攒在 list 里，真正需要判定时才 join 一次
+    sample_parts: list[str] = []
+    sample_len = 0
+    # 样本里的 CJK / 拉丁字母计数，随 delta 增量累加
+    sample_cjk = 0
+    sample_lat = 0
+
+    async def _synth_tts(stream_fn, text: str, chunks: _SPSCQueue):
+        # 合成结果逐块放进 chunks，None 表示结束（出错也会放 None，由发送方 await 任务取异常）
+        agen = stream_fn(text)
+        try:
+            async for chunk in agen:
+                chunks.put_nowait(chunk)
+        finally:
+            chunks.put_nowait(None)
+            await agen.aclose()
+
+    async def _feed_tts(order: _SPSCQueue, slots: asyncio.Semaphore, stream_fn):
+        # 按 seg_id 顺序启动合成任务；slots 限制“合成中 + 等待发送”的段落总数，
+        # 满了就不再从 tts_queue 取，背压照旧传回 llm_worker
+        try:
+            while True:
+                await slots.acquire()
+                while True:
+                    item = await tts_queue.get()
+                    if item is None:
+                        return
+                    seg_text = item[1].translate(_TTS_CLEAN)
+                    if seg_text.strip():
+                        break
+                if _is_cancelled():
+                    return
+                chunks = _SPSCQueue()
+                order.put_nowait((asyncio.create_task(_synth_tts(stream_fn, seg_text, chunks)), chunks))
+        finally:
+            order.put_nowait(None)
 
     async def tts_worker():
         nonlocal tts_seq, audio_started
+        order = _SPSCQueue()  # items: (synth_task, chunks) | None，按 seg_id 顺序
+        slots = asyncio.Semaphore(max(1, int(settings.TTS_CONCURRENCY)))
+        feeder: asyncio.Task | None = None
+        synth: asyncio.Task | None = None
+        next_chunk: asyncio.Future | None = None
+        pending: list[bytes] = []
+        pending_bytes = 0
+
+        def _send_audio() -> bool:
+            # 单块仍用 AUD0，多块打包成 AUD1；失败则取消本轮
+            nonlocal tts_seq, pending, pending_bytes
+            if not pending:
+                return True
+            if len(pending) == 1:
+                frame = _pack_audio_frame(turn_id, tts_seq, pending[0])
+            else:
+                frame = _pack_audio_frames(turn_id, tts_seq, pending)
+            if not safe_send_bytes(out, frame, tag=f"turn={turn_id} seq={tts_seq}"):
+                cancel_event.set()
+                return False
+            if metrics.t_first_audio is None:
+                metrics.t_first_audio = time.perf_counter()
+            tts_seq += len(pending)
+            pending = []
+            pending_bytes = 0
+            return True
+
         try:
             if AUTO_LANG:
                 await decided_event.wait()
+            if _is_cancelled():
+                return
 
-            while True:
-                if _is_cancelled():
-                    return
-                item = await tts_queue.get()
-                if item is None:
-                    break
+            # 语言已定，本轮的 TTS 实例不再变化：stream 方法和 audio_begin 只取一次
+            tts = chosen_tts
+            meta = TTS_META[id(tts)]
+            audio_begin = f'{{"type":"audio_begin","turn_id":{turn_id},{TTS_META_JSON[id(tts)]}}}'
 
-                _, seg_text = item
-                if not seg_text.strip():
-                    continue
+            feeder = asyncio.create_task(_feed_tts(order, slots, tts.stream))
+            while (head := await order.get()) is not None:
+                synth, chunks = head
+                chunk = await chunks.get()
                 if _is_cancelled():
                     return
 
                 if not audio_started:
-                    await send_json(ws, lock, {"type": "state_update", "turn_id": turn_id, "state": "speaking"})
-                    await send_json(ws, lock, {
-                        "type": "audio_begin",
-                        "turn_id": turn_id,
-                        "mime": getattr(chosen_tts, "mime_type", "audio/L16"),
-                        "format": getattr(chosen_tts, "format", "pcm_s16le"),
-                        "sample_rate": getattr(chosen_tts, "sample_rate", 16000),
-                        "channels": getattr(chosen_tts, "channels", 1),
-                    })
-                    print("SEND audio_begin", turn_id, getattr(chosen_tts, "format", ""), getattr(chosen_tts, "sample_rate", ""))
+                    send_text(out, _state_text(turn_id, "speaking"))
+                    send_text(out, audio_begin)
+                    print("SEND audio_begin", turn_id, meta["format"], meta["sample_rate"])
                     audio_started = True
 
-                async for chunk in chosen_tts.stream(seg_text):
+                while chunk is not None:
                     if _is_cancelled():
                         return
-                    header = b"AUD0" + int(turn_id).to_bytes(4, "little") + int(tts_seq).to_bytes(4, "little")
-                    ok = await safe_send_bytes(ws, lock, header + chunk, tag=f"turn={turn_id} seq={tts_seq}")
-                    if not ok:
-                        cancel_event.set()
+                    pending.append(chunk)
+                    pending_bytes += len(chunk)
+
+                    # 首块立即发（保证首音延迟），攒够了也发
+                    if metrics.t_first_audio is None or pending_bytes >= AUDIO_COALESCE_BYTES:
+                        if not _send_audio():
+                            return
+                        chunk = await chunks.get()
+                        continue
+
+                    # 下一块很快就到则继续攒；否则先把已攒的发出去，不让播放端等
+                    next_chunk = asyncio.ensure_future(chunks.get())
+                    done, _ = await asyncio.wait((next_chunk,), timeout=AUDIO_COALESCE_WAIT)
+                    if not done and not _send_audio():
                         return
-                    if metrics.t_first_audio is None:
-                        metrics.t_first_audio = time.perf_counter()
-                    tts_seq += 1
+                    chunk = await next_chunk
+                    next_chunk = None
+
+                if not _send_audio():
+                    return
+                await synth  # 合成出错在这里抛出
+                synth = None
+                slots.release()
         finally:
+            # 取消还没发送的合成任务（含当前段），等它们关闭各自的 TTS 流
+            tasks = [t for t in (next_chunk, feeder, synth) if t is not None]
+            while not order.empty():
+                head = order.get_nowait()
+                if head is not None:
+                    tasks.append(head[0])
+            for t in tasks:
+                t.cancel()
+            for t in tasks:
+                try:
+                    await t
+                except (asyncio.CancelledError, Exception):
+                    pass
             if (not _is_cancelled()) and audio_started:
-                await send_json(ws, lock, {"type": "audio_end", "turn_id": turn_id})
+                send_text(out, f'{{"type":"audio_end","turn_id":{turn_id}}}')
                 print("SEND audio_end", turn_id)
 
-    def _maybe_decide_tts(force: bool = False):
-        nonlocal decided, chosen_tts, sample_buf
+    def _maybe_decide_tts(force: bool = False, delta: str = ""):
+        nonlocal decided, chosen_tts
         if decided or (not AUTO_LANG):
             if not decided:
                 decided = True
@@ -306,86 +770,117 @@ async def run_turn_workflow(
             return
 
         # decide by fixed length or force at stream end
-        if (len(sample_buf) >= DECIDE_CHARS) or force:
-            chosen_tts = _pick_tts_by_sample(sample_buf[:DECIDE_CHARS])
+        if (sample_len >= DECIDE_CHARS) or force:
+            chosen_tts = _pick_tts_by_sample("".join(sample_parts)[:DECIDE_CHARS])
             decided = True
             decided_event.set()
             print(f"[TTS] auto_lang decided: chosen={'zh' if chosen_tts is tts_zh else 'en'}")
             return
 
+        # 领先已超过窗口剩余字数：后面的字无论是什么都翻不了盘，不必等满 DECIDE_CHARS
+        remaining = DECIDE_CHARS - sample_len
+        if sample_cjk - sample_lat >= remaining or sample_lat - sample_cjk > remaining:
+            chosen_tts = tts_zh if sample_cjk >= sample_lat else tts_en
+            decided = True
+            decided_event.set()
+            print(f"[TTS] auto_lang decided by lead: chosen={'zh' if chosen_tts is tts_zh else 'en'}")
+            return
+
         # early decide when short answer already has boundary
-        if len(sample_buf) >= SOFT_MIN_CHARS:
-            b = _find_boundary(sample_buf, SOFT_MIN_CHARS - 1)
-            if b != -1:
-                chosen_tts = _pick_tts_by_sample(sample_buf[: max(b + 1, SOFT_MIN_CHARS)])
+        # （只有新 delta 带句末标点时才可能出现新的边界，否则不必 join 重扫）
+        if sample_len >= SOFT_MIN_CHARS and END_PUNCT_RE.search(delta):
+            sample = "".join(sample_parts)
+            m = END_PUNCT_RE.search(sample, SOFT_MIN_CHARS - 1)
+            if m is not None:
+                chosen_tts = _pick_tts_by_sample(sample[: max(m.end(), SOFT_MIN_CHARS)])
                 decided = True
                 decided_event.set()
                 print(f"[TTS] auto_lang decided by early boundary: chosen={'zh' if chosen_tts is tts_zh else 'en'}")
 
+    async def _enqueue_tts(item: tuple[int, str] | None):
+        # 队列满时等待 tts_worker 消费；tts_worker 已退出则直接丢弃，避免永久阻塞
+        if tts_task is None or tts_task.done():
+            return
+        try:
+            tts_queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+        put_task = asyncio.ensure_future(tts_queue.put(item))
+        try:
+            await asyncio.wait((put_task, tts_task), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not put_task.done():
+                put_task.cancel()
+
     async def llm_worker():
-        nonlocal sample_buf
+        nonlocal sample_len, sample_cjk, sample_lat
         full_text = ""
-        buf = ""
+        full_parts: list[str] = []
+        segmenter = TextSegmenter(
+            first_min=FIRST_MIN_CHARS,
+            min_chars=MIN_CHARS,
+            soft_min_chars=SOFT_MIN_CHARS,
+            max_chars=MAX_CHARS,
+        )
         seg_id = 0
+        # assistant_delta 的固定部分每轮只拼一次
+        delta_prefix = f'{{"type":"assistant_delta","turn_id":{turn_id},"delta":'
 
-        await send_json(ws, lock, {"type": "state_update", "turn_id": turn_id, "state": "thinking"})
+        send_text(out, _state_text(turn_id, "thinking"))
         if _is_cancelled():
             return full_text
 
         if hasattr(llm, "generate_stream"):
             async for delta in llm.generate_stream(user_text):
                 if _is_cancelled():
-                    return full_text
+                    return "".join(full_parts)
                 if not delta:
                     continue
 
-                full_text += delta
-                buf += delta
+                full_parts.append(delta)
+                segmenter.push(delta)
 
-                if AUTO_LANG and (not decided) and len(sample_buf) < DECIDE_CHARS:
-                    sample_buf += delta
-                    sample_buf = sample_buf[: max(DECIDE_CHARS, 256)]
-                    _maybe_decide_tts(force=False)
+                if AUTO_LANG and (not decided) and sample_len < DECIDE_CHARS:
+                    sample_parts.append(delta)
+                    sample_len += len(delta)
+                    cjk, lat = _lang_score(delta)
+                    sample_cjk += cjk
+                    sample_lat += lat
+                    _maybe_decide_tts(force=False, delta=delta)
 
                 if metrics.t_first_delta is None:
                     metrics.t_first_delta = time.perf_counter()
 
-                await send_json(ws, lock, {"type": "assistant_delta", "turn_id": turn_id, "delta": delta})
+                send_text(out, delta_prefix + _json_str(delta) + "}")
 
                 # 不决定语言就不入队（tts_worker 会 wait）
                 if AUTO_LANG and (not decided):
                     continue
 
-                while True:
-                    seg, buf2 = _pop_segment(buf)
-                    if seg is None:
-                        break
-                    buf = buf2
-                    await tts_queue.put((seg_id, seg))
+                while (seg := segmenter.pop()) is not None:
+                    await _enqueue_tts((seg_id, seg))
                     seg_id += 1
+
+            full_text = "".join(full_parts)
         else:
             txt = await llm.generate(user_text)
             if _is_cancelled():
                 return full_text
 
             full_text = txt or ""
-            buf = full_text
 
             if AUTO_LANG and (not decided):
-                sample_buf = full_text[:DECIDE_CHARS]
+                sample_parts[:] = [full_text[:DECIDE_CHARS]]
                 _maybe_decide_tts(force=True)
 
             if metrics.t_first_delta is None:
                 metrics.t_first_delta = time.perf_counter()
 
-            await send_json(ws, lock, {"type": "assistant_delta", "turn_id": turn_id, "delta": full_text})
+            send_json(out, {"type": "assistant_delta", "turn_id": turn_id, "delta": full_text})
 
-            while True:
-                seg, buf2 = _pop_segment(buf)
-                if seg is None:
-                    break
-                buf = buf2
-                await tts_queue.put((seg_id, seg))
+            for seg in segmenter.split_all(full_text):
+                await _enqueue_tts((seg_id, seg))
                 seg_id += 1
 
         # stream ended: ensure we decide language at least once
@@ -393,29 +888,48 @@ async def run_turn_workflow(
             _maybe_decide_tts(force=True)
 
         # flush tail
-        tail = buf.strip()
+        tail = segmenter.flush().strip()
         if tail:
-            await tts_queue.put((seg_id, tail))
+            await _enqueue_tts((seg_id, tail))
             seg_id += 1
 
         if not _is_cancelled():
-            await send_json(ws, lock, {"type": "assistant_final", "turn_id": turn_id, "text": full_text})
+            send_json(out, {"type": "assistant_final", "turn_id": turn_id, "text": full_text})
 
         return full_text
 
     llm_task: asyncio.Task | None = None
     tts_task: asyncio.Task | None = None
 
+    async def _finalize_turn():
+        for t in (llm_task, tts_task):
+            if t and not t.done():
+                t.cancel()
+                try:
+                    await t
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+        # 丢弃未合成的段落
+        while not tts_queue.empty():
+            tts_queue.get_nowait()
+
+        if metrics.t_done is None:
+            metrics.t_done = time.perf_counter()
+        await append_metrics(metrics.to_record())
+        if state.metrics is not None:
+            state.metrics.pop(turn_id, None)
+
     try:
         tts_task = asyncio.create_task(tts_worker())
         llm_task = asyncio.create_task(llm_worker())
 
         await llm_task
-        await tts_queue.put(None)
+        await _enqueue_tts(None)
         await tts_task
 
         if not _is_cancelled():
-            await send_json(ws, lock, {"type": "state_update", "turn_id": turn_id, "state": "idle"})
+            send_text(out, _state_text(turn_id, "idle"))
 
     except asyncio.CancelledError:
         real_cancel = cancel_event.is_set() or (turn_id != state.turn_id)
@@ -426,36 +940,26 @@ async def run_turn_workflow(
         tb = traceback.format_exc()
         print("[run_turn_workflow] exception:", type(e).__name__, repr(e))
         print(tb)
-        await send_json(ws, lock, {"type": "error", "turn_id": turn_id, "msg": f"Workflow failed: {type(e).__name__}: {repr(e)}"})
+        send_json(out, {"type": "error", "turn_id": turn_id, "msg": f"Workflow failed: {type(e).__name__}: {repr(e)}"})
         metrics.outcome = "error"
         metrics.err_type = type(e).__name__
         metrics.err_repr = repr(e)
         if turn_id == state.turn_id:
-            await send_json(ws, lock, {"type": "state_update", "turn_id": turn_id, "state": "idle"})
+            send_text(out, _state_text(turn_id, "idle"))
     finally:
-        for t in (llm_task, tts_task):
-            if t and not t.done():
-                t.cancel()
-                try:
-                    await t
-                except Exception:
-                    pass
-
-        if metrics.t_done is None:
-            metrics.t_done = time.perf_counter()
-        await append_metrics(metrics.to_record())
-        if state.metrics is not None:
-            state.metrics.pop(turn_id, None)
+        # cancel_workflow 的 wait_for 超时会再次取消本任务；
+        # 收尾放进 shield，保证 TTS 生成器关闭、指标落盘不被截断
+        await asyncio.shield(_finalize_turn())
 
 @router.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
     await ws.accept()
 
-    send_lock = asyncio.Lock()
+    out = WSOutbox(ws)
     session_id = uuid.uuid4().hex
     state = SessionState(turn_id=0, workflow_task=None, session_id=session_id, metrics={})
 
-    await send_json(ws, send_lock, {
+    send_json(out, {
         "type": "hello",
         "msg": "connected",
         "session_id": session_id,
@@ -466,7 +970,7 @@ async def ws_endpoint(ws: WebSocket):
     try:
         while True:
             raw = await ws.receive_text()
-            msg = json.loads(raw)
+            msg = _json_loads(raw)
             mtype = msg.get("type")
 
             if mtype == "user_text":
@@ -476,14 +980,14 @@ async def ws_endpoint(ws: WebSocket):
                 turn_id = state.turn_id
 
                 if state.workflow_task:
-                    await cancel_workflow(ws, send_lock, state, old_turn, send_audio_cancel=True, reason="new_turn")
+                    await cancel_workflow(out, state, old_turn, send_audio_cancel=True, reason="new_turn")
 
                 m = TurnMetrics(session_id=session_id, turn_id=turn_id, t0=recv_ts)
                 state.metrics[turn_id] = m
 
                 state.cancel_event = asyncio.Event()
                 state.workflow_task = asyncio.create_task(
-                    run_turn_workflow(ws, send_lock, state, turn_id, msg.get("text", ""), state.cancel_event, m)
+                    run_turn_workflow(out, state, turn_id, msg.get("text", ""), state.cancel_event, m)
                 )
 
                 def _done(_t: asyncio.Task):
@@ -503,14 +1007,14 @@ async def ws_endpoint(ws: WebSocket):
                     if state.metrics is not None and old_turn in state.metrics:
                         if state.metrics[old_turn].t_interrupt_recv is None:
                             state.metrics[old_turn].t_interrupt_recv = recv_ts
-                    await cancel_workflow(ws, send_lock, state, old_turn, send_audio_cancel=True, reason="interrupt")
+                    await cancel_workflow(out, state, old_turn, send_audio_cancel=True, reason="interrupt")
                 else:
-                    await safe_send_json(ws, send_lock, {"type": "audio_cancel", "turn_id": old_turn})
+                    send_json(out, {"type": "audio_cancel", "turn_id": old_turn})
 
-                await send_json(ws, send_lock, {"type": "state_update", "turn_id": new_turn, "state": "idle"})
+                send_json(out, {"type": "state_update", "turn_id": new_turn, "state": "idle"})
 
             else:
-                await send_json(ws, send_lock, {"type": "error", "turn_id": state.turn_id, "msg": f"unknown type: {mtype}"})
+                send_json(out, {"type": "error", "turn_id": state.turn_id, "msg": f"unknown type: {mtype}"})
 
     except WebSocketDisconnect:
         print("[ws] WebSocketDisconnect")
@@ -518,3 +1022,5 @@ async def ws_endpoint(ws: WebSocket):
             state.cancel_event.set()
         if state.workflow_task:
             state.workflow_task.cancel()
+    finally:
+        out.close()
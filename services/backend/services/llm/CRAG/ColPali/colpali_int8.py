@@ -0,0 +1,90 @@
+"""
+ColPali 页面向量的 int8 量化与 MaxSim 打分。
+
+step1_index.py 建完索引后调用 save_int8_index，把 byaldi 存的 FP16/FP32 页面向量
+按向量对称量化成 int8（每个 token 一个 FP16 scale），写成 embeddings_int8.pt；
+step2_search.py 用 load_int8_index（mmap）读回，maxsim_int8 打分。
+MaxSim 是带宽受限的点积，int8 比 FP16 少一半字节，比 FP32 少四分之三。
+"""
+from pathlib import Path
+
+import torch
+
+INT8_FILE = "embeddings_int8.pt"
+# 每次打分的页面块大小：控制 (查询 token × 页面 token) 相似度矩阵的峰值内存
+PAGE_BLOCK = 256
+
+
+def quantize_per_vector(x: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    """按最后一维对称量化：scale = max|x| / 127，返回 (int8 张量, FP16 scale)。"""
+    x = x.float()
+    scale = x.abs().amax(dim=-1).clamp_min(1e-12) / 127.0
+    q = torch.round(x / scale.unsqueeze(-1)).clamp_(-127, 127).to(torch.int8)
+    return q, scale.half()
+
+
+def save_int8_index(index_dir: Path):
+    """读取 byaldi 索引的 embeddings_*.pt，量化后写成一个补齐到 (页数, 最大 token 数, dim) 的文件。"""
+    files = sorted((index_dir / "embeddings").glob("embeddings_*.pt"), key=lambda p: int(p.stem.split("_")[1]))
+    pages: list[torch.Tensor] = []
+    for f in files:
+        pages.extend(torch.load(f, map_location="cpu", weights_only=True))
+    if not pages:
+        return None
+
+    lengths = torch.tensor([p.shape[0] for p in pages], dtype=torch.int32)
+    # token 数补齐到 8 的倍数，满足 int8 GEMM 的对齐要求
+    max_len = (int(lengths.max()) + 7) // 8 * 8
+    dim = pages[0].shape[-1]
+    q = torch.zeros((len(pages), max_len, dim), dtype=torch.int8)
+    scales = torch.zeros((len(pages), max_len), dtype=torch.float16)
+    for i, page in enumerate(pages):
+        q[i, : len(page)], scales[i, : len(page)] = quantize_per_vector(page)
+
+    path = index_dir / INT8_FILE
+    torch.save({"q": q, "scales": scales, "lengths": lengths}, path)
+    return path
+
+
+def load_int8_index(index_dir: Path) -> dict | None:
+    """mmap 方式读回 save_int8_index 的结果；没有量化文件时返回 None。"""
+    path = index_dir / INT8_FILE
+    if not path.exists():
+        return None
+    try:
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except TypeError:
+        # torch < 2.1 没有 mmap 参数
+        return torch.load(path, map_location="cpu", weights_only=True)
+
+
+def _int8_matmul(a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
+    """(n, d) int8 × (m, d) int8 -> (n, m) float32；不支持 int8 GEMM 时退回浮点。"""
+    try:
+        return torch._int_mm(a, b.t().contiguous()).float()
+    except (AttributeError, RuntimeError):
+        return a.float() @ b.float().t()
+
+
+def maxsim_int8(q_emb: torch.Tensor, index: dict) -> torch.Tensor:
+    """
+    q_emb: (查询数, 查询 token 数, dim) 浮点（补齐的 token 为零向量，贡献为 0）
+    返回 (查询数, 页数) 的 MaxSim 分数：每个查询 token 取页面内最大相似度再求和。
+    """
+    qq, qs = quantize_per_vector(q_emb.to("cpu"))
+    nq, nt, dim = qq.shape
+    qq = qq.reshape(nq * nt, dim)
+    qs = qs.float().view(nq, nt, 1, 1)
+
+    pq, ps, lengths = index["q"], index["scales"], index["lengths"]
+    n_pages, max_len, _ = pq.shape
+    out = torch.empty((nq, n_pages), dtype=torch.float32)
+    for start in range(0, n_pages, PAGE_BLOCK):
+        end = min(start + PAGE_BLOCK, n_pages)
+        nb = end - start
+        sims = _int8_matmul(qq, pq[start:end].reshape(nb * max_len, dim)).view(nq, nt, nb, max_len)
+        sims = sims * qs * ps[start:end].float().view(1, 1, nb, max_len)
+        pad = torch.arange(max_len).view(1, max_len) >= lengths[start:end].view(nb, 1)
+        sims.masked_fill_(pad, float("-inf"))
+        out[:, start:end] = sims.amax(dim=-1).sum(dim=1)
+    return out
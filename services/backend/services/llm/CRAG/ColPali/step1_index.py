@@ -38,4 +38,10 @@ RAG.index(
     overwrite=True
 )
 
-print("索引完成！")
\ No newline at end of file
+print("索引完成！")
+
+# 页面向量量化成 int8 另存一份，step2 检索时用它做 MaxSim（带宽减半）
+from colpali_int8 import save_int8_index
+
+int8_path = save_int8_index(Path(".byaldi") / "biology_course_index")
+print(f"int8 量化向量已保存: {int8_path}")
\ No newline at end of file
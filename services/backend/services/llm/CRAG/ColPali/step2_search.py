@@ -20,39 +20,116 @@ os.environ["HF_HOME"] = str(local_model_path)
 print(f"🚀 使用本地模型路径: {local_model_path}")
 # =========================================================================
 
+import torch
 from byaldi import RAGMultiModalModel
+from byaldi.objects import Result
+
+from colpali_int8 import load_int8_index, maxsim_int8
 
 # 加载索引
 # 注意：index_path 默认在当前目录的 .byaldi 文件夹下，只要你是在同级目录运行就不需要改
+INDEX_ROOT = Path(".byaldi")
+INDEX_NAME = "biology_course_index"
+
 print("正在加载索引和模型...")
-RAG = RAGMultiModalModel.from_index("biology_course_index")
+RAG = RAGMultiModalModel.from_index(INDEX_NAME)
 
-# 用户提问
-user_query = "你好"
 
-# 执行检索 (k=1 找最相关的一张)
-print(f"正在检索: {user_query}")
-results = RAG.search(user_query, k=1)
+def mmap_index_embeddings(colpali, index_dir: Path):
+    """
+    把 from_index 读进内存的页面向量换成 torch.load(mmap=True) 的版本：
+    张量数据留在 .pt 文件里按需换页，常驻内存只剩打分时实际用到的部分。
+    byaldi 没有跳过整体读入的入口，所以只降低加载之后的常驻内存，from_index 期间的峰值不变。
+    """
+    files = sorted((index_dir / "embeddings").glob("embeddings_*.pt"), key=lambda p: int(p.stem.split("_")[1]))
+    embeddings = []
+    try:
+        for f in files:
+            embeddings.extend(torch.load(f, map_location="cpu", mmap=True, weights_only=True))
+    except TypeError:
+        # torch < 2.1 不支持 mmap，保留 from_index 读入的版本
+        print("⚠️ 当前 torch 不支持 mmap 加载，索引向量仍在内存中")
+        return
+    colpali.indexed_embeddings = embeddings
 
-# 输出结果并保存图片
-if len(results) == 0:
-    print("❌ 没有找到相关结果")
+
+# step1 生成了 int8 量化向量就用它打分（没有则用浮点向量）
+INT8_INDEX = load_int8_index(INDEX_ROOT / INDEX_NAME)
+if INT8_INDEX is not None:
+    # 打分不再用浮点向量：from_index 读进来的直接释放，也不用 mmap 重读一遍
+    RAG.model.indexed_embeddings = []
 else:
+    mmap_index_embeddings(RAG.model, INDEX_ROOT / INDEX_NAME)
+
+
+def search_many(queries: list[str], k: int = 1):
+    """
+    多条查询一次检索：查询编码合成一个 batch 前向，MaxSim 打分对所有页面一次算完。
+    （RAG.search 传列表时仍是逐条编码、逐条打分）
+    返回与 queries 一一对应的结果列表，元素与 RAG.search 的 Result 相同。
+    """
+    colpali = RAG.model
+    with torch.inference_mode():
+        batch = colpali.processor.process_queries(queries)
+        batch = {
+            key: v.to(colpali.device).to(colpali.model.dtype if v.is_floating_point() else v.dtype)
+            for key, v in batch.items()
+        }
+        q_emb = colpali.model(**batch)
+    # (num_queries, num_pages)
+    if INT8_INDEX is not None:
+        scores = maxsim_int8(q_emb, INT8_INDEX)
+    else:
+        scores = colpali.processor.score(list(torch.unbind(q_emb.to("cpu"))), colpali.indexed_embeddings)
+    top = scores.topk(min(k, scores.shape[1]), dim=1)
+
+    all_results = []
+    for row_scores, row_ids in zip(top.values.tolist(), top.indices.tolist()):
+        results = []
+        for score, embed_id in zip(row_scores, row_ids):
+            doc_info = colpali.embed_id_to_doc_id[int(embed_id)]
+            doc_id = int(doc_info["doc_id"])
+            results.append(Result(
+                doc_id=doc_id,
+                page_num=int(doc_info["page_id"]),
+                score=float(score),
+                metadata=colpali.doc_id_to_metadata.get(doc_id, {}),
+                base64=colpali.collection.get(int(embed_id)),
+            ))
+        all_results.append(results)
+    return all_results
+
+# 用户提问（可以一次放多条，批量检索）
+queries = ["你好"]
+
+# 执行检索 (k=1 找最相关的一张)
+print(f"正在检索: {queries}")
+for user_query, results in zip(queries, search_many(queries, k=1)):
+    print(f"\n=== 查询: {user_query} ===")
+    # 输出结果并保存图片
+    if len(results) == 0:
+        print("❌ 没有找到相关结果")
+        continue
     for i, result in enumerate(results):
         print(f"\n--- 结果 {i+1} ---")
         print(f"文档 ID: {result.doc_id}")
         print(f"页码: {result.page_num}")
         print(f"相似度: {result.score}")
-        
+
         # === 保存图片逻辑 ===
         # byaldi 的 result 包含 base64 编码的图片数据
-        if hasattr(result, 'base64'):
+        if getattr(result, 'base64', None):
             img_data = base64.b64decode(result.base64)
-            image = Image.open(io.BytesIO(img_data))
-            
+
             # 保存到本地看看对不对
             save_name = f"result_page_{result.page_num}.png"
-            image.save(save_name)
+            if img_data.startswith(b"\x89PNG\r\n\x1a\n"):
+                # byaldi 存的就是 PNG 编码，直接落盘，不用 PIL 解码再重新压缩
+                with open(save_name, "wb") as f:
+                    f.write(img_data)
+            else:
+                # 其他格式才需要转码；PNG 压缩级别用 1，默认的 6 很慢而体积差不多
+                Image.open(io.BytesIO(img_data)).save(save_name, compress_level=1)
             print(f"✅ 检索到的图片已保存为: {save_name}")
         else:
-            print("⚠️ 结果中未包含图片数据")
\ No newline at end of file
+            print("⚠️ 结果中未包含图片数据")
@@ -1,7 +1,18 @@
 import yaml
 import os
+from functools import cached_property, lru_cache
 from pathlib import Path
 
+# 有 libyaml 时用 C 实现的解析器，比纯 Python 的 SafeLoader 快数倍
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@lru_cache(maxsize=8)
+def _load_yaml(config_path: str, mtime: float):
+    # mtime 参与缓存键：文件被修改后会重新解析
+    with open(config_path, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=_YAML_LOADER)
+
 
 class Config:
     def __init__(self, config_path=None):
@@ -16,17 +27,16 @@ class Config:
 
         # 2. åŠ è½½ YAML
         try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                self.cfg = yaml.safe_load(f)
+            self.cfg = _load_yaml(config_path, os.path.getmtime(config_path))
         except FileNotFoundError:
             raise FileNotFoundError(f"é…ç½®æ–‡ä»¶æœªæ‰¾åˆ°ï¼Œè¯·æ£€æŸ¥è·¯å¾? {config_path}")
 
     # --- åŸºç¡€é…ç½®å?---
-    @property
+    @cached_property
     def paths(self):
         return self.cfg.get("paths", {})
 
-    @property
+    @cached_property
     def models(self):
         models = self.cfg.get("models", {}) or {}
         resolved = dict(models)
@@ -36,7 +46,7 @@ class Config:
                 resolved[key] = str(self._resolve_path(raw))
         return resolved
 
-    @property
+    @cached_property
     def params(self):
         return self.cfg.get("parameters", {})
 
@@ -1,8 +1,12 @@
+import logging
 import time
+from itertools import chain, islice, repeat
 from .state import AgentState
 from .nodes import CragNodes
 from ..config.config_loader import settings
 
+logger = logging.getLogger(__name__)
+
 
 class CragAgent:
     def __init__(self, tools, method: str | None = None):
@@ -13,6 +17,13 @@ class CragAgent:
         # æ”¯æŒ?å¤–éƒ¨æŒ‡å®šæ–¹æ³•
         self.method = (method or settings.params.get('method', 'crag')).strip().lower()
         print(f"ðŸ¤– [Agent] Initialized. Method: {self.method}")
+        # method -> 流水线，run_batch 直接查表分发；新增方法只需在这里注册
+        self._pipelines = {
+            'crag': self._run_crag,
+            'rag': self._run_rag,
+            'no_retrieval': self._run_ctx_only,
+            'context_only': self._run_ctx_only,
+        }
 
     def run_batch(self, batch_data: dict, *, method: str | None = None):
         """
@@ -26,75 +37,78 @@ class CragAgent:
         queries = batch_data.get("queries") or []
         if not queries:
             raise ValueError("batch_data['queries'] is required")
-        ids = batch_data.get("ids") or list(range(len(queries)))
+        # 下游只对 ids 做 zip / len，range 就够用，不必物化成 list
+        ids = batch_data.get("ids") or range(len(queries))
+        n = len(ids)
 
-        raw_docs = batch_data.get("raw_docs")
-        if raw_docs is None:
-            raw_docs = [[] for _ in ids]
-        raw_docs = list(raw_docs)
-        if len(raw_docs) < len(ids):
-            raw_docs = raw_docs + ([[]] * (len(ids) - len(raw_docs)))
-        elif len(raw_docs) > len(ids):
-            raw_docs = raw_docs[: len(ids)]
+        # 不足补空、超出截断，一次遍历得到长度为 n 的列表
+        raw_docs = list(islice(chain(batch_data.get("raw_docs") or (), repeat([])), n))
 
         ctx_override = batch_data.get("final_contexts")
         if isinstance(ctx_override, str):
             ctx_override = [ctx_override]
         if ctx_override is not None:
-            ctx_override = list(ctx_override)
-            if len(ctx_override) < len(ids):
-                ctx_override = ctx_override + ([""] * (len(ids) - len(ctx_override)))
-            elif len(ctx_override) > len(ids):
-                ctx_override = ctx_override[: len(ids)]
+            ctx_override = list(islice(chain(ctx_override, repeat("")), n))
 
         # 1. åˆå§‹åŒ–çŠ¶æ€?(Memory Backpack)
+        # 预编码 token 只有和 raw_docs 一一对应时才可用（raw_docs 被补齐/截断过就退回字符串路径）
+        pair_tokens = batch_data.get("pair_tokens")
+        if pair_tokens is not None and len(pair_tokens[1]) - 1 != sum(map(len, raw_docs)):
+            pair_tokens = None
+
         state = AgentState(
             ids=ids,
             queries=queries,
-            raw_docs=raw_docs
+            raw_docs=raw_docs,
+            pair_tokens=pair_tokens,
         )
 
         batch_size = len(state.ids)
 
         # 2. çŠ¶æ€æœºè°ƒåº¦ (Graph Execution)
-        if run_method == 'crag':
-            # === CRAG æ ‡å‡†æµç¨‹ ===
-            # Step 1: è£åˆ¤æ‰“åˆ† (T5)
-            state = self.nodes.evaluate_node(state)
-
-            # Step 2: å†³ç­–è·¯ç”± (Correct / Ambiguous / Incorrect)
-            state = self.nodes.decide_node(state)
-
-            # Step 3: çŸ¥è¯†ä¿®æ­£ (Mock Retrieval)
-            state = self.nodes.refine_node(state)
-
-            # Step 4: ç”Ÿæˆå›žç­” (Self-RAG / Llama)
-            state = self.nodes.generate_node(state)
-
-        elif run_method == 'rag':
-            # === Standard RAG (Naive) ===
-            # è·³è¿‡è¯„ä¼°å’Œä¿®æ­£ï¼Œç›´æŽ?æŠŠæ£€ç´¢åˆ°çš„åŽŸå§‹æ–‡æ¡£æ‹¼èµ·æ¥å–‚ç»™æ¨¡åž‹
-            # raw_docs æ˜?[[d1..d10], [d1..d10]]ï¼Œæˆ‘ä»¬éœ€è¦æ‹¼æˆå­—ç¬¦ä¸²
-            if ctx_override is not None:
-                state.final_contexts = ctx_override
-            else:
-                state.final_contexts = [" ".join(docs) for docs in state.raw_docs]
-            state = self.nodes.generate_node(state)
-
-        elif run_method in ('no_retrieval', 'context_only'):
-            # === No Retrieval ===
-            # ä¸Šä¸‹æ–‡å…¨ç©ºï¼Œé æ¨¡åž‹çžŽç¼?
-            state.final_contexts = ctx_override or ["" for _ in state.queries]
-            state = self.nodes.generate_node(state)
-
-        else:
+        pipeline = self._pipelines.get(run_method)
+        if pipeline is None:
             raise ValueError(f"Unknown method: {run_method}")
+        state = pipeline(state, ctx_override)
 
         end_time = time.time()
         cost = end_time - start_time
 
         # ç®€å•æ‰“å°ä¸€ä¸‹è¿›åº¦ï¼Œé˜²æ­¢çœ‹èµ·æ¥åƒå¡æ­»äº?
-        print(f"âœ?Batch finished in {cost:.2f}s (Avg: {cost/batch_size:.2f}s/q)")
+        logger.info("✅ Batch finished in %.2fs (Avg: %.2fs/q)", cost, cost / batch_size)
 
         # è¿”å›žæœ€ç»ˆç­”æ¡ˆåˆ—è¡?
         return state.final_answers
+
+    def _run_crag(self, state: AgentState, ctx_override) -> AgentState:
+        # === CRAG æ ‡å‡†æµç¨‹ ===
+        # Step 1: è£åˆ¤æ‰“åˆ† (T5)
+        state = self.nodes.evaluate_node(state)
+
+        # Step 2: å†³ç­–è·¯ç”± (Correct / Ambiguous / Incorrect)
+        state = self.nodes.decide_node(state)
+
+        # Step 3: çŸ¥è¯†ä¿®æ­£ (Mock Retrieval)
+        state = self.nodes.refine_node(state)
+
+        # Step 4: ç”Ÿæˆå›žç­” (Self-RAG / Llama)
+        state = self.nodes.generate_node(state)
+        return state
+
+    def _run_rag(self, state: AgentState, ctx_override) -> AgentState:
+        # === Standard RAG (Naive) ===
+        # è·³è¿‡è¯„ä¼°å’Œä¿®æ­£ï¼Œç›´æŽ?æŠŠæ£€ç´¢åˆ°çš„åŽŸå§‹æ–‡æ¡£æ‹¼èµ·æ¥å–‚ç»™æ¨¡åž‹
+        # raw_docs æ˜?[[d1..d10], [d1..d10]]ï¼Œæˆ‘ä»¬éœ€è¦æ‹¼æˆå­—ç¬¦ä¸²
+        if ctx_override is not None:
+            state.final_contexts = ctx_override
+        else:
+            state.final_contexts = list(map(" ".join, state.raw_docs))
+        state = self.nodes.generate_node(state)
+        return state
+
+    def _run_ctx_only(self, state: AgentState, ctx_override) -> AgentState:
+        # === No Retrieval ===
+        # ä¸Šä¸‹æ–‡å…¨ç©ºï¼Œé æ¨¡åž‹çžŽç¼?
+        state.final_contexts = ctx_override or [""] * len(state.queries)
+        state = self.nodes.generate_node(state)
+        return state
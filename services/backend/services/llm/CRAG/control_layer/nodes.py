@@ -1,9 +1,20 @@
+import logging
+from collections import defaultdict
 from typing import List
+
+import numpy as np
+
 from .state import AgentState
 from ..config.config_loader import settings
 # 引入新的 PromptBuilder
 from .prompt_builder import PromptBuilder
 
+# decide_node 的路由结果，下标对应 0=Correct / 1=Ambiguous / 2=Incorrect
+_FLAG_NAMES = np.array(["internal", "combined", "external"])
+
+# 每个 batch 都会经过的节点日志走 logging 并默认关闭，不再逐批 print 刷 stdout
+logger = logging.getLogger(__name__)
+
 class CragNodes:
     def __init__(self, tools):
         self.tools = tools
@@ -12,55 +23,84 @@ class CragNodes:
         """
         [Node 1] 裁判节点
         """
-        print("🤔 [Node] Evaluating retrieval quality...")
+        logger.debug("🤔 [Node] Evaluating retrieval quality...")
         
-        all_scores = []
-        # 逐个问题处理
-        for _id, q, docs in zip(state.ids, state.queries, state.raw_docs):
-            
-            # 【优化点】
-            # 如果 docs 为空 (比如某些数据源缺失)，这里会导致 q_repeated 为空，evaluator 报错。
-            # 加一个简单的防御
-            if not docs:
-                all_scores.append([0.0] * 10) # 填充默认低分
-                continue
-
-            q_repeated = [q] * len(docs)
-            id_repeated = [str(_id)] * len(docs)
-            
+        # 按检索排名分层打分：第一层每个问题取前 eval_first_tier 篇，之后每层翻倍。
+        # decide 只关心“有没有一篇 >= upper”，某个问题一旦命中就不再给它剩下的文档打分，
+        # 路由结果与全量打分完全一致。每一层仍把整个 minibatch 拍平成一次 evaluator 调用
+        upper = np.float64(settings.params['upper_threshold'])
+        tier = max(1, int(settings.params.get('eval_first_tier', 2)))
+
+        # 先分配 (B, ndocs) 矩阵：空位为 -inf，不会命中任何阈值
+        lengths = np.fromiter(map(len, state.raw_docs), dtype=np.int64, count=len(state.raw_docs))
+        empty = lengths == 0
+        width = max(int(lengths.max(initial=0)), 10 if empty.any() else 0)
+        scores = np.full((len(lengths), width), -np.inf, dtype=np.float32)
+        # 【优化点】
+        # 如果 docs 为空 (比如某些数据源缺失)，不放进 batch，填充默认低分
+        scores[empty, :10] = 0.0
+
+        # 有预编码 token 时按 (行, 列) 直接切出 token 序列，不再拼字符串、再 tokenize
+        tokens = state.pair_tokens
+        if tokens is not None:
+            tok_flat, tok_off = tokens
+            row_start = np.concatenate(([0], np.cumsum(lengths)))
+
+        active = ~empty
+        lo = 0
+        while lo < width and active.any():
+            hi = lo + tier
+            flat_queries, flat_docs, flat_ids, rows, cols = [], [], [], [], []
+            for i in np.flatnonzero(active).tolist():
+                docs = state.raw_docs[i][lo:hi]
+                if tokens is None:
+                    flat_queries.extend([state.queries[i]] * len(docs))
+                    flat_docs.extend(docs)
+                flat_ids.extend([str(state.ids[i])] * len(docs))
+                rows.extend([i] * len(docs))
+                cols.extend(range(lo, lo + len(docs)))
+
             # 调用 EvaluatorTool
-            scores = self.tools['evaluator'].run_pair(q_repeated, docs, ids=id_repeated)
-            all_scores.append(scores)
-            
-        state.scores = all_scores
+            if tokens is not None:
+                pair_idx = (row_start[rows] + cols).tolist() if rows else []
+                seqs = [tok_flat[tok_off[k]:tok_off[k + 1]] for k in pair_idx]
+                flat_scores = self.tools['evaluator'].run_tokens(seqs, ids=flat_ids)
+            else:
+                flat_scores = self.tools['evaluator'].run_pair(flat_queries, flat_docs, ids=flat_ids)
+            if len(flat_scores) != len(flat_ids):
+                # evaluator 出错时返回 []：与一次性全量打分出错时一样，有文档的行全部保持 -inf
+                scores[~empty] = -np.inf
+                break
+            scores[rows, cols] = flat_scores
+
+            # 已经命中 upper 的问题、文档已经打完的问题都退出
+            active &= ~(scores[:, lo:hi] >= upper).any(axis=1)
+            active &= lengths > hi
+            lo, tier = hi, tier * 2
+
+        state.scores = scores
         return state
 
     def decide_node(self, state: AgentState) -> AgentState:
         """
         [Node 2] 决策节点
         """
-        print("⚖️ [Node] Making decisions (Correct/Ambiguous/Incorrect)...")
-        upper = settings.params['upper_threshold']
-        lower = settings.params['lower_threshold']
+        logger.debug("⚖️ [Node] Making decisions (Correct/Ambiguous/Incorrect)...")
+        # 阈值用 float64 比较：float32 分数提升到 float64 是精确的，
+        # 判定结果与 Python float 逐个比较完全一致
+        upper = np.float64(settings.params['upper_threshold'])
+        lower = np.float64(settings.params['lower_threshold'])
         
-        flags = []
         # 注意：这里假设 state.scores 和 queries 长度一致
-        for scores in state.scores:
-            doc_flags = []
-            for s in scores:
-                if s >= upper: doc_flags.append(2)
-                elif s >= lower: doc_flags.append(1)
-                else: doc_flags.append(0)
-            
-            if 2 in doc_flags: 
-                final_flag = "internal"
-            elif 1 in doc_flags: 
-                final_flag = "combined"
-            else: 
-                final_flag = "external"
-            
-            flags.append(final_flag)
-            
+        # evaluate_node 已经给出补齐好的 (B, ndocs) 矩阵，空位为 -inf
+        arr = state.scores
+
+        # 任一文档 >= upper -> internal；否则任一 >= lower -> combined；否则 external
+        has_correct = (arr >= upper).any(axis=1)
+        has_ambiguous = (arr >= lower).any(axis=1)
+        flags_idx = np.where(has_correct, 0, np.where(has_ambiguous, 1, 2))
+        flags = _FLAG_NAMES[flags_idx].tolist()
+
         state.flags = flags
         return state
 
@@ -68,15 +108,21 @@ class CragNodes:
         """
         [Node 3] 执行节点 (Mock Retrieval)
         """
-        print("✂️ [Node] Refining knowledge (Mock Retrieval)...")
+        logger.debug("✂️ [Node] Refining knowledge (Mock Retrieval)...")
         
-        contexts = []
-        for _id, flag in zip(state.ids, state.flags):
-            res = self.tools['refiner'].run([_id], type=flag)
-            if res and len(res) > 0:
-                contexts.append(res[0])
-            else:
-                contexts.append("") 
+        # 按 flag 分组，每种知识库只调用一次 refiner（最多 3 次），再按原位置写回
+        groups = defaultdict(list)
+        positions = defaultdict(list)
+        for i, (_id, flag) in enumerate(zip(state.ids, state.flags)):
+            groups[flag].append(_id)
+            positions[flag].append(i)
+
+        contexts = [""] * len(state.flags)
+        for flag, group_ids in groups.items():
+            res = self.tools['refiner'].run(group_ids, type=flag)
+            # 出错时 run 返回 []，这一组保持空字符串
+            for i, doc in zip(positions[flag], res or ()):
+                contexts[i] = doc
             
         state.final_contexts = contexts
         return state
@@ -85,8 +131,7 @@ class CragNodes:
         """
         [Node 4] 生成节点：组装 Prompt 并调用 LLM
         """
-        print("✍️ [Node] Generating answers...")
-        prompts = []
+        logger.debug("✍️ [Node] Generating answers...")
         
         # 1. 获取动态配置参数
         # 从 settings 读取 task (popqa/pubqa)
@@ -97,19 +142,15 @@ class CragNodes:
         # 【新增】从 settings 读取 model_type (selfrag/llama)
         # 这解决了你提到的“不要写死”的问题
         gen_type = settings.models.get('generator_type', 'llama')
+        # 截断长度整批只读一次
+        context_max_len = settings.params.get('context_max_len', 4000)
 
         # 2. 组装 Batch Prompts
-        for q, ctx in zip(state.queries, state.final_contexts):
-            
-            # 使用 PromptBuilder 工厂构建 Prompt
-            # 这里的 model_name 参数现在是动态的了
-            prompt = PromptBuilder.build(
-                task=current_task, 
-                question=q, 
-                context=ctx,
-                model_name=gen_type 
-            )
-            prompts.append(prompt)
+        # 使用 PromptBuilder 工厂构建 Prompt：task / model_name / 截断长度整批不变，
+        # 分发逻辑只做一次，逐条只做截断 + 拼接
+        # 这里的 model_name 参数现在是动态的了
+        fmt = PromptBuilder.make_formatter(current_task, gen_type, context_max_len)
+        prompts = list(map(fmt, state.queries, state.final_contexts))
             
         # 3. 批量生成
         str_ids = [str(i) for i in state.ids]
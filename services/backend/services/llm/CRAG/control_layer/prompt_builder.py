@@ -1,6 +1,27 @@
-from typing import Optional
+from functools import lru_cache
+from typing import Callable, Optional
 from ..config.config_loader import settings
 
+# 静态模板放在模块级，每条 query 只做一次 format_map
+_POPQA_WITH_CTX_FMT = (
+    "Refer to the following documents, follow the instruction and answer the question.\n\n"
+    "Documents: {ctx}\n\n"
+    "Instruction: Answer the question: {q}"
+)
+_POPQA_NO_CTX_FMT = "Instruction: Answer the question: {q}"
+
+_PUBQA_WITH_CTX_FMT = (
+    "Read the documents and answer the question: Is the following statement correct or not? \n\n"
+    "Documents: {ctx}\n\n"
+    "Statement: {q}\n\n"
+    "Only say true if the statement is true; otherwise say false."
+)
+_PUBQA_NO_CTX_FMT = (
+    "Is the following statement correct or not? \n\n"
+    "Statement: {q}\n\n"
+    "Only say true if the statement is true; otherwise say false."
+)
+
 class PromptBuilder:
     # 从官方代码提取的任务指令字典
     TASK_INST = {
@@ -14,103 +35,111 @@ class PromptBuilder:
     }
 
     @staticmethod
-    def build(task: str, question: str, context: Optional[str] = None, model_name: str = "selfrag_llama2_7b") -> str:
+    def build(
+        task: str,
+        question: str,
+        context: Optional[str] = None,
+        model_name: str = "selfrag_llama2_7b",
+        context_max_len: Optional[int] = None,
+    ) -> str:
         """
         统一入口：根据 task 和 model_name 自动分发 Prompt 逻辑
+        context_max_len: 上下文截断长度；批量构建时由调用方读一次配置传进来，
+        不传则从 settings 读取
         """
-        task = task.lower()
+        if context_max_len is None:
+            context_max_len = settings.params.get('context_max_len', 4000)
+        return PromptBuilder.make_formatter(task, model_name, context_max_len)(question, context)
 
-        if task == "popqa":
-            # PopQA 在官方代码中格式比较特殊，通常不依赖模型区分
-            return PromptBuilder._format_popqa(question, context)
-        elif task == "pubqa":
-            return PromptBuilder._format_pubqa(question, context, model_name)
-        else:
-            return PromptBuilder._format_default(question, context, task)
+    @staticmethod
+    def make_formatter(
+        task: str, model_name: str = "selfrag_llama2_7b", context_max_len: int = 4000
+    ) -> Callable[[str, Optional[str]], str]:
+        """
+        一次运行里 task / model_name / 截断长度都不变：按这三者把分发逻辑预先做完，
+        返回只做截断 + 拼接的 formatter(question, context)，批量构建时逐条调用它即可
+        """
+        return _make_formatter(task.lower(), model_name, context_max_len)
 
     @staticmethod
-    def _format_popqa(question: str, context: Optional[str] = None) -> str:
+    def _format_popqa(limit: int) -> Callable[[str, Optional[str]], str]:
         """
         PopQA 模板
         """
-        # 【修复】同步获取截断长度配置
-        limit = settings.params.get('context_max_len', 4000)
-        
-        # 【修复】增加截断逻辑，防止 vLLM 报错
-        if context and len(context) > limit:
-            context = context[:limit]
-            
-        if context and len(context.strip()) > 0:
-            prompt = (
-                f"Refer to the following documents, follow the instruction and answer the question.\n\n"
-                f"Documents: {context}\n\n"
-                f"Instruction: Answer the question: {question}"
-            )
-        else:
-            prompt = f"Instruction: Answer the question: {question}"
-        return prompt
+        def fmt(question: str, context: Optional[str] = None) -> str:
+            # 【修复】增加截断逻辑，防止 vLLM 报错
+            if context and len(context) > limit:
+                context = context[:limit]
+
+            if context and len(context.strip()) > 0:
+                return _POPQA_WITH_CTX_FMT.format_map({"ctx": context, "q": question})
+            return _POPQA_NO_CTX_FMT.format_map({"q": question})
+        return fmt
 
     @staticmethod
-    def _format_pubqa(question: str, context: Optional[str] = None, model_name: str = "selfrag_llama2_7b") -> str:
+    def _format_pubqa(model_name: str, limit: int) -> Callable[[str, Optional[str]], str]:
         """
         PubQA 模板: 严格区分 Llama 和 Self-RAG 格式
         """
-
-        limit = settings.params.get('context_max_len', 4000)
-        # 1. 截断逻辑 (CRAG 官方限制)
-        if context and len(context) > limit:
-            context = context[:limit]
-
-        # 2. 判断是否是 Self-RAG 模型
+        # 判断是否是 Self-RAG 模型
         # 只要模型名字里带 "selfrag"，就走特殊格式
         is_selfrag = "selfrag" in model_name.lower()
 
         if not is_selfrag:
             # === 普通 Llama 格式 ===
-            if context:
-                prompt = (
-                    f"Read the documents and answer the question: Is the following statement correct or not? \n\n"
-                    f"Documents: {context}\n\n"
-                    f"Statement: {question}\n\n"
-                    f"Only say true if the statement is true; otherwise say false."
-                )
-            else:
-                prompt = (
-                    f"Is the following statement correct or not? \n\n"
-                    f"Statement: {question}\n\n"
-                    f"Only say true if the statement is true; otherwise say false."
-                )
-        else:
-            # === Self-RAG 专用格式 (CRAG_Inference.py lines 64-69) ===
-            # 格式解析: 
-            # ### Instruction:
-            # [Task Instruction]
-            # ## Input:
-            # [Question]
-            # ### Response:
-            # [Retrieval]<paragraph>[Context]</paragraph>
-            
-            base_instruction = PromptBuilder.TASK_INST.get("pubqa")
-            # 拼接 Instruction 和 Input
-            full_instruction = f"{base_instruction}\n\n## Input:\n\n{question}"
-            
-            prompt = f"### Instruction:\n{full_instruction}\n\n### Response:\n"
-            
+            def fmt(question: str, context: Optional[str] = None) -> str:
+                # 截断逻辑 (CRAG 官方限制)
+                if context and len(context) > limit:
+                    context = context[:limit]
+                if context:
+                    return _PUBQA_WITH_CTX_FMT.format_map({"ctx": context, "q": question})
+                return _PUBQA_NO_CTX_FMT.format_map({"q": question})
+            return fmt
+
+        # === Self-RAG 专用格式 (CRAG_Inference.py lines 64-69) ===
+        # 格式解析: 
+        # ### Instruction:
+        # [Task Instruction]
+        # ## Input:
+        # [Question]
+        # ### Response:
+        # [Retrieval]<paragraph>[Context]</paragraph>
+        base_instruction = PromptBuilder.TASK_INST.get("pubqa")
+        instruction_head = "### Instruction:\n" + base_instruction + "\n\n## Input:\n\n"
+
+        def fmt(question: str, context: Optional[str] = None) -> str:
+            # 截断逻辑 (CRAG 官方限制)
+            if context and len(context) > limit:
+                context = context[:limit]
+            # 拼接 Instruction 和 Input；各段收进 list 最后一次 join，长上下文不会被反复拷贝
+            parts = [instruction_head, question, "\n\n### Response:\n"]
             if context:
                 # Self-RAG 的核心：必须用 [Retrieval]<paragraph> 包裹内容
-                prompt += f"[Retrieval]<paragraph>{context}</paragraph>"
-        
-        return prompt
+                parts += ("[Retrieval]<paragraph>", context, "</paragraph>")
+            return "".join(parts)
+        return fmt
 
     @staticmethod
-    def _format_default(question: str, context: Optional[str] = None, task: str = None) -> str:
+    def _format_default(task: str) -> Callable[[str, Optional[str]], str]:
         instruction = PromptBuilder.TASK_INST.get(task, "Answer the question.")
-        if context:
-            prompt = (
-                f"Refer to the following documents, follow the instruction and answer the question.\n\n"
-                f"Documents: {context}\n\n"
-                f"Instruction: {instruction}\nInput: {question}"
-            )
-        else:
-            prompt = f"Instruction: {instruction}\nInput: {question}"
-        return prompt
+
+        def fmt(question: str, context: Optional[str] = None) -> str:
+            if context:
+                return (
+                    f"Refer to the following documents, follow the instruction and answer the question.\n\n"
+                    f"Documents: {context}\n\n"
+                    f"Instruction: {instruction}\nInput: {question}"
+                )
+            return f"Instruction: {instruction}\nInput: {question}"
+        return fmt
+
+
+@lru_cache(maxsize=32)
+def _make_formatter(task: str, model_name: str, context_max_len: int) -> Callable[[str, Optional[str]], str]:
+    if task == "popqa":
+        # PopQA 在官方代码中格式比较特殊，通常不依赖模型区分
+        return PromptBuilder._format_popqa(context_max_len)
+    elif task == "pubqa":
+        return PromptBuilder._format_pubqa(model_name, context_max_len)
+    else:
+        return PromptBuilder._format_default(task)
@@ -1,18 +1,24 @@
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Sequence, Tuple
 
-@dataclass
+import numpy as np
+
+@dataclass(slots=True)
 class AgentState:
     """
     Agent 在一次 Batch 执行中的上下文状态。
+    slots=True：节点间频繁读写字段，省掉实例 __dict__ 的查找和内存。
     """
     # 1. 基础输入 (必填)
-    ids: List[int]
+    ids: Sequence[int]  # list 或 range
     queries: List[str]
     raw_docs: List[List[str]] # 维度: [Batch, 10]
+    # (可选) 预先编码好的 (query, doc) token：(int32 扁平数组, int64 偏移)，按 raw_docs 行优先排列
+    pair_tokens: Optional[Tuple[np.ndarray, np.ndarray]] = None
        
     # 2. 中间状态 (过程中填充)
-    scores: Optional[List[List[float]]] = None # Evaluator 打分
+    # Evaluator 打分，(Batch, ndocs) float32 矩阵；文档数不足的空位为 -inf
+    scores: Optional[np.ndarray] = None
     flags: Optional[List[str]] = None          # Correct/Incorrect/Ambiguous
     search_queries: Optional[List[str]] = None # (未来) 搜索词
     final_contexts: Optional[List[str]] = None # 最终选定的知识片段
@@ -1,9 +1,17 @@
+import logging
+import threading
 from abc import ABC, abstractmethod
 from typing import List, Union, Any, Optional
 
 # 假设这是我们之后要写的装饰器，先占个位，或者暂时不引用
 # from utils.tracing import trace_tool 
 
+logger = logging.getLogger(__name__)
+
+# 进程内共享的工具实例：(类, 构造参数) -> 实例，见 BaseTool.get
+_INSTANCES: dict = {}
+_INSTANCES_LOCK = threading.Lock()
+
 class BaseTool(ABC):
     """
     所有 Agent 工具的基类。
@@ -13,6 +21,21 @@ class BaseTool(ABC):
     3. 可观测性：(未来) 统一集成日志追踪。
     """
 
+    @classmethod
+    def get(cls, *args, **kwargs) -> "BaseTool":
+        """
+        取进程内共享的实例：同一个类、同样的构造参数只构造一次。
+        GeneratorTool / EvaluatorTool 的构造会把整份权重加载进显存，
+        main.py、测试脚本、在线服务在同一进程里各建一份就会重复占用显存。
+        参数必须可哈希（路径、数字、布尔值）。
+        """
+        key = (cls, args, tuple(sorted(kwargs.items())))
+        with _INSTANCES_LOCK:
+            inst = _INSTANCES.get(key)
+            if inst is None:
+                inst = _INSTANCES[key] = cls(*args, **kwargs)
+        return inst
+
     @abstractmethod
     def _run_batch(self, inputs: List[Any], ids: Optional[List[str]] = None, **kwargs) -> List[Any]:
         """
@@ -27,13 +50,16 @@ class BaseTool(ABC):
         它负责：适配输入 -> 调用子类逻辑 -> 适配输出
         """
         
-        # 1. 输入适配：全部转为 List
-        batched_inputs, is_single_input = self._ensure_list(inputs)
+        # 1. 输入适配：全部转为 List（Agent 里几乎总是 list，直接走快路径）
+        if type(inputs) is list:
+            batched_inputs, is_single_input = inputs, False
+        else:
+            batched_inputs, is_single_input = self._ensure_list(inputs)
         
         # 2. ID 适配：如果有 ID，也得转 List，且长度必须对齐
         batched_ids = None
         if ids is not None:
-            batched_ids, is_single_id = self._ensure_list(ids)
+            batched_ids = ids if type(ids) is list else self._ensure_list(ids)[0]
             # 【防御性编程】断言：输入数量和ID数量必须一致
             if len(batched_inputs) != len(batched_ids):
                 raise ValueError(f"Batch size mismatch: inputs({len(batched_inputs)}) vs ids({len(batched_ids)})")
@@ -44,7 +70,7 @@ class BaseTool(ABC):
             batched_outputs = self._run_batch(batched_inputs, ids=batched_ids, **kwargs)
         except Exception as e:
             # 【防御性编程】简单的错误兜底，防止整个 Batch 崩溃
-            print(f"[Error] Tool {self.__class__.__name__} failed: {e}")
+            logger.error("[Error] Tool %s failed: %s", self.__class__.__name__, e)
             return [] if not is_single_input else None
 
         # 4. 输出适配：如果进来是单个，出去也要拆包成单个
@@ -1,43 +1,120 @@
+import numpy as np
 import torch
-from typing import List, Optional
+from typing import List, Optional, Sequence
 from transformers import AutoTokenizer, T5ForSequenceClassification
 from .base_tool import BaseTool
 
+# 按长度排序后每个子批的大小：同一子批内长度接近，padding 浪费很少
+EVAL_MICRO_BATCH = 32
+# Query [SEP] Doc 拼接模板；str.format 是 C 实现，map 过去不需要逐条执行 f-string 字节码
+_PAIR_FMT = "{} [SEP] {}"
+
+
+def _pick_dtype(device: str) -> torch.dtype:
+    """
+    GPU 支持 bf16 就用 bf16（Tensor Core 吞吐翻倍、显存流量减半），否则保持 fp32。
+    不用 fp16：T5 的 FFN 激活在 fp16 下会溢出成 inf/NaN，打分直接失真。
+    """
+    if str(device).startswith("cuda") and torch.cuda.is_available() and torch.cuda.is_bf16_supported():
+        return torch.bfloat16
+    return torch.float32
+
+
+def _maybe_compile(model, device: str, enabled: bool):
+    """
+    torch.compile 把 T5 的 LayerNorm / FFN 等小算子融合成少量 kernel，减少 launch 开销。
+    输入是按长度分桶、pad 到 8 的倍数的变长序列，用 dynamic=True 避免每个新长度都重新编译；
+    不用 reduce-overhead：CUDA Graph 要求固定形状，变长输入下会反复录制。
+    默认关闭（settings.yaml 的 evaluator_compile）：首次遇到新形状时编译要几十秒，
+    长时间跑的离线评测 / 在线服务才划算。
+    """
+    if not enabled or not str(device).startswith("cuda") or not hasattr(torch, "compile"):
+        return model
+    try:
+        return torch.compile(model, dynamic=True)
+    except Exception as e:
+        print(f"⚠️ [Evaluator] torch.compile unavailable, using eager model: {e}")
+        return model
+
+
 class EvaluatorTool(BaseTool):
-    def __init__(self, model_path: str, device: str = "cuda:0"):
+    def __init__(self, model_path: str, device: str = "cuda:0", compile_model: bool = False):
         print(f"⚖️ [Evaluator] Loading T5 from {model_path}...")
         self.device = device
+        self.dtype = _pick_dtype(device)
         
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.model = T5ForSequenceClassification.from_pretrained(model_path, num_labels=1)
+        # 注意力保持默认实现：T5 的相对位置偏置加在注意力分数上，flash-attention 路径不支持
+        self.model = T5ForSequenceClassification.from_pretrained(model_path, num_labels=1, torch_dtype=self.dtype)
         self.model.to(device)
         self.model.eval()
+        eager = self.model
+        self.model = _maybe_compile(eager, device, compile_model)
         
-        print("✅ [Evaluator] Loaded successfully.")
-
-    def _run_batch(self, inputs: List[str], ids: Optional[List[str]] = None, **kwargs) -> List[float]:
-        """
-        inputs: 已经是拼接好的 "Query [SEP] Doc" 字符串列表
-        """
-        # Tokenize
-        tokenized = self.tokenizer(
-            inputs, 
-            return_tensors="pt",
-            padding=True, 
-            truncation=True, 
-            max_length=512
-        ).to(self.device)
-
-        # Inference
-        with torch.no_grad():
-            outputs = self.model(
-                input_ids=tokenized.input_ids,
-                attention_mask=tokenized.attention_mask
-            )
-            # CRAG Inference.py 第 175 行: scores.append(float(outputs["logits"].cpu()))
-            # 直接取 logits，不经过 sigmoid
-            logits = outputs.logits.squeeze(-1).cpu().tolist()
-            
+        print(f"✅ [Evaluator] Loaded successfully. (dtype={self.dtype}, compiled={self.model is not eager})")
+
+    def encode_pairs(self, queries: List[str], docs: List[str]) -> List[List[int]]:
+        """
+        把 (query, doc) 对编码成 token id（不 padding），与 run_pair 内部的编码完全一致。
+        BatchDataLoader 在预取线程里调用它，提前准备好下一批的 token。
+        """
+        return self._encode(list(map(_PAIR_FMT.format, queries, docs)))
+
+    def _encode(self, inputs: List[str]) -> List[List[int]]:
+        # Tokenize：先不 padding，拿到每条的真实长度
+        return self.tokenizer(
+            inputs,
+            padding=False,
+            truncation=True,
+            max_length=512,
+        )["input_ids"]
+
+    def _run_batch(self, inputs: List, ids: Optional[List[str]] = None, **kwargs) -> List[float]:
+        """
+        inputs: 已经是拼接好的 "Query [SEP] Doc" 字符串列表；
+                pretokenized=True 时是 encode_pairs 产出的 token id 序列（list 或 int 数组）
+        """
+        input_ids: Sequence = inputs if kwargs.get("pretokenized") else self._encode(inputs)
+        lengths = np.fromiter(map(len, input_ids), dtype=np.int64, count=len(input_ids))
+        # 按长度排序后分子批：短的 query/doc 对不再被补齐到整批最长的 512
+        order = np.argsort(lengths, kind="stable").tolist()
+        pad_id = self.tokenizer.pad_token_id or 0
+        # CPU 上先在锁页内存里拼好矩阵，拷到 GPU 时可以异步 DMA
+        pin = str(self.device).startswith("cuda") and torch.cuda.is_available()
+
+        # 各子批的 logits 先留在 GPU 上，最后一次性拷回：
+        # .cpu() 会同步等 GPU 算完，放在循环里就无法在 GPU 跑当前子批时准备下一个子批
+        chunks = []
+        with torch.inference_mode():
+            for start in range(0, len(order), EVAL_MICRO_BATCH):
+                idx = order[start:start + EVAL_MICRO_BATCH]
+                lens = lengths[idx]
+                # 右侧 padding 到批内最长，序列长度对齐到 8 的倍数，bf16 GEMM 才能用满 Tensor Core
+                # （与 tokenizer.pad(padding="longest", pad_to_multiple_of=8) 的结果相同）
+                width = -(-int(lens.max(initial=1)) // 8) * 8
+                ids_mat = np.full((len(idx), width), pad_id, dtype=np.int64)
+                for row, i in enumerate(idx):
+                    ids_mat[row, :lengths[i]] = input_ids[i]
+                mask_mat = (np.arange(width) < lens[:, None]).astype(np.int64)
+
+                batch_ids = torch.from_numpy(ids_mat)
+                batch_mask = torch.from_numpy(mask_mat)
+                if pin:
+                    batch_ids, batch_mask = batch_ids.pin_memory(), batch_mask.pin_memory()
+                outputs = self.model(
+                    input_ids=batch_ids.to(self.device, non_blocking=True),
+                    attention_mask=batch_mask.to(self.device, non_blocking=True),
+                )
+                # CRAG Inference.py 第 175 行: scores.append(float(outputs["logits"].cpu()))
+                # 直接取 logits，不经过 sigmoid
+                chunks.append(outputs.logits.view(-1).float())
+
+            flat = torch.cat(chunks).cpu().tolist() if chunks else []
+
+        # flat 按 order 排列，按原顺序写回
+        logits: List[float] = [0.0] * len(lengths)
+        for i, v in zip(order, flat):
+            logits[i] = v
         return logits
     
     def run_pair(self, queries: List[str], docs: List[str], ids: Optional[List[str]] = None) -> List[float]:
@@ -48,7 +125,14 @@ class EvaluatorTool(BaseTool):
             raise ValueError(f"Batch mismatch: Queries({len(queries)}) vs Docs({len(docs)})")
         
         # 官方代码逻辑：Query + ' [SEP] ' + Doc
-        # 注意：[SEP] 前后各有一个空格
-        inputs = [f"{q} [SEP] {d}" for q, d in zip(queries, docs)]
+        # 注意：[SEP] 前后各有一个空格。评估器就是用这个字面串训练的，
+        # 不能换成 tokenizer 的句对编码（T5 会插 </s> 而不是 [SEP]），打分会漂移
+        inputs = list(map(_PAIR_FMT.format, queries, docs))
         
-        return self.run(inputs, ids=ids)
\ No newline at end of file
+        return self.run(inputs, ids=ids)
+
+    def run_tokens(self, input_ids: List, ids: Optional[List[str]] = None) -> List[float]:
+        """
+        对 encode_pairs 预先编码好的 (query, doc) 对打分，跳过字符串拼接和 tokenize。
+        """
+        return self.run(input_ids, ids=ids, pretokenized=True)
\ No newline at end of file
@@ -1,5 +1,7 @@
-from typing import List, Optional, Any
+from typing import AsyncIterator, List, Optional, Any
+import asyncio
 import re
+import uuid
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
@@ -9,64 +11,196 @@ except ModuleNotFoundError:
     LLM = None
     SamplingParams = None
 
+try:
+    # 在线服务用的异步引擎：逐 token 流式输出，并发请求在引擎内 continuous batching
+    from vllm.engine.arg_utils import AsyncEngineArgs  # type: ignore
+    from vllm.engine.async_llm_engine import AsyncLLMEngine  # type: ignore
+except ModuleNotFoundError:
+    AsyncEngineArgs = None
+    AsyncLLMEngine = None
+
 from .base_tool import BaseTool
 
+# transformers 回退路径每次 generate 的 prompt 条数
+HF_GEN_BATCH = 8
+
+# Self-RAG 的反思 token（[Retrieval]、[Utility:5] 等）和 <paragraph> 标签，模块级预编译。
+# [Utility:N] 要先单独去掉：前面有落单的 "[" 时，通用的 \[[^\]]*\] 会把两者连在一起吞掉
+_UTILITY_RE = re.compile(r"\[Utility:\d+\]")
+_CLEAN_RE = re.compile(r"\[[^\]]*\]|</?paragraph>")
+
+
+def _stable_prefix(clean: str) -> str:
+    """
+    clean 是已清洗的累计文本，返回后续 token 不会再改变的前缀：
+    第一个残留的 "["（之后还可能闭合成反思 token）、
+    结尾处可能是半个 <paragraph> 标签的 "<..." 之前，以及末尾空白之前。
+    """
+    cut = clean.find("[")
+    if cut < 0:
+        cut = len(clean)
+    lt = clean.rfind("<", 0, cut)
+    if lt >= 0 and ">" not in clean[lt:cut] and (
+        "<paragraph>".startswith(clean[lt:cut]) or "</paragraph>".startswith(clean[lt:cut])
+    ):
+        cut = lt
+    return clean[:cut].rstrip()
+
 
 class GeneratorTool(BaseTool):
-    def __init__(self, model_path: str, max_model_len: int = 4096, gpu_utilization: float = 0.9):
+    def __init__(
+        self,
+        model_path: str,
+        max_model_len: int = 4096,
+        gpu_utilization: float = 0.9,
+        enable_prefix_caching: bool = True,
+        max_num_seqs: int = 256,
+        max_num_batched_tokens: Optional[int] = 8192,
+        async_engine: bool = False,
+    ):
         """
         Generator tool with vLLM when available; falls back to transformers.generate on Windows.
+        enable_prefix_caching / max_num_seqs / max_num_batched_tokens 只对 vLLM 生效：
+        同一批 prompt 共用的指令前缀只 prefill 一次，KV cache 在请求间复用
+        async_engine: 在线服务用 AsyncLLMEngine 代替离线的 LLM，支持 stream()；
+                      需要先 bind_loop() 绑定服务的事件循环
         """
         self.backend = "vllm" if LLM is not None else "hf"
         self.max_model_len = max_model_len
         self.max_tokens = 100
         self.temperature = 0.0
+        self.llm = None
+        self.engine = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
         if self.backend == "vllm":
             print(f"🚀 [Generator] Initializing vLLM from: {model_path} ...")
-            self.llm = LLM(
+            engine_kwargs = dict(
                 model=model_path,
                 dtype="half",
                 max_model_len=max_model_len,
+                gpu_memory_utilization=gpu_utilization,
+                enable_prefix_caching=enable_prefix_caching,
+                max_num_seqs=max_num_seqs,
+                # 分块 prefill 的 token 上限不能小于单条序列的最大长度
+                max_num_batched_tokens=max(max_num_batched_tokens, max_model_len) if max_num_batched_tokens else None,
             )
+            if async_engine and AsyncLLMEngine is not None:
+                self.engine = AsyncLLMEngine.from_engine_args(AsyncEngineArgs(**engine_kwargs))
+            else:
+                self.llm = LLM(**engine_kwargs)
             self.default_params = SamplingParams(
                 temperature=self.temperature,
                 top_p=1.0,
                 max_tokens=self.max_tokens,
                 skip_special_tokens=False,
             )
+            # (temperature, max_tokens) -> SamplingParams，参数不变时每批复用同一个对象
+            self._sp_cache = {(self.temperature, self.max_tokens): self.default_params}
             print("✅[Generator] vLLM model loaded successfully.")
         else:
             print("⚠️ [Generator] vLLM not available; using transformers.generate instead.")
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
-            self.tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=False)
+            # Rust 实现的 fast tokenizer；模型没有 fast 版本时 AutoTokenizer 会自动退回慢速版
+            self.tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+            # 批量 generate：decoder-only 模型必须左侧 padding，生成部分才是对齐的
+            self.tokenizer.padding_side = "left"
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
             self.model = AutoModelForCausalLM.from_pretrained(model_path)
             self.model.to(self.device)
             self.model.eval()
 
     def _clean_text(self, text: str) -> str:
         clean_text = text.replace("\n", " ").replace("\r", "")
-        clean_text = re.sub(r"\[Utility:\d+\]", "", clean_text)
-        clean_text = re.sub(r"\[.*?\]", "", clean_text)
-        clean_text = re.sub(r"</?paragraph>", "", clean_text)
-        return clean_text.strip()
+        clean_text = _UTILITY_RE.sub("", clean_text)
+        return _CLEAN_RE.sub("", clean_text).strip()
 
-    def _run_batch(self, inputs: List[str], ids: Optional[List[str]] = None, **kwargs) -> List[str]:
-        temperature = kwargs.get("temperature", self.temperature)
-        max_tokens = int(kwargs.get("max_tokens", self.max_tokens))
-
-        if self.backend == "vllm":
-            params = SamplingParams(
+    def _sampling_params(self, temperature: float, max_tokens: int):
+        key = (temperature, max_tokens)
+        params = self._sp_cache.get(key)
+        if params is None:
+            params = self._sp_cache[key] = SamplingParams(
                 temperature=temperature,
                 top_p=1.0,
                 max_tokens=max_tokens,
                 skip_special_tokens=False,
             )
-            outputs = self.llm.generate(inputs, params, use_tqdm=False)
+        return params
+
+    @property
+    def supports_streaming(self) -> bool:
+        return self.engine is not None
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """AsyncLLMEngine 跑在服务的事件循环上；_run_batch 在线程池里调用时把请求投递回这个循环。"""
+        self._loop = loop
+
+    def _engine_generate(self, inputs: List[str], params) -> List[str]:
+        if self._loop is None:
+            raise RuntimeError("GeneratorTool async engine is not bound to an event loop")
+
+        async def one(prompt: str) -> str:
+            final = None
+            async for out in self.engine.generate(prompt, params, uuid.uuid4().hex):
+                final = out
+            return final.outputs[0].text if final is not None else ""
+
+        async def run_all() -> List[str]:
+            # 整批一起提交，引擎内部合成同一个 continuous batch
+            return await asyncio.gather(*map(one, inputs))
+
+        return asyncio.run_coroutine_threadsafe(run_all(), self._loop).result()
+
+    async def stream(
+        self, prompt: str, temperature: Optional[float] = None, max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        逐 token 流式生成，输出与 _run_batch 的 _clean_text 结果一致：
+        反思 token / <paragraph> 标签可能跨多个 token，未闭合的 "[" 或半个标签之后的内容先扣住，
+        闭合后再决定是否输出；末尾空白等下一段到来再输出，最终等价于 strip()。
+        """
+        if self.engine is None:
+            raise RuntimeError("GeneratorTool.stream requires async_engine=True with vLLM")
+        params = self._sampling_params(
+            self.temperature if temperature is None else temperature,
+            int(self.max_tokens if max_tokens is None else max_tokens),
+        )
+        req_id = uuid.uuid4().hex
+        emitted = 0
+        finished = False
+        raw = ""
+        try:
+            async for out in self.engine.generate(prompt, params, req_id):
+                raw = out.outputs[0].text
+                finished = out.finished
+                clean = self._clean_text(raw)
+                stable = len(_stable_prefix(clean))
+                if stable > emitted:
+                    yield clean[emitted:stable]
+                    emitted = stable
+        finally:
+            if not finished:
+                # 调用方取消 / 提前结束：释放引擎里的槽位和 KV cache
+                await self.engine.abort(req_id)
+
+        clean = self._clean_text(raw)
+        if len(clean) > emitted:
+            yield clean[emitted:]
+
+    def _run_batch(self, inputs: List[str], ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        temperature = kwargs.get("temperature", self.temperature)
+        max_tokens = int(kwargs.get("max_tokens", self.max_tokens))
+
+        if self.backend == "vllm":
+            params = self._sampling_params(temperature, max_tokens)
+            if self.engine is not None:
+                texts = self._engine_generate(inputs, params)
+            else:
+                texts = [output.outputs[0].text for output in self.llm.generate(inputs, params, use_tqdm=False)]
 
             results = []
-            for output in outputs:
-                text = output.outputs[0].text
+            for text in texts:
                 results.append(self._clean_text(text))
 
             if len(results) < len(inputs):
@@ -74,9 +208,12 @@ class GeneratorTool(BaseTool):
             return results
 
         # transformers fallback path (CPU/GPU depending on availability)
-        results: List[str] = []
-        for prompt in inputs:
-            encoded = self.tokenizer(prompt, return_tensors="pt")
+        # 按长度排序后每 HF_GEN_BATCH 条一起 tokenize + generate，padding 少、kernel 调用少
+        results: List[str] = [""] * len(inputs)
+        order = sorted(range(len(inputs)), key=lambda i: len(inputs[i]))
+        for start in range(0, len(order), HF_GEN_BATCH):
+            idx = order[start:start + HF_GEN_BATCH]
+            encoded = self.tokenizer([inputs[i] for i in idx], return_tensors="pt", padding=True)
             encoded = {k: v.to(self.device) for k, v in encoded.items()}
             with torch.no_grad():
                 output_ids = self.model.generate(
@@ -84,12 +221,14 @@ class GeneratorTool(BaseTool):
                     max_new_tokens=max_tokens,
                     do_sample=temperature > 0,
                     temperature=max(temperature, 1e-5),
-                    pad_token_id=self.tokenizer.eos_token_id,
+                    pad_token_id=self.tokenizer.pad_token_id,
                     eos_token_id=self.tokenizer.eos_token_id,
                 )
-            generated = output_ids[0][encoded["input_ids"].shape[1]:]
-            text = self.tokenizer.decode(generated, skip_special_tokens=True)
-            results.append(self._clean_text(text))
+            # 左 padding 后所有 prompt 的结尾对齐，生成部分统一从 prompt 长度处开始
+            generated = output_ids[:, encoded["input_ids"].shape[1]:]
+            texts = self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+            for i, text in zip(idx, texts):
+                results[i] = self._clean_text(text)
 
         if len(results) < len(inputs):
             results.extend([""] * (len(inputs) - len(results)))
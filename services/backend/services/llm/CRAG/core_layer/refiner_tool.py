@@ -1,7 +1,46 @@
+import hashlib
+import logging
+import mmap
 import os
+import threading
+from pathlib import Path
 from typing import List, Optional, Union
+
+import numpy as np
+
 from .base_tool import BaseTool
 
+# 知识库行偏移的磁盘缓存目录：文件没变时启动直接读偏移数组，跳过换行扫描
+CACHE_DIR = Path(os.getenv("CRAG_CACHE_DIR") or Path.home() / ".cache" / "crag")
+
+logger = logging.getLogger(__name__)
+
+# 进程内共享已加载的知识库：(绝对路径, mtime, size) -> _LineStore。
+# main.py / 测试脚本 / 在线服务里多次构造 RefinerTool 时不会重复打开和扫描同一个文件
+_STORES: dict = {}
+_STORES_LOCK = threading.Lock()
+
+
+class _LineStore:
+    """
+    整个知识库文件以只读 mmap 映射 + 每行的起止偏移（int64 数组），
+    取第 idx 行时才切片、解码、strip。
+    文件内容留在 OS page cache 里按需换页，不占 Python 堆；多个进程打开同一个文件时物理页共享。
+    """
+    __slots__ = ("data", "starts", "ends")
+
+    def __init__(self, data: Union[bytes, mmap.mmap], starts: np.ndarray, ends: np.ndarray):
+        self.data = data
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, idx: int) -> str:
+        # 与原来逐行 line.strip() 的结果一致（\r\n 的 \r 也会被 strip 掉）
+        return self.data[self.starts[idx]:self.ends[idx]].decode("utf-8").strip()
+
 class RefinerTool(BaseTool):
     def __init__(self, internal_path: str, external_path: str, combined_path: str):
         """
@@ -27,10 +66,70 @@ class RefinerTool(BaseTool):
         count = len(self.knowledge_base['internal'])
         print(f"✅ [Refiner] Loaded successfully. (Approx {count} docs per file)")
 
-    def _load_file(self, path: str) -> List[str]:
-        with open(path, 'r', encoding='utf-8') as f:
-            # 同样保留原始格式，strip掉换行符
-            return [line.strip() for line in f.readlines()]
+    def _load_file(self, path: str) -> _LineStore:
+        # 缓存键 = 绝对路径 + mtime + 文件大小，源文件一改就失效
+        abs_path = os.path.abspath(path)
+        st = os.stat(abs_path)
+        key = (abs_path, st.st_mtime_ns, st.st_size)
+        with _STORES_LOCK:
+            store = _STORES.get(key)
+            if store is None:
+                store = _STORES[key] = self._open_store(path, abs_path, st)
+        return store
+
+    def _open_store(self, path: str, abs_path: str, st: os.stat_result) -> _LineStore:
+        data = self._map_file(abs_path)
+
+        path_key = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()[:16]
+        ver_key = hashlib.sha1(f"{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()[:16]
+        cache_file = CACHE_DIR / f"refiner_{path_key}_{ver_key}.npz"
+
+        # 偏移缓存存在说明这个版本的文件在写缓存时已经校验过编码，不用再整文件解码一遍
+        try:
+            with np.load(cache_file) as z:
+                return _LineStore(data, z["starts"], z["ends"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("⚠️ [Refiner] Cache unreadable, reloading %s: %s", path, e)
+
+        # 和原来的文本模式读取一样：编码不对在加载时就报错，而不是查到那一行才报
+        data[:].decode("utf-8")
+
+        # 向量化找出所有换行符；最后一行没有换行结尾时补上文件末尾
+        newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 0x0A)
+        ends = newlines
+        if len(data) and data[-1:] != b"\n":
+            ends = np.append(ends, len(data))
+        starts = np.concatenate(([0], newlines + 1))[:len(ends)]
+
+        self._write_cache(cache_file, path_key, starts, ends)
+        return _LineStore(data, starts, ends)
+
+    @staticmethod
+    def _map_file(abs_path: str) -> Union[bytes, mmap.mmap]:
+        with open(abs_path, "rb") as f:
+            try:
+                # 映射建立后关闭文件描述符不影响 mmap
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # 空文件不能 mmap
+                return b""
+
+    @staticmethod
+    def _write_cache(cache_file: Path, path_key: str, starts: np.ndarray, ends: np.ndarray):
+        """写缓存失败（只读目录、磁盘满）不影响加载，只是下次还走慢路径。"""
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # 同一个源文件的旧版本缓存直接删掉，避免目录越积越大
+            for old in CACHE_DIR.glob(f"refiner_{path_key}_*"):
+                old.unlink(missing_ok=True)
+            tmp = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, starts=starts, ends=ends)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            logger.warning("⚠️ [Refiner] Failed to write cache %s: %s", cache_file, e)
 
     def _run_batch(self, inputs: List[int], ids: Optional[List[str]] = None, **kwargs) -> List[str]:
         """
@@ -47,20 +146,19 @@ class RefinerTool(BaseTool):
             valid_keys = list(self.knowledge_base.keys())
             raise ValueError(f"[Refiner] Unknown knowledge type: '{k_type}'. Valid types: {valid_keys}")
 
-        results = []
+        # 2. 这里的 input 必须是 int，整批先检查一遍
         for idx in inputs:
-            # 2. 这里的 input 必须是 int
             if not isinstance(idx, int):
                 # 如果传入了 query string，说明调用方搞错了，这里做个转换或报错
                 # 暂时报错，强制要求上游传入 index
                 raise TypeError(f"Refiner tool expects List[int] indices, got {type(idx)}")
 
-            # 3. 查表获取文档
-            if 0 <= idx < len(target_kb):
-                results.append(target_kb[idx])
-            else:
-                # 越界兜底：通常不应该发生，除非 input_file 和 ref 文件行数不一致
-                print(f"⚠️ [Refiner] Index {idx} out of bounds for {k_type} (len={len(target_kb)})")
-                results.append("") 
+        # 3. 查表获取文档
+        n = len(target_kb)
+        results = [target_kb[idx] if 0 <= idx < n else "" for idx in inputs]
+        bad = sum(1 for idx in inputs if not 0 <= idx < n)
+        if bad:
+            # 越界兜底：通常不应该发生，除非 input_file 和 ref 文件行数不一致；整批只打一条
+            logger.warning("⚠️ [Refiner] %d indices out of bounds for %s (len=%d)", bad, k_type, n)
                 
         return results
\ No newline at end of file
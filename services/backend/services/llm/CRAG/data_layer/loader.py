@@ -1,82 +1,112 @@
 import os
-from typing import List, Dict, Generator
-from tqdm import tqdm
+from itertools import chain, islice
+from typing import Callable, List, Dict, Generator, Iterator, Optional
+
+import numpy as np
 
 class BatchDataLoader:
-    def __init__(self, input_file_path: str, batch_size: int = 8, ndocs: int = 10):
+    def __init__(self, input_file_path: str, batch_size: int = 8, ndocs: int = 10, sort_by_length: bool = False,
+                 sort_window: int = 16, start: int = 0,
+                 pair_encoder: Optional[Callable[[List[str], List[str]], List[List[int]]]] = None):
         """
         input_file_path: 对应 test_popqa.txt
         batch_size: 批处理大小
         ndocs: 每个问题对应的检索文档数 (CRAG 默认为 10)
+        sort_by_length: 按问题+文档的字符长度排序后再切 batch，同一批长度相近，
+                        生成时不会被批内最长的那条拖慢；输出顺序由调用方按 ids 还原
+        sort_window: 排序只在连续 sort_window 个 batch 的样本内进行，
+                     内存里最多留 sort_window * batch_size 个样本，乱序也不会跨出这个窗口
+        start: 跳过前 start 个问题（断点续跑），ids 仍是问题在文件里的原始序号
+        pair_encoder: 通常是 EvaluatorTool.encode_pairs。给出时每个 batch 额外带上
+                      "pair_tokens"：整批 (query, doc) 对的 token id，按 raw_docs 行优先拍平，
+                      存成 (int32 扁平数组, int64 偏移) 两列。get_batches 跑在预取线程里，
+                      tokenize 和 GPU 推理重叠，evaluate 时不用再拼字符串、再编码
         """
+        if not os.path.exists(input_file_path):
+            raise FileNotFoundError(f"{input_file_path} not found")
+        self.path = input_file_path
         self.batch_size = batch_size
         self.ndocs = ndocs
-        self.data = self._load_data(input_file_path)
-        print(f"📦 [DataLoader] Successfully loaded {len(self.data)} questions from {input_file_path}")
+        self.sort_by_length = sort_by_length
+        self.sort_window = max(1, sort_window)
+        self.pair_encoder = pair_encoder
 
-    def _load_data(self, path):
-        if not os.path.exists(path):
-            raise FileNotFoundError(f"{path} not found")
+        # 初始化时只数一遍行数（按字节顺序读，不解码、不保留内容），
+        # 样本在迭代时才逐块解析，不排序时内存里只有当前 batch
+        with open(input_file_path, 'rb') as f:
+            self.total = sum(1 for _ in f) // self.ndocs
+        self.start = min(max(0, start), self.total)
+        print(f"📦 [DataLoader] Found {self.total} questions in {input_file_path}")
 
-        samples = []
-        
-        print(f"⏳ [DataLoader] Parsing file...")
-        with open(path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            
-        # 计算总问题数
-        total_questions = len(lines) // self.ndocs
+    def __len__(self) -> int:
+        """batch 数（已扣除 start 跳过的问题）"""
+        if self.batch_size <= 0:
+            return 0
+        return (self.total - self.start + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self) -> Iterator[Dict[str, List]]:
+        return self.get_batches()
+
+    def _iter_samples(self) -> Iterator[Dict]:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            # 跳过前 start 个问题的行；多余的不足 ndocs 行的尾巴和原来一样丢弃
+            lines = islice(f, self.start * self.ndocs, self.total * self.ndocs)
+            for i in range(self.start, self.total):
+                # 取出属于当前问题的 chunk (ndocs行)
+                yield self._parse_sample(i, list(islice(lines, self.ndocs)))
+
+    @staticmethod
+    def _parse_sample(i: int, chunk: List[str]) -> Dict:
+        # 1. 提取 Question (取 Chunk 的第一行即可)
+        # 格式: "Who is ... [SEP] Doc..."
+        first_line = chunk[0].strip()
+        parts = first_line.split(" [SEP] ") # 注意空格
         
-        for i in tqdm(range(total_questions), desc="Loading Data"):
-            # 取出属于当前问题的 chunk (ndocs行)
-            chunk = lines[i*self.ndocs : (i+1)*self.ndocs]
-            
-            # 1. 提取 Question (取 Chunk 的第一行即可)
-            # 格式: "Who is ... [SEP] Doc..."
-            first_line = chunk[0].strip()
-            parts = first_line.split(" [SEP] ") # 注意空格
+        if len(parts) >= 1:
+            question = parts[0]
+        else:
+            question = "" # 异常数据兜底
+
+        # 2. 提取 10 个 Pure Docs (不含 Query，不含 [SEP])
+        raw_docs = []
+        for line in chunk:
+            # 去掉行末可能的 label (比如 "\t0")
+            line_content = line.strip().split("\t")[0]
             
-            if len(parts) >= 1:
-                question = parts[0]
+            # 【关键修正】拆分出 Doc 部分
+            # 假设格式严格为 "Query [SEP] Doc"
+            seg_parts = line_content.split(" [SEP] ")
+            if len(seg_parts) >= 2:
+                # 取 [SEP] 后面的部分作为文档
+                # 有时候文档里也有 [SEP]，所以要取 [1:] 并 join 比较稳妥，或者只取 [1]
+                doc_text = " ".join(seg_parts[1:]) 
             else:
-                question = "" # 异常数据兜底
-
-            # 2. 提取 10 个 Pure Docs (不含 Query，不含 [SEP])
-            raw_docs = []
-            for line in chunk:
-                # 去掉行末可能的 label (比如 "\t0")
-                line_content = line.strip().split("\t")[0]
-                
-                # 【关键修正】拆分出 Doc 部分
-                # 假设格式严格为 "Query [SEP] Doc"
-                seg_parts = line_content.split(" [SEP] ")
-                if len(seg_parts) >= 2:
-                    # 取 [SEP] 后面的部分作为文档
-                    # 有时候文档里也有 [SEP]，所以要取 [1:] 并 join 比较稳妥，或者只取 [1]
-                    doc_text = " ".join(seg_parts[1:]) 
-                else:
-                    # 如果没有 [SEP]，可能这行就是纯文档，或者格式坏了
-                    doc_text = line_content
-                
-                raw_docs.append(doc_text)
-
-            samples.append({
-                "id": i,               # int, 用于 RefinerTool 索引
-                "query": question,     # str
-                "raw_docs": raw_docs,  # List[str], 纯文档内容
-                "golds": []            # 预留给标准答案 (如果有的话)
-            })
+                # 如果没有 [SEP]，可能这行就是纯文档，或者格式坏了
+                doc_text = line_content
             
-        return samples
+            raw_docs.append(doc_text)
+
+        return {
+            "id": i,               # int, 用于 RefinerTool 索引
+            "query": question,     # str
+            "raw_docs": raw_docs,  # List[str], 纯文档内容
+            "golds": []            # 预留给标准答案 (如果有的话)
+        }
 
     def get_batches(self) -> Generator[Dict[str, List], None, None]:
         """
         生成器，每次 yield 一个 batch
         """
-        total = len(self.data)
+        if self.batch_size <= 0:
+            return
+        samples = self._iter_samples()
+        if self.sort_by_length:
+            samples = self._sorted_windows(samples)
         # 使用 yield 节省内存
-        for i in range(0, total, self.batch_size):
-            batch_samples = self.data[i : i + self.batch_size]
+        while True:
+            batch_samples = list(islice(samples, self.batch_size))
+            if not batch_samples:
+                return
             
             # 构造 Batch 字典 (Column-oriented format)
             # 这种格式最适合 Agent 批量处理
@@ -85,4 +115,27 @@ class BatchDataLoader:
                 "queries": [s["query"] for s in batch_samples],    # List[str]
                 "raw_docs": [s["raw_docs"] for s in batch_samples] # List[List[str]] -> [Batch, 10]
             }
-            yield batch
\ No newline at end of file
+            if self.pair_encoder is not None:
+                batch["pair_tokens"] = self._encode_pairs(batch["queries"], batch["raw_docs"])
+            yield batch
+
+    def _sorted_windows(self, samples: Iterator[Dict]) -> Iterator[Dict]:
+        """每次读 sort_window 个 batch 的样本，窗口内按长度排序后依次吐出"""
+        window = self.sort_window * self.batch_size
+        while True:
+            chunk = list(islice(samples, window))
+            if not chunk:
+                return
+            # 字符数作为 token 数的近似：不需要为排序再加载一次 tokenizer
+            chunk.sort(key=lambda s: len(s["query"]) + sum(map(len, s["raw_docs"])))
+            yield from chunk
+
+    def _encode_pairs(self, queries: List[str], raw_docs: List[List[str]]):
+        flat_queries = [q for q, docs in zip(queries, raw_docs) for _ in docs]
+        flat_docs = list(chain.from_iterable(raw_docs))
+        encoded = self.pair_encoder(flat_queries, flat_docs)
+        # 第 k 对的 token 是 tokens[offsets[k]:offsets[k + 1]]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        tokens = np.fromiter(chain.from_iterable(encoded), dtype=np.int32, count=int(offsets[-1]))
+        return tokens, offsets
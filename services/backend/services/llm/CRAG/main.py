@@ -1,4 +1,7 @@
 import os
+import queue
+import threading
+from itertools import chain, repeat
 from tqdm import tqdm
 
 # 1. 导入配置
@@ -11,6 +14,10 @@ from .core_layer.refiner_tool import RefinerTool
 from .data_layer.loader import BatchDataLoader
 from .control_layer.crag_agent import CragAgent
 
+# 出错 / 缺失样本的占位答案
+_ERR = "Error"
+
+
 def main():
     # --- 0. 启动日志 (不再需要 argparse) ---
     print(f"🚀 Starting Agentic CRAG...")
@@ -22,20 +29,24 @@ def main():
     print("\n[1/4] Initializing Core Tools...")
     
     # Generator: 显式传递显存参数
-    generator = GeneratorTool(
+    generator = GeneratorTool.get(
         model_path=settings.models['generator_path'],
         max_model_len=settings.params.get('max_model_len', 2048),
         # 读取 yaml 中的 gpu_memory_utilization，如果没有则默认 0.7
-        gpu_utilization=settings.params.get('gpu_memory_utilization', 0.7)
+        gpu_utilization=settings.params.get('gpu_memory_utilization', 0.7),
+        enable_prefix_caching=settings.params.get('enable_prefix_caching', True),
+        max_num_seqs=settings.params.get('max_num_seqs', 256),
+        max_num_batched_tokens=settings.params.get('max_num_batched_tokens', 8192),
     )
     
     # Evaluator: 传递 Device 参数
-    evaluator = EvaluatorTool(
+    evaluator = EvaluatorTool.get(
         model_path=settings.models['evaluator_path'],
-        device=settings.params.get('device', 'cuda:0')
+        device=settings.params.get('device', 'cuda:0'),
+        compile_model=settings.params.get('evaluator_compile', False),
     )
     
-    refiner = RefinerTool(
+    refiner = RefinerTool.get(
         internal_path=settings.paths['internal_ref'],
         external_path=settings.paths['external_ref'],
         combined_path=settings.paths['combined_ref']
@@ -53,56 +64,144 @@ def main():
 
     # --- 3. 初始化 Data Layer ---
     print("\n[3/4] Loading Data...")
+    output_file = settings.paths['output_file']
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    # 断点续跑：输出文件里已有的完整行就是已经完成的前 done 条，跳过它们
+    done = _resume_point(output_file) if settings.params.get('resume_output', False) else 0
+
     loader = BatchDataLoader(
         input_file_path=settings.paths['input_file'],
         batch_size=settings.params.get('batch_size', 8),
-        ndocs=settings.params.get('ndocs', 10) # 动态读取 ndocs
+        ndocs=settings.params.get('ndocs', 10), # 动态读取 ndocs
+        sort_by_length=settings.params.get('sort_by_length', True),
+        # 乱序只发生在窗口内：_OrderedWriter 待写的结果和断点续跑时重算的样本都不超过一个窗口
+        sort_window=settings.params.get('sort_window_batches', 16),
+        start=done,
+        # CRAG 模式下在预取线程里提前把 (query, doc) 对编码好，evaluate 直接用 token
+        pair_encoder=evaluator.encode_pairs
+        if settings.params.get('method') == 'crag' and settings.params.get('pretokenize_eval', True) else None,
     )
+    total = loader.total
+    if done:
+        print(f"↩️ Resuming: {done}/{total} predictions already in {output_file}")
 
     # --- 4. 主循环 ---
     print(f"\n[4/4] Running Inference (Batch Size={loader.batch_size})...")
-    
-    all_predictions = []
-    # 防止除零错误
-    if loader.batch_size > 0:
-        total_batches = (len(loader.data) + loader.batch_size - 1) // loader.batch_size
-    else:
-        total_batches = 0
-
-    # 在 main.py 的循环里
-    for batch_data in tqdm(loader.get_batches(), total=total_batches, desc="Processing Batches"):
-        try:
-            batch_answers = agent.run_batch(batch_data)
-            
-            # 【调试代码】检查长度是否对齐
-            input_len = len(batch_data['ids'])
-            output_len = len(batch_answers)
-            
-            if input_len != output_len:
-                print(f"\n🚨 Data Mismatch in batch {batch_data['ids'][0]}!")
-                print(f"   Input: {input_len}, Output: {output_len}")
-                # 强行补齐，防止错位
-                diff = input_len - output_len
-                batch_answers.extend(["Error"] * diff)
-            
-            all_predictions.extend(batch_answers)
-            
-        except Exception as e:
-            print(f"\n❌ Error in batch {batch_data.get('ids', 'unknown')}: {e}")
-            # 错误填充
-            if 'ids' in batch_data:
-                all_predictions.extend(["Error"] * len(batch_data['ids']))
+
+    # 每个 batch 的结果边算边写盘，内存里只留还没轮到写的乱序结果
+    with open(output_file, 'a' if done else 'w', encoding='utf-8', buffering=1 << 20) as f:
+        writer = _OrderedWriter(f, start=done)
+
+        # 在 main.py 的循环里
+        # 后台线程提前准备好后面 2 个 batch，GPU 跑当前 batch 时 CPU 侧的数据准备不用排队
+        batches = _prefetch(loader, depth=settings.params.get('prefetch_batches', 2))
+        for batch_data in tqdm(batches, total=len(loader), desc="Processing Batches"):
+            try:
+                batch_answers = agent.run_batch(batch_data)
                 
-    # --- 5. 保存结果 ---
-    output_file = settings.paths['output_file']
-    print(f"\n💾 Saving {len(all_predictions)} predictions to {output_file}...")
-    
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(all_predictions))
-        
+                # 【调试代码】检查长度是否对齐
+                input_len = len(batch_data['ids'])
+                output_len = len(batch_answers)
+                
+                if input_len != output_len:
+                    print(f"\n🚨 Data Mismatch in batch {batch_data['ids'][0]}!")
+                    print(f"   Input: {input_len}, Output: {output_len}")
+                    # 强行补齐，防止错位
+                    # 不足的部分由 repeat 补齐，不分配临时列表；多出来的被 zip 截掉
+                    batch_answers = chain(batch_answers, repeat(_ERR))
+                
+                for _id, ans in zip(batch_data['ids'], batch_answers):
+                    writer.put(_id, ans)
+                
+            except Exception as e:
+                print(f"\n❌ Error in batch {batch_data.get('ids', 'unknown')}: {e}")
+                # 错误填充
+                for _id in batch_data.get('ids', []):
+                    writer.put(_id, _ERR)
+
+        # --- 5. 保存结果 ---
+        writer.close(total)
+
+    print(f"\n💾 Saved {total} predictions to {output_file}")
     print("✨ Inference Complete!")
 
+
+def _prefetch(iterable, depth: int = 2):
+    """
+    生产者线程迭代 iterable 放进有界队列，消费者（主线程）取出。
+    生产者抛出的异常在主线程里原样抛出。
+    """
+    q = queue.Queue(maxsize=max(1, depth))
+    done = object()
+    stop = threading.Event()
+
+    def producer():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        q.put(("item", item), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            q.put(("end", done))
+        except BaseException as e:
+            q.put(("error", e))
+
+    t = threading.Thread(target=producer, daemon=True)
+    t.start()
+    try:
+        while True:
+            kind, item = q.get()
+            if kind == "item":
+                yield item
+            elif kind == "error":
+                raise item
+            else:
+                return
+    finally:
+        # 消费者提前退出时让生产者停下，不再往满队列里阻塞
+        stop.set()
+
+
+class _OrderedWriter:
+    """
+    按样本 id 顺序逐行写出预测。batch 可能在 loader 的排序窗口内按长度重排过，
+    先到的靠后 id 暂存在 pending 里，轮到它时再写；每个窗口跑完 pending 就清空，
+    所以 pending 最多一个窗口的样本，磁盘上的行数也最多落后一个窗口。
+    """
+    def __init__(self, f, start: int = 0):
+        self.f = f
+        self.next_id = start
+        self.pending = {}
+
+    def put(self, _id: int, answer: str):
+        self.pending[_id] = answer
+        while self.next_id in self.pending:
+            self.f.write(self.pending.pop(self.next_id) + "\n")
+            self.next_id += 1
+
+    def close(self, total: int):
+        # 理论上不会缺；缺的 id 补 Error，保证行数与输入一致
+        while self.next_id < total:
+            self.f.write(self.pending.pop(self.next_id, _ERR) + "\n")
+            self.next_id += 1
+
+
+def _resume_point(path: str) -> int:
+    """已有输出文件的完整行数；末尾被中断写了一半的行截掉重算。"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+    return data.count(b"\n", 0, end)
+
+
 if __name__ == "__main__":
     main()
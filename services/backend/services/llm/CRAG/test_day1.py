@@ -6,7 +6,7 @@ def test_generator():
     print("Model Path:", settings.models['generator_path'])
     
     # 2. 初始化 Generator
-    gen = GeneratorTool(
+    gen = GeneratorTool.get(
         model_path=settings.models['generator_path'],
         max_model_len=settings.params['max_model_len']
     )
@@ -46,39 +46,47 @@ def test_components():
     # 2. Test Evaluator (裁判)
     # ==========================================
     print("\n=== [2] Test Evaluator ===")
-    evaluator = EvaluatorTool(settings.models['evaluator_path'])
-    
-    # 场景模拟：给 Batch 中第 0 个问题的 10 篇文档打分
-    q0 = batch['queries'][0]      # "Who is..."
-    docs0 = batch['raw_docs'][0]  # List[str] (10篇文档)
-    id0 = batch['ids'][0]         # int ID
-    
-    print(f"Query: {q0}")
+    evaluator = EvaluatorTool.get(model_path=settings.models['evaluator_path'])
     
+    # 场景模拟：和 evaluate_node 一样，把整个 Batch 的 (问题, 文档) 对拍平成一次 run_pair，
+    # 而不是每个问题单独调用一次
+    queries = batch['queries']
+    raw_docs = batch['raw_docs']
+    ids = batch['ids']
+
+    print(f"Queries: {queries}")
+
     # 【关键】构造 Evaluator 输入
     # run_pair 需要 List[Query] 和 List[Doc] 长度对齐
-    # 所以我们需要把 q0 重复 10 次，变成 ["Who...", "Who...", ...]
-    queries_repeated = [q0] * len(docs0)
-    
+    # 所以每个问题重复 len(docs) 次，变成 ["Who...", "Who...", ..., "What...", ...]
+    flat_queries = [q for q, docs in zip(queries, raw_docs) for _ in docs]
+    flat_docs = [d for docs in raw_docs for d in docs]
+
     # 这里的 ids 参数是可选的，但为了测试 Trace 最好传进去（虽然这里我们只传个 None 占位也可以）
     # 如果要传 ids，也得是 List，且长度对应
-    ids_repeated = [str(id0)] * len(docs0) 
+    flat_ids = [str(i) for i, docs in zip(ids, raw_docs) for _ in docs]
 
-    scores = evaluator.run_pair(queries_repeated, docs0, ids=ids_repeated)
-    
-    print(f"✅ Scores (10 docs): {scores}")
-    print(f"   -> Max Score: {max(scores)}")
-    print(f"   -> Min Score: {min(scores)}")
+    flat_scores = evaluator.run_pair(flat_queries, flat_docs, ids=flat_ids)
+
+    # 按每个问题的文档数切回 [Batch, ndocs]
+    offset = 0
+    for qid, docs in zip(ids, raw_docs):
+        scores = flat_scores[offset:offset + len(docs)]
+        offset += len(docs)
+        print(f"✅ ID {qid} Scores ({len(scores)} docs): {scores}")
+        if scores:
+            print(f"   -> Max Score: {max(scores)}")
+            print(f"   -> Min Score: {min(scores)}")
 
 
     # ==========================================
     # 3. Test Refiner (知识库/查表)
     # ==========================================
     print("\n=== [3] Test Refiner (Mock Retriever) ===")
-    refiner = RefinerTool(
-        settings.paths['internal_ref'],
-        settings.paths['external_ref'],
-        settings.paths['combined_ref']
+    refiner = RefinerTool.get(
+        internal_path=settings.paths['internal_ref'],
+        external_path=settings.paths['external_ref'],
+        combined_path=settings.paths['combined_ref']
     )
     
     # 场景模拟：假设 Agent 决定去查 'internal' (Correct) 知识库
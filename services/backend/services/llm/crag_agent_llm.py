@@ -1,16 +1,29 @@
 import asyncio
 import functools
 import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import Optional, List, Dict, AsyncIterator, Any
 
 from .base import LLMProvider
 from .CRAG.config.config_loader import settings as crag_settings
 from .CRAG.control_layer.crag_agent import CragAgent
+from .CRAG.control_layer.prompt_builder import PromptBuilder
 from .CRAG.core_layer.generator_tool import GeneratorTool
 from .CRAG.core_layer.evaluator_tool import EvaluatorTool
 from .CRAG.core_layer.refiner_tool import RefinerTool
 
 
+@dataclass(slots=True)
+class _Pending:
+    """排队等待合批的一次 generate 调用；slots=True，每个请求只有固定的几个槽位，没有实例 __dict__。"""
+    prompt: str
+    method: str
+    raw_docs: List[str]
+    context: Optional[str]
+    fut: asyncio.Future
+
+
 class CRAGAgentLLM(LLMProvider):
     """
     Async-friendly wrapper that adapts the CRAG Agent pipeline to the LLMProvider
@@ -23,19 +36,38 @@ class CRAGAgentLLM(LLMProvider):
         self.method = (method or os.getenv("CRAG_AGENT_METHOD") or self.settings.params.get("method", "no_retrieval")).strip().lower()
         self.tools = self._init_tools(self.method)
         self.agent = CragAgent(self.tools, method=self.method)
-        self._lock = asyncio.Lock()
         self._stream_chunk_chars = 80
 
+        # 并发的 generate 先进队列，由唯一的后台 worker 攒成一批调用 run_batch，
+        # 让 vLLM 一次处理多条 prompt；worker 本身串行，agent 不会被并发调用
+        self._max_batch = max(1, int(self.settings.params.get("batch_size", 8)))
+        self._max_wait = float(self.settings.params.get("serve_batch_wait_ms", 20)) / 1000.0
+        self._inbox: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # run_batch 专用的单线程池：不和服务里其它 to_thread / 默认线程池任务抢线程，
+        # GPU 调用始终在同一个线程上发出；合批在上面的 worker 里做，这里只需要 1 个线程
+        self._gpu_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="crag-gpu")
+
+    def __del__(self):
+        pool = getattr(self, "_gpu_pool", None)
+        if pool is not None:
+            pool.shutdown(wait=False)
+
     def _init_tools(self, method: str):
         tools: Dict[str, Any] = {}
         gen_path = self.settings.models.get("generator_path", "")
         if not gen_path:
             raise ValueError("CRAG generator_path is not configured in settings.yaml.")
 
-        tools["generator"] = GeneratorTool(
+        tools["generator"] = GeneratorTool.get(
             model_path=gen_path,
             max_model_len=self.settings.params.get("max_model_len", 2048),
             gpu_utilization=self.settings.params.get("gpu_memory_utilization", 0.7),
+            enable_prefix_caching=self.settings.params.get("enable_prefix_caching", True),
+            max_num_seqs=self.settings.params.get("max_num_seqs", 256),
+            max_num_batched_tokens=self.settings.params.get("max_num_batched_tokens", 8192),
+            # 在线服务用异步引擎，generate_stream 才能逐 token 输出
+            async_engine=True,
         )
 
         # evaluator / refiner are only needed for full CRAG or RAG workflows
@@ -44,11 +76,12 @@ class CRAGAgentLLM(LLMProvider):
             if not eval_path:
                 raise ValueError("CRAG evaluator_path is not configured in settings.yaml.")
 
-            tools["evaluator"] = EvaluatorTool(
+            tools["evaluator"] = EvaluatorTool.get(
                 model_path=eval_path,
                 device=self.settings.params.get("device", "cuda:0"),
+                compile_model=self.settings.params.get("evaluator_compile", False),
             )
-            tools["refiner"] = RefinerTool(
+            tools["refiner"] = RefinerTool.get(
                 internal_path=self.settings.paths.get("internal_ref", ""),
                 external_path=self.settings.paths.get("external_ref", ""),
                 combined_path=self.settings.paths.get("combined_ref", ""),
@@ -56,38 +89,76 @@ class CRAGAgentLLM(LLMProvider):
 
         return tools
 
-    def _build_batch(
-        self,
-        prompt: str,
-        *,
-        raw_docs: Optional[List[List[str]]] = None,
-        contexts: Optional[List[str] | str] = None,
-    ) -> Dict[str, Any]:
-        batch = {
-            "ids": [0],
-            "queries": [prompt],
-            "raw_docs": raw_docs if raw_docs is not None else [[]],
+    def _run_sync(self, items: List[_Pending], method: str) -> List[str]:
+        # 整批一次性转成列存的 batch 字典：一遍遍历拿到所有列
+        queries, raw_docs, contexts = map(list, zip(*[(it.prompt, it.raw_docs, it.context) for it in items]))
+        batch: Dict[str, Any] = {
+            "ids": range(len(items)),
+            "queries": queries,
+            "raw_docs": raw_docs,
         }
-
-        if contexts is not None:
-            if isinstance(contexts, str):
-                contexts = [contexts]
+        # 同一批里要么都带 contexts，要么都不带（见 _dispatch 的分组）
+        if contexts[0] is not None:
             batch["final_contexts"] = contexts
-        return batch
-
-    def _run_sync(
-        self,
-        prompt: str,
-        *,
-        method: str,
-        raw_docs: Optional[List[List[str]]] = None,
-        contexts: Optional[List[str] | str] = None,
-    ) -> str:
-        batch = self._build_batch(prompt, raw_docs=raw_docs, contexts=contexts)
-        answers = self.agent.run_batch(batch, method=method)
-        if answers and len(answers) > 0:
-            return answers[0]
-        return ""
+        answers = self.agent.run_batch(batch, method=method) or []
+        return [a or "" for a in answers] + [""] * (len(items) - len(answers))
+
+    def _ensure_worker(self):
+        self.tools["generator"].bind_loop(asyncio.get_running_loop())
+        if self._worker is None or self._worker.done():
+            self._inbox = asyncio.Queue()
+            self._worker = asyncio.create_task(self._batch_loop())
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        inbox = self._inbox
+        while True:
+            items = [await inbox.get()]
+            # 上一批在跑的时候新请求已经在排队了，先把它们全部取走；
+            # 再最多等 _max_wait 凑满一批
+            deadline = loop.time() + self._max_wait
+            while len(items) < self._max_batch:
+                if not inbox.empty():
+                    items.append(inbox.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(inbox.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._dispatch(items)
+
+    async def _dispatch(self, items: List[_Pending]):
+        loop = asyncio.get_running_loop()
+        # 已经被取消的请求不再推理
+        items = [it for it in items if not it.fut.done()]
+        # method 不同、是否带 contexts 不同的请求不能放进同一次 run_batch
+        groups: Dict[tuple, List[_Pending]] = {}
+        for it in items:
+            groups.setdefault((it.method, it.context is not None), []).append(it)
+
+        for (method, _), group in groups.items():
+            try:
+                answers = await loop.run_in_executor(
+                    self._gpu_pool, functools.partial(self._run_sync, group, method)
+                )
+            except Exception as e:
+                for it in group:
+                    if not it.fut.done():
+                        it.fut.set_exception(e)
+                continue
+            for it, ans in zip(group, answers):
+                if not it.fut.done():
+                    it.fut.set_result(ans)
+
+    @staticmethod
+    def _first_context(contexts) -> Optional[str]:
+        # 单条 prompt 的 raw_docs / contexts 只取第一项，与原来单条 batch 的行为一致
+        if isinstance(contexts, str):
+            contexts = [contexts]
+        return (contexts[0] if contexts else "") if contexts is not None else None
 
     async def generate(
         self,
@@ -106,23 +177,19 @@ class CRAGAgentLLM(LLMProvider):
                     "Recreate with method='crag' (or set CRAG_AGENT_METHOD) to enable full pipeline."
                 )
 
-        async with self._lock:
-            loop = asyncio.get_running_loop()
-            fut = loop.run_in_executor(
-                None,
-                functools.partial(
-                    self._run_sync,
-                    prompt,
-                    method=run_method,
-                    raw_docs=raw_docs,
-                    contexts=contexts,
-                ),
-            )
-            try:
-                return await fut
-            except asyncio.CancelledError:
-                fut.cancel()
-                raise
+        context = self._first_context(contexts)
+
+        self._ensure_worker()
+        fut = asyncio.get_running_loop().create_future()
+        await self._inbox.put(_Pending(
+            prompt=prompt,
+            method=run_method,
+            raw_docs=list(raw_docs[0]) if raw_docs else [],
+            context=context,
+            fut=fut,
+        ))
+        # 调用方取消时 fut 随之取消，worker 会跳过它
+        return await fut
 
     async def generate_stream(
         self,
@@ -130,7 +197,22 @@ class CRAGAgentLLM(LLMProvider):
         history: Optional[List[Dict[str, str]]] = None,
         **kwargs,
     ) -> AsyncIterator[str]:
-        # reuse generate but yield small deltas to keep websocket UX unchanged
+        run_method = (kwargs.get("method") or self.method).strip().lower()
+        generator = self.tools["generator"]
+        # 不走检索/打分的模式只有一次生成，可以直接从引擎逐 token 推给前端；
+        # prompt 与 generate_node 里的 PromptBuilder 拼法一致
+        if run_method in ("no_retrieval", "context_only") and generator.supports_streaming:
+            generator.bind_loop(asyncio.get_running_loop())
+            fmt = PromptBuilder.make_formatter(
+                self.settings.task_name or "popqa",
+                self.settings.models.get("generator_type", "llama"),
+                self.settings.params.get("context_max_len", 4000),
+            )
+            async for delta in generator.stream(fmt(prompt, self._first_context(kwargs.get("contexts")) or "")):
+                yield delta
+            return
+
+        # CRAG / RAG 要等整批打分和检索完成，仍然复用 generate 再切成小段
         text = await self.generate(prompt, history=history, **kwargs)
         if not text:
             return
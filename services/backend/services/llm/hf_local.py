@@ -1,5 +1,6 @@
 import asyncio
 import threading
+import uuid
 from pathlib import Path
 from typing import Optional, List, Dict, AsyncIterator
 
@@ -12,6 +13,17 @@ from transformers import (
     StoppingCriteriaList,
 )
 
+try:
+    # vLLM（Linux + CUDA）：continuous batching + PagedAttention，多个并发请求共享同一个 decode step
+    from vllm import SamplingParams  # type: ignore
+    from vllm.engine.arg_utils import AsyncEngineArgs  # type: ignore
+    from vllm.engine.async_llm_engine import AsyncLLMEngine  # type: ignore
+except ImportError:
+    # Windows 等没有 vLLM 的环境退回 transformers.generate
+    SamplingParams = None
+    AsyncEngineArgs = None
+    AsyncLLMEngine = None
+
 from .base import LLMProvider
 
 
@@ -30,10 +42,29 @@ class HFLocalLLM(LLMProvider):
         model_dir: str = "models/selfrag_llama2_7b",
         max_new_tokens: int = 256,
         temperature: float = 0.7,
+        max_model_len: Optional[int] = None,
+        gpu_memory_utilization: float = 0.9,
     ):
         self.model_dir = str(Path(model_dir))
         self.max_new_tokens = max_new_tokens
         self.temperature = temperature
+        self.backend = "vllm" if AsyncLLMEngine is not None and torch.cuda.is_available() else "hf"
+
+        if self.backend == "vllm":
+            self.engine = AsyncLLMEngine.from_engine_args(AsyncEngineArgs(
+                model=self.model_dir,
+                dtype="float16",
+                gpu_memory_utilization=gpu_memory_utilization,
+                max_model_len=max_model_len,
+                # 同一个 prompt 模板的前缀 KV 在请求间复用
+                enable_prefix_caching=True,
+                max_num_seqs=256,
+            ))
+            self.sampling_params = SamplingParams(
+                temperature=self.temperature,
+                max_tokens=self.max_new_tokens,
+            )
+            return
 
         # tokenizer
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir, use_fast=False)
@@ -65,6 +96,25 @@ class HFLocalLLM(LLMProvider):
         # v0.2 先极简：后续你做多轮再把 history 拼进去
         return f"User: {prompt}\nAssistant:"
 
+    async def _generate_stream_vllm(self, text: str) -> AsyncIterator[str]:
+        """
+        vLLM 引擎输出的是累计文本，这里转成增量。
+        Cancellation: 调用方取消或提前结束时 abort 这个请求，释放它在 batch 里的槽位和 KV cache。
+        """
+        req_id = uuid.uuid4().hex
+        prev = 0
+        finished = False
+        try:
+            async for out in self.engine.generate(text, self.sampling_params, req_id):
+                full = out.outputs[0].text
+                if len(full) > prev:
+                    yield full[prev:]
+                    prev = len(full)
+                finished = out.finished
+        finally:
+            if not finished:
+                await self.engine.abort(req_id)
+
     async def generate_stream(self, prompt: str, history=None) -> AsyncIterator[str]:
         """
         Stream text deltas using TextIteratorStreamer.
@@ -72,6 +122,11 @@ class HFLocalLLM(LLMProvider):
         to stop model.generate as soon as possible.
         """
         text = self._format_prompt(prompt, history)
+        if self.backend == "vllm":
+            async for piece in self._generate_stream_vllm(text):
+                yield piece
+            return
+
         inputs = self.tokenizer(text, return_tensors="pt")
         inputs = {k: v.to(self.input_device) for k, v in inputs.items()}
 
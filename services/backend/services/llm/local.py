@@ -4,6 +4,14 @@ import asyncio
 import json
 from typing import Optional, List, Dict, Any
 from .base import LLMProvider
+try:
+    import orjson  # 可选：C 实现的 JSON 编解码，直接处理 bytes
+except ImportError:
+    orjson = None  # type: ignore
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+# aiohttp 的 json_serialize 需要返回 str
+_json_dumps = (lambda o: orjson.dumps(o).decode("utf-8")) if orjson is not None else json.dumps
 
 def _extract_text(data: Any) -> str:
     """Try best-effort extraction across common local LLM server schemas."""
@@ -52,6 +60,23 @@ class LocalLLM(LLMProvider):
     def __init__(self, api_url: str = "http://localhost:8080/completion", timeout_s: int = 60):
         self.api_url = api_url
         self.timeout = aiohttp.ClientTimeout(total=timeout_s)
+        # 整个实例共用一个 keep-alive 连接池，不再每次请求重新 DNS + TCP 握手；
+        # ClientSession 必须在事件循环里创建，第一次 generate 时再建
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=64, keepalive_timeout=30),
+                json_serialize=_json_dumps,
+            )
+        return self._session
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def generate(
         self,
@@ -69,21 +94,20 @@ class LocalLLM(LLMProvider):
         }
 
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.post(self.api_url, json=payload) as resp:
-                    raw = await resp.text()
+            async with self._get_session().post(self.api_url, json=payload) as resp:
+                body = await resp.read()
 
-                    if resp.status != 200:
-                        return f"Error: LLM Server returned {resp.status}: {raw[:200]}"
+                if resp.status != 200:
+                    raw = body.decode(resp.get_encoding(), errors="replace")
+                    return f"Error: LLM Server returned {resp.status}: {raw[:200]}"
 
-                    # Try parse json, fallback to raw text
-                    try:
-                        data = json.loads(raw)
-                        out = _extract_text(data)
-                        return out.strip()
-                    except Exception:
-                        # some servers return plain text
-                        return raw.strip()
+                # Try parse json, fallback to raw text
+                try:
+                    data = _json_loads(body)
+                    return _extract_text(data).strip()
+                except Exception:
+                    # some servers return plain text
+                    return body.decode(resp.get_encoding(), errors="replace").strip()
 
         except asyncio.CancelledError:
             raise
@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import subprocess
 import shutil
 from typing import AsyncIterator, Optional
@@ -6,11 +7,16 @@ from typing import AsyncIterator, Optional
 import edge_tts
 from .base import TTSProvider
 
+try:
+    import av  # 可选：PyAV 进程内解码 mp3，不再起 ffmpeg 子进程
+except ImportError:
+    av = None  # type: ignore
+
 
 class EdgeTTS(TTSProvider):
     """
     Stream TTS audio as raw PCM16LE bytes (24kHz mono),
-    by forcing edge-tts compressed stream -> ffmpeg transcode.
+    by forcing edge-tts compressed stream -> PyAV decode (or ffmpeg transcode when PyAV is missing).
     """
 
     mime_type = "audio/L16"
@@ -18,21 +24,123 @@ class EdgeTTS(TTSProvider):
     sample_rate = 24000
     channels = 1
 
-    def __init__(self, voice: str = "zh-CN-XiaoxiaoNeural"):
+    def __init__(
+        self,
+        voice: str = "zh-CN-XiaoxiaoNeural",
+        *,
+        out_chunk_bytes: int = 8192,
+        flush_after_ms: float = 20.0,
+    ):
         self.voice = voice
+        # 和 PiperTTS 的 out_chunk_bytes 一样：攒到这么大再往下游发；上游停顿超过 flush_after_ms 就先发出去
+        self._out_chunk_bytes = int(out_chunk_bytes)
+        self._flush_after = float(flush_after_ms) / 1000.0
 
     async def stream(self, text: str) -> AsyncIterator[bytes]:
         """
         Yield PCM16LE bytes.
         NOTE: We do NOT try raw PCM from Edge endpoint (unstable).
         """
-        ffmpeg = shutil.which("ffmpeg")
-        if not ffmpeg:
-            raise RuntimeError("ffmpeg not found in PATH; cannot transcode mp3/webm to pcm_s16le")
-
-        async for pcm in self._stream_mp3_and_transcode(text, ffmpeg_path=ffmpeg):
+        if av is not None:
+            source = self._stream_mp3_and_decode(text)
+        else:
+            ffmpeg = shutil.which("ffmpeg")
+            if not ffmpeg:
+                raise RuntimeError("ffmpeg not found in PATH; cannot transcode mp3/webm to pcm_s16le")
+            source = self._stream_mp3_and_transcode(text, ffmpeg_path=ffmpeg)
+
+        async for pcm in self._coalesce(source):
             yield pcm
 
+    async def _coalesce(self, source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        edge-tts 一个 mp3 帧只解出几百字节 PCM，逐帧发会让 WebSocket 每帧的开销占大头。
+        把相邻的 PCM 攒成 out_chunk_bytes 左右的块再 yield；上游 flush_after_ms 内没有新数据
+        （网络停顿、句子结束）就把已有的先发出去，首包最多多等 flush_after_ms。
+        """
+        target = self._out_chunk_bytes
+        if target <= 0:
+            async for pcm in source:
+                yield pcm
+            return
+
+        buf = bytearray()
+        it = source.__aiter__()
+        # 不用 wait_for：超时会取消 __anext__，把上游的解码/转码生成器一起打断
+        pending: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(it.__anext__())
+                if buf:
+                    done, _ = await asyncio.wait((pending,), timeout=self._flush_after)
+                    if not done:
+                        yield bytes(buf)
+                        buf.clear()
+                        continue
+                fut, pending = pending, None
+                try:
+                    data = await fut
+                except StopAsyncIteration:
+                    break
+                buf += data
+                if len(buf) >= target:
+                    yield bytes(buf)
+                    buf.clear()
+            if buf:
+                yield bytes(buf)
+        finally:
+            if pending is not None:
+                pending.cancel()
+                with contextlib.suppress(BaseException):
+                    await pending
+            # 提前结束时关闭上游，让 ffmpeg 子进程 / edge-tts 连接按原来的 finally 清理
+            await it.aclose()
+
+    async def _stream_mp3_and_decode(self, text: str) -> AsyncIterator[bytes]:
+        """
+        Decode edge_tts mp3 chunks to pcm_s16le in-process with PyAV.
+
+        每个网络分片直接喂给 mp3 parser/decoder，解出的帧重采样成 s16 mono 24kHz 后立即 yield；
+        没有子进程启动、管道读写和线程切换。短句的 mp3 解码只要几百微秒，直接在事件循环里做。
+        """
+        com = edge_tts.Communicate(text=text, voice=self.voice)
+        codec = av.CodecContext.create("mp3", "r")
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=self.sample_rate)
+        frame_bytes = 2 * self.channels
+
+        def to_pcm(frames) -> bytes:
+            out = []
+            for frame in frames:
+                for rf in resampler.resample(frame):
+                    # plane 缓冲区可能有对齐填充，只取有效样本
+                    out.append(bytes(rf.planes[0])[: rf.samples * frame_bytes])
+            return b"".join(out)
+
+        def decode(packets) -> bytes:
+            return to_pcm(f for pkt in packets for f in codec.decode(pkt))
+
+        produced = 0
+        async for chunk in com.stream():
+            if chunk.get("type") != "audio":
+                continue
+            data = chunk.get("data") or b""
+            if not data:
+                continue
+            pcm = decode(codec.parse(data))
+            if pcm:
+                produced += len(pcm)
+                yield pcm
+
+        # 冲刷 parser / decoder / resampler 里剩下的尾巴
+        tail = decode(codec.parse(None)) + to_pcm(codec.decode(None)) + to_pcm([None])
+        if tail:
+            produced += len(tail)
+            yield tail
+
+        if produced == 0:
+            print("[EdgeTTS] PyAV decoded no PCM from edge-tts stream")
+
     async def _stream_mp3_and_transcode(self, text: str, ffmpeg_path: str) -> AsyncIterator[bytes]:
         """
         Read edge_tts compressed audio chunks and transcode to pcm_s16le using ffmpeg.
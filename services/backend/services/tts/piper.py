@@ -1,16 +1,49 @@
 # services/tts/piper.py
 import asyncio
+import contextlib
+import functools
+import hashlib
 import json
+import logging
 import os
+import queue
+import re
 import threading
 import time
-import audioop
 import inspect
+import operator
+import weakref
+from collections import OrderedDict, deque
 from dataclasses import dataclass
 from typing import AsyncIterator, Optional, Dict, Any, Iterable
 
 from .base import TTSProvider
 
+# 格式化和输出由 main.py 启动时挂的 QueueHandler/QueueListener 在后台线程完成（见 utils/log_queue.py）
+log = logging.getLogger("piper_tts")
+
+try:
+    import numpy as np  # 可选：soxr 的输入输出数组、增益的向量化计算
+except ImportError:
+    np = None  # type: ignore
+
+try:
+    # 可选：libsoxr 的 SIMD 多相滤波重采样，带状态逐块处理（依赖 numpy）
+    import soxr
+except ImportError:
+    soxr = None  # type: ignore
+
+try:
+    import audioop  # Python 3.13 起已移除；只在没有 soxr 时作为重采样兜底
+except ImportError:
+    audioop = None  # type: ignore
+
+try:
+    # 可选：给 Piper 的推理 session 设置线程数 / 图优化
+    import onnxruntime as ort  # type: ignore
+except ImportError:
+    ort = None  # type: ignore
+
 # ---------- Piper import (robust) ----------
 _PIPER_IMPORT_ERR: Exception | None = None
 PiperVoice = None  # type: ignore
@@ -43,6 +76,101 @@ _VOICE_CACHE: Dict[_VoiceKey, Any] = {}
 _VOICE_CACHE_LOCK = threading.Lock()
 
 
+@contextlib.contextmanager
+def _ort_session_options(so):
+    """
+    在 with 块内，当前线程调用 ort.InferenceSession 时把 sess_options 换成 so，其余参数原样透传。
+    piper 没有传 SessionOptions 的入口，只能这样在它自己建 session 时带进去；
+    其他线程不受影响。yield 出的列表记录替换次数。
+    """
+    orig = ort.InferenceSession
+    owner = threading.get_ident()
+    hits: list = []
+
+    def _session(*args, **kwargs):
+        if threading.get_ident() == owner:
+            if len(args) > 1:
+                args = (args[0], so) + args[2:]
+            else:
+                kwargs["sess_options"] = so
+            hits.append(1)
+        return orig(*args, **kwargs)
+
+    ort.InferenceSession = _session
+    try:
+        yield hits
+    finally:
+        ort.InferenceSession = orig
+
+
+# 进程内所有 PiperTTS 实例共用的推理并发上限（第一次 stream 时按 max_concurrency 创建）；
+# asyncio.Semaphore 绑定事件循环，所以按循环各存一个
+_PIPER_SEMS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+# 合成结果 LRU 缓存：(模型, 说话人, 合成参数, 输出采样率, 文本哈希) -> 完整 PCM。
+# 所有实例共用；命中时不跑 Piper、不占推理槽位
+_SYNTH_CACHE: "OrderedDict[tuple, bytes]" = OrderedDict()
+_SYNTH_CACHE_LOCK = threading.Lock()
+# 单条超过这个大小（约 40s@24kHz）不进缓存，长段落基本不会重复
+_SYNTH_CACHE_MAX_ENTRY = 2 * 1024 * 1024
+
+
+# soxr.ResampleStream 对象池：(in_rate, out_rate) -> LifoQueue。
+# 短句请求很多时不用每次重建多相滤波器表；池大小不超过推理并发数
+_RS_POOL: Dict[tuple, "queue.LifoQueue"] = {}
+_RS_POOL_LOCK = threading.Lock()
+
+
+def _acquire_resampler(in_rate: int, out_rate: int):
+    pool = _RS_POOL.get((in_rate, out_rate))
+    if pool is not None:
+        try:
+            return pool.get_nowait()
+        except queue.Empty:
+            pass
+    return soxr.ResampleStream(in_rate, out_rate, 1, dtype="int16")
+
+
+def _release_resampler(in_rate: int, out_rate: int, rs, cap: int) -> None:
+    # 上一次可能中途停止，滤波器里还留着样本；清掉状态再放回池
+    rs.clear()
+    with _RS_POOL_LOCK:
+        pool = _RS_POOL.get((in_rate, out_rate))
+        if pool is None:
+            pool = _RS_POOL[(in_rate, out_rate)] = queue.LifoQueue(maxsize=max(1, cap))
+    try:
+        pool.put_nowait(rs)
+    except queue.Full:
+        pass
+
+
+class _StreamClosed(Exception):
+    """消费者已经结束（正常读完、提前 break 或连接断开）；生产者的 _put 抛出它来退出。"""
+
+
+def _release_slot(sem: asyncio.Semaphore, task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()  # 生产者自己处理了异常；这里只是标记为已读取
+    sem.release()
+
+
+def _piper_semaphore(limit: int) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _PIPER_SEMS.get(loop)
+    if sem is None:
+        sem = _PIPER_SEMS[loop] = asyncio.Semaphore(max(1, limit))
+    return sem
+
+
+# 句末切分：中文句末标点直接切；拉丁标点后面要跟空白才切，"0.5mg"、"e.g." 中间不会被切开
+_SENT_SPLIT_RE = re.compile(r"(?<=[。！？])\s*|(?<=[.!?])\s+")
+
+
+def _split_sentences(text: str) -> list:
+    return [s for s in _SENT_SPLIT_RE.split(text) if s.strip()]
+
+
 def _default_config_path(model_path: str) -> Optional[str]:
     # Piper voices often ship with "<model>.onnx.json"
     cand1 = model_path + ".json"
@@ -107,17 +235,49 @@ def _as_pcm_bytes(chunk: Any) -> Optional[bytes]:
     return None
 
 
+# 底层函数 -> 参数名集合（inspect.signature 每次几十微秒，同一个函数只解析一次）。
+# 以函数对象本身为键而不是 id()：绑定方法每次 getattr 都是新对象，id 可能被复用
+_SIG_CACHE: Dict[Any, frozenset] = {}
+
+
+def _supported_params(fn) -> frozenset:
+    key = getattr(fn, "__func__", fn)
+    try:
+        return _SIG_CACHE[key]
+    except KeyError:
+        pass
+    except TypeError:
+        key = None  # 不可哈希的可调用对象，不缓存
+    try:
+        supported = frozenset(inspect.signature(fn).parameters)
+    except Exception:
+        # If signature inspection fails, just call without risky kwargs.
+        supported = frozenset()
+    if key is not None:
+        _SIG_CACHE[key] = supported
+    return supported
+
+
+def _pcm_extractor(chunk: Any):
+    """
+    Pick a direct extractor for this chunk's type (falls back to _as_pcm_bytes).
+    Piper 同一个版本输出的分块类型不变，第一块探测一次，后面每块只剩一次 type 比较。
+    """
+    if type(chunk) is bytes:
+        return bytes  # bytes(b) 对 bytes 原样返回同一个对象，不复制
+    if isinstance(chunk, memoryview):
+        return memoryview.tobytes
+    if isinstance(getattr(chunk, "audio_int16_bytes", None), bytes):
+        return operator.attrgetter("audio_int16_bytes")
+    return _as_pcm_bytes
+
+
 def _call_with_supported_kwargs(fn, **kwargs):
     """
     Call fn(**kwargs) but drop kwargs not supported by fn signature.
     This makes us compatible across piper-tts versions.
     """
-    try:
-        sig = inspect.signature(fn)
-        supported = set(sig.parameters.keys())
-    except Exception:
-        # If signature inspection fails, just call without risky kwargs.
-        supported = set()
+    supported = _supported_params(fn)
 
     if supported:
         filtered = {k: v for k, v in kwargs.items() if k in supported and v is not None}
@@ -159,6 +319,14 @@ class PiperTTS(TTSProvider):
         # streaming knobs
         out_chunk_bytes: int = 4096,
         log_every_sec: float = 2.0,
+        # concurrency: max Piper inferences running at once across the whole process
+        max_concurrency: int = 2,
+        # LRU cache of synthesized PCM, in entries (0 disables)
+        cache_size: int = 128,
+        # ONNX Runtime intra-op threads (None -> min(4, cpu_count)); applied when the voice is first loaded
+        intra_op_threads: Optional[int] = None,
+        # output gain applied after resampling (1.0 = untouched), saturating to int16
+        gain: float = 1.0,
     ):
         if _PIPER_IMPORT_ERR is not None or PiperVoice is None:
             raise RuntimeError(
@@ -168,6 +336,7 @@ class PiperTTS(TTSProvider):
         self.model_path = model_path
         self.config_path = config_path or _default_config_path(model_path)
         self.use_cuda = use_cuda
+        self._intra_op_threads = int(intra_op_threads) if intra_op_threads else min(4, os.cpu_count() or 1)
 
         # Some piper builds use speaker, some use speaker_id, some don't support any.
         self.speaker_id = speaker_id
@@ -181,6 +350,12 @@ class PiperTTS(TTSProvider):
 
         self._out_chunk_bytes = int(out_chunk_bytes)
         self._log_every_sec = float(log_every_sec)
+        self._max_concurrency = int(max_concurrency)
+        self._cache_size = max(0, int(cache_size or 0))
+        # 增益用 Q8 定点数：int32 乘法 + 右移，热路径上不转浮点
+        self._gain_q8 = int(round(float(gain) * 256))
+        # 参与缓存键的合成参数（SynthesisConfig 不一定可哈希）
+        self._syn_params = (float(length_scale), float(noise_scale), float(noise_w), bool(normalize_audio))
 
         self._syn_config = SynthesisConfig(
             length_scale=length_scale,
@@ -190,14 +365,18 @@ class PiperTTS(TTSProvider):
         )
 
         self._voice = self._load_voice()
-
-        print(f"[PiperTTS] ready model={self.model_path}")
-        print(f"[PiperTTS] cfg={self.config_path}")
-        print(
-            f"[PiperTTS] voice_sr={self.voice_sample_rate} -> out_sr={self._target_sample_rate} "
-            f"(resample={self._target_sample_rate != self.voice_sample_rate})"
+        # 第一次合成成功后记下 (方法名, 调用方式)，之后直接 call(text)，不再解析签名、不再试错
+        self._piper_call: Optional[tuple] = None
+        # (分块类型, 提取函数)：第一块非空输出时探测，之后同类型的分块直接提取 PCM
+        self._pcm_extract: Optional[tuple] = None
+
+        log.info("ready model=%s", self.model_path)
+        log.info("cfg=%s", self.config_path)
+        log.info(
+            "voice_sr=%s -> out_sr=%s (resample=%s)",
+            self.voice_sample_rate, self._target_sample_rate, self._target_sample_rate != self.voice_sample_rate,
         )
-        print(f"[PiperTTS] stream_raw={'yes' if hasattr(self._voice, 'synthesize_stream_raw') else 'no'}")
+        log.info("stream_raw=%s", "yes" if hasattr(self._voice, "synthesize_stream_raw") else "no")
 
     def _load_voice(self):
         key = _VoiceKey(self.model_path, self.config_path, self.use_cuda)
@@ -205,10 +384,67 @@ class PiperTTS(TTSProvider):
             v = _VOICE_CACHE.get(key)
             if v is not None:
                 return v
-            v = PiperVoice.load(self.model_path, config_path=self.config_path, use_cuda=self.use_cuda)
+            so = self._session_options()
+            if so is None:
+                v = PiperVoice.load(self.model_path, config_path=self.config_path, use_cuda=self.use_cuda)
+            else:
+                with _ort_session_options(so) as hits:
+                    v = PiperVoice.load(self.model_path, config_path=self.config_path, use_cuda=self.use_cuda)
+                if hits and getattr(v, "session", None) is not None:
+                    log.info("ORT session: threads=%s providers=%s", self._intra_op_threads, v.session.get_providers())
+                else:
+                    log.warning("piper did not create its ORT session through onnxruntime.InferenceSession; keep defaults")
             _VOICE_CACHE[key] = v
             return v
 
+    def _session_options(self):
+        """
+        PiperVoice.load 用 ORT 默认的 SessionOptions：CPU 上线程数等于核数，
+        和 PIPER_CONCURRENCY 个并发推理叠在一起会互相抢核。这里给出固定线程数、全量图优化的选项，
+        在 load 时直接用上（模型只解析一次，providers / provider_options 仍按 piper 自己的）；
+        没装 onnxruntime 时返回 None，保持原样。
+        """
+        if ort is None:
+            return None
+        so = ort.SessionOptions()
+        so.intra_op_num_threads = self._intra_op_threads
+        so.inter_op_num_threads = 1
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        return so
+
+    def _start_synthesis(self, text: str):
+        """Call synthesize_stream_raw (preferred) or synthesize; returns (method name, raw output)."""
+        plan = self._piper_call
+        if plan is not None:
+            name, call = plan
+            return name, call(text)
+
+        # build kwargs (only pass if supported)
+        base_kwargs: Dict[str, Any] = {"syn_config": self._syn_config}
+        if self.speaker_id is not None:
+            # Some builds use 'speaker', some 'speaker_id'. We'll offer both; filter will keep supported one.
+            # 单说话人模型（常见情况）两个都不带
+            base_kwargs["speaker_id"] = self.speaker_id
+            base_kwargs["speaker"] = self.speaker_id
+
+        name = "synthesize_stream_raw" if hasattr(self._voice, "synthesize_stream_raw") else "synthesize"
+        if name == "synthesize":
+            log.info("Falling back to synthesize()")
+        fn = getattr(self._voice, name)
+        supported = _supported_params(fn)
+        try:
+            # some implementations expect (text, **kwargs)
+            out = _call_with_supported_kwargs(fn, **base_kwargs, text=text)  # for signature(text=...)
+            if "text" in supported:
+                kw = {k: v for k, v in base_kwargs.items() if k in supported and v is not None}
+                self._piper_call = (name, lambda t: fn(text=t, **kw))
+        except TypeError:
+            # fallback: pass text positionally (the filtered kwargs of a **kw lambda are always empty)
+            out = fn(text)
+            self._piper_call = (name, fn)
+        return name, out
+
     def _iter_piper_chunks(self, text: str) -> Iterable[Any]:
         """
         Yield chunks from Piper.
@@ -216,32 +452,11 @@ class PiperTTS(TTSProvider):
         - Else use synthesize.
         NOTE: We DO NOT assume speaker_id kw exists; we auto-filter by signature.
         """
-        # build kwargs (only pass if supported)
-        # Some builds use 'speaker', some 'speaker_id'. We'll offer both; filter will keep supported one.
-        base_kwargs = {
-            "speaker_id": self.speaker_id,
-            "speaker": self.speaker_id,
-            "syn_config": self._syn_config,
-        }
-
-        if hasattr(self._voice, "synthesize_stream_raw"):
-            fn = getattr(self._voice, "synthesize_stream_raw")
-            try:
-                # some implementations expect (text, **kwargs)
-                out = _call_with_supported_kwargs(fn, **base_kwargs, text=text)  # for signature(text=...)
-            except TypeError:
-                # fallback: pass text positionally, kwargs filtered
-                out = _call_with_supported_kwargs(lambda **kw: fn(text, **kw), **base_kwargs)
+        name, out = self._start_synthesis(text)
+        if name == "synthesize_stream_raw":
             yield from out
             return
 
-        print("[PiperTTS] Falling back to synthesize()")
-        fn = getattr(self._voice, "synthesize")
-        try:
-            out = _call_with_supported_kwargs(fn, **base_kwargs, text=text)
-        except TypeError:
-            out = _call_with_supported_kwargs(lambda **kw: fn(text, **kw), **base_kwargs)
-
         # out may be iterable of AudioChunk, or sometimes a single object
         if isinstance(out, (bytes, bytearray, memoryview)):
             yield out
@@ -252,33 +467,138 @@ class PiperTTS(TTSProvider):
         except TypeError:
             yield out
 
+    def warmup(self, text: str = "你好。") -> int:
+        """
+        同步跑完一整句合成（不经过 stream：不写合成缓存、不占推理槽位），
+        让 ORT 在启动阶段完成图优化、内核选择和内存池分配，顺带确定 _piper_call / _pcm_extract。
+        返回产出的 PCM 字节数；在线程里调用。
+        """
+        t0 = time.perf_counter()
+        produced = 0
+        for raw in self._iter_piper_chunks(text):
+            data = _as_pcm_bytes(raw)
+            if data:
+                produced += len(data)
+                if self._pcm_extract is None:
+                    self._pcm_extract = (type(raw), _pcm_extractor(raw))
+        log.info("warmup done in %.0fms (bytes=%d)", (time.perf_counter() - t0) * 1000, produced)
+        return produced
+
+    def _cache_key(self, text: str) -> tuple:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return (
+            self.model_path, self.config_path, self.speaker_id,
+            self._syn_params, int(self._target_sample_rate), self._gain_q8, digest,
+        )
+
+    def _cache_get(self, key: tuple) -> Optional[bytes]:
+        with _SYNTH_CACHE_LOCK:
+            pcm = _SYNTH_CACHE.get(key)
+            if pcm is not None:
+                _SYNTH_CACHE.move_to_end(key)
+            return pcm
+
+    def _cache_put(self, key: tuple, pcm: bytes) -> None:
+        if not pcm or len(pcm) > _SYNTH_CACHE_MAX_ENTRY:
+            return
+        with _SYNTH_CACHE_LOCK:
+            _SYNTH_CACHE[key] = pcm
+            _SYNTH_CACHE.move_to_end(key)
+            while len(_SYNTH_CACHE) > self._cache_size:
+                _SYNTH_CACHE.popitem(last=False)
+
     async def stream(self, text: str) -> AsyncIterator[bytes]:
+        """
+        Piper 一句话要整句合成完才出第一块 PCM，首包时间跟整段长度成正比。
+        多句文本按句切开、按原顺序输出，首包只取决于第一句的长度。
+        所有句子一开始就全部启动、按顺序排到进程级推理槽位上：ws.py 会同时预取后面几段，
+        如果本段后面的句子等前面的句子播完才启动，就会排到后面几段的句子之后，播放中途断音。
+        """
         if not text or not text.strip():
             return
 
+        sentences = _split_sentences(text)
+        if len(sentences) <= 1:
+            async for chunk in self._stream_sentence(text):
+                yield chunk
+            return
+
+        running: deque = deque()  # (task, queue)，按句子顺序
+        for sentence in sentences:
+            q: asyncio.Queue = asyncio.Queue()
+            running.append((asyncio.create_task(self._pump_sentence(sentence, q)), q))
+
+        try:
+            while running:
+                task, q = running[0]
+                while (chunk := await q.get()) is not None:
+                    yield chunk
+                await task  # 合成出错时在这里抛出
+                running.popleft()
+        finally:
+            for task, _ in running:
+                if task.done():
+                    if not task.cancelled():
+                        task.exception()
+                else:
+                    task.cancel()
+
+    async def _pump_sentence(self, text: str, q: asyncio.Queue) -> None:
+        # 一句的 PCM 逐块放进 q，None 表示结束（出错也放 None，由 stream await 任务取异常）
+        agen = self._stream_sentence(text)
+        try:
+            async for chunk in agen:
+                q.put_nowait(chunk)
+        finally:
+            q.put_nowait(None)
+            await agen.aclose()
+
+    async def _stream_sentence(self, text: str) -> AsyncIterator[bytes]:
+        if not text or not text.strip():
+            return
+
+        cache_key = self._cache_key(text) if self._cache_size else None
+        if cache_key is not None:
+            pcm = self._cache_get(cache_key)
+            if pcm is not None:
+                for off in range(0, len(pcm), self._out_chunk_bytes):
+                    yield pcm[off:off + self._out_chunk_bytes]
+                return
+
         loop = asyncio.get_running_loop()
-        q: asyncio.Queue[object] = asyncio.Queue(maxsize=256)
-        stop_flag = threading.Event()
+        # 容量由 slots 控制：生产者线程放入前占一个槽位，消费者取出后归还
+        q: asyncio.Queue[object] = asyncio.Queue()
+        slots = threading.Semaphore(256)
+        # 消费者结束时置位并多归还一个槽位，把阻塞在 _put 里的生产者立即唤醒
+        closed = False
 
         in_rate = int(self.voice_sample_rate)
         out_rate = int(self._target_sample_rate)
         need_resample = (out_rate != in_rate)
+        if need_resample and soxr is None and audioop is None:
+            raise RuntimeError("PiperTTS resampling needs soxr (pip install soxr numpy) or audioop")
+        if self._gain_q8 != 256 and np is None and audioop is None:
+            raise RuntimeError("PiperTTS gain needs numpy or audioop")
 
         OUT_CHUNK = self._out_chunk_bytes
+        # 重采样前先攒约 100ms 的原始 PCM 再一次处理：Piper 的分块常常只有几百个样本，
+        # 逐块调用时 Python→C 的开销和滤波器冷启动占了大头
+        RESAMPLE_THRESH = int(in_rate * 0.1) * 2
         LOG_EVERY = self._log_every_sec
 
         def _put(item: object) -> None:
-            if stop_flag.is_set():
-                return
-            fut = asyncio.run_coroutine_threadsafe(q.put(item), loop)
+            # 生产者只在队列满时才等（背压），不轮询；消费者一结束就抛 _StreamClosed 退出
+            if closed:
+                raise _StreamClosed
+            slots.acquire()
+            if closed:
+                slots.release()  # 唤醒信号留给下一次 _put（例如 finally 里的结束标记）
+                raise _StreamClosed
             try:
-                fut.result(timeout=5.0)
-            except Exception as e:
-                stop_flag.set()
-                try:
-                    asyncio.run_coroutine_threadsafe(q.put(e), loop)
-                except Exception:
-                    pass
+                loop.call_soon_threadsafe(q.put_nowait, item)
+            except RuntimeError:
+                # 事件循环已关闭，消费者不在了
+                raise _StreamClosed from None
 
         def producer():
             t0 = time.perf_counter()
@@ -287,69 +607,178 @@ class PiperTTS(TTSProvider):
             produced_chunks = 0
             first_byte_ts: float | None = None
             rate_state = None
+            # 未命中缓存时顺带收集完整输出，正常结束才写入缓存（中途停止的不完整，不缓存）
+            parts: Optional[list] = [] if cache_key is not None else None
+            parts_bytes = 0
+            # 每次 stream 独占一个重采样器（从池里取）：滤波器状态跨 Piper 分块延续，并发的 stream 互不影响
+            resampler = _acquire_resampler(in_rate, out_rate) if need_resample and soxr is not None else None
+
+            def resample(data: bytes, last: bool = False):
+                nonlocal rate_state
+                if resampler is not None:
+                    # 直接返回 soxr 输出数组的字节视图，不先 tobytes() 整块复制一遍；
+                    # emit 切成小块时每块只复制一次
+                    out = resampler.resample_chunk(np.frombuffer(data, dtype=np.int16), last=last)
+                    return memoryview(out).cast("B")
+                if not data:
+                    return b""
+                data, rate_state = audioop.ratecv(data, 2, 1, in_rate, out_rate, rate_state)
+                return data
+
+            gain_q8 = self._gain_q8
+
+            def apply_gain(data):
+                if np is not None:
+                    # int32 中间结果不会溢出；一次 clip 饱和到 int16，全部是 numpy 的向量化 ufunc
+                    arr = np.frombuffer(data, dtype=np.int16).astype(np.int32)
+                    arr *= gain_q8
+                    arr >>= 8
+                    np.clip(arr, -32768, 32767, out=arr)
+                    return memoryview(arr.astype(np.int16)).cast("B")
+                return audioop.mul(bytes(data), 2, gain_q8 / 256)
+
+            carry = bytearray()
+
+            def emit(data) -> None:
+                nonlocal parts, parts_bytes
+                if gain_q8 != 256:
+                    data = apply_gain(data)
+                if parts is not None:
+                    parts.append(data)
+                    parts_bytes += len(data)
+                    if parts_bytes > _SYNTH_CACHE_MAX_ENTRY:
+                        parts = None
+                view = isinstance(data, memoryview)
+                n = len(data)
+                off = 0
+                # 输出固定为 OUT_CHUNK 大小的块：上一段剩下的零头先用本段开头补满
+                if carry:
+                    off = min(OUT_CHUNK - len(carry), n)
+                    carry.extend(data[:off])
+                    if len(carry) < OUT_CHUNK:
+                        return
+                    send(bytes(carry))
+                    carry.clear()
+                # 中间的整块：bytes 直接切片（一次复制，整段恰好一块时不复制）；
+                # soxr 的数组视图切片不复制，tobytes 时复制一次
+                end = off + (n - off) // OUT_CHUNK * OUT_CHUNK
+                while off < end:
+                    part = data[off:off + OUT_CHUNK]
+                    send(part.tobytes() if view else part)
+                    off += OUT_CHUNK
+                # 不足一块的零头留到下一段或结束时再发
+                if off < n:
+                    carry.extend(data[off:])
+
+            def send(part: bytes) -> None:
+                nonlocal produced_bytes, produced_chunks
+                produced_bytes += len(part)
+                produced_chunks += 1
+                _put(part)
+
+            accum = bytearray()
 
             try:
-                print(f"[PiperTTS] Start streaming text (len={len(text)})")
-                print(f"[PiperTTS] in_rate={in_rate} out_rate={out_rate} need_resample={need_resample} out_chunk={OUT_CHUNK}B")
+                log.debug("Start streaming text (len=%d)", len(text))
+                log.debug("in_rate=%d out_rate=%d need_resample=%s out_chunk=%dB", in_rate, out_rate, need_resample, OUT_CHUNK)
 
                 for raw in self._iter_piper_chunks(text):
-                    if stop_flag.is_set():
-                        break
-
-                    data = _as_pcm_bytes(raw)
+                    # 攒在 accum / carry 里的分块不会经过 _put，这里每个 Piper 分块看一次，
+                    # 避免客户端断开后还把整段合成完
+                    if closed:
+                        raise _StreamClosed
+
+                    extract = self._pcm_extract
+                    if extract is not None and type(raw) is extract[0]:
+                        data = extract[1](raw)
+                    else:
+                        data = _as_pcm_bytes(raw)
+                        if data and extract is None:
+                            self._pcm_extract = (type(raw), _pcm_extractor(raw))
                     if not data:
                         now = time.perf_counter()
                         if now - last_log >= LOG_EVERY:
-                            print("[PiperTTS] ... got empty chunk, still running ...")
+                            log.debug("... got empty chunk, still running ...")
                             last_log = now
                         continue
 
                     if need_resample:
-                        data, rate_state = audioop.ratecv(data, 2, 1, in_rate, out_rate, rate_state)
+                        accum += data
+                        if len(accum) < RESAMPLE_THRESH:
+                            continue
+                        data = resample(bytes(accum))
+                        accum.clear()
+                        if not data:
+                            # 重采样器攒着不足一个滤波窗口的样本，下一块再出
+                            continue
 
                     if first_byte_ts is None:
                         first_byte_ts = time.perf_counter()
-                        print(f"[PiperTTS] first_pcm_bytes after {(first_byte_ts - t0)*1000:.0f}ms (len={len(data)})")
+                        log.info("first_pcm_bytes after %.0fms (len=%d)", (first_byte_ts - t0) * 1000, len(data))
 
-                    mv = memoryview(data)
-                    for off in range(0, len(mv), OUT_CHUNK):
-                        if stop_flag.is_set():
-                            break
-                        part = mv[off:off + OUT_CHUNK].tobytes()
-                        produced_bytes += len(part)
-                        produced_chunks += 1
-                        _put(part)
+                    emit(data)
 
                     now = time.perf_counter()
                     if now - last_log >= LOG_EVERY:
                         dt = (now - t0) * 1000
-                        print(f"[PiperTTS] ... running ... t={dt:.0f}ms chunks={produced_chunks} bytes={produced_bytes}")
+                        log.debug("... running ... t=%.0fms chunks=%d bytes=%d", dt, produced_chunks, produced_bytes)
                         last_log = now
 
+                if need_resample:
+                    # 攒着的最后一段连同重采样器里剩下的尾巴一起冲出
+                    tail = resample(bytes(accum), last=True)
+                    accum.clear()
+                    if tail:
+                        emit(tail)
+
+                if carry:
+                    send(bytes(carry))
+                    carry.clear()
+
+                # 走到这里说明每一块都已送进队列，输出完整
+                if parts is not None:
+                    self._cache_put(cache_key, b"".join(parts))
+
                 t1 = time.perf_counter()
-                print(f"[PiperTTS] Producer finished. dt={(t1 - t0)*1000:.0f}ms chunks={produced_chunks} bytes={produced_bytes}")
+                log.info("Producer finished. dt=%.0fms chunks=%d bytes=%d", (t1 - t0) * 1000, produced_chunks, produced_bytes)
 
+            except _StreamClosed:
+                log.debug("Producer stopped: consumer closed")
             except Exception as e:
-                print(f"[PiperTTS] Producer exception: {type(e).__name__}: {e}")
-                _put(e)
+                log.warning("Producer exception: %s: %s", type(e).__name__, e)
+                with contextlib.suppress(_StreamClosed):
+                    _put(e)
             finally:
-                _put(None)
-
-        prod_task = asyncio.create_task(asyncio.to_thread(producer))
+                try:
+                    if resampler is not None:
+                        _release_resampler(in_rate, out_rate, resampler, self._max_concurrency)
+                finally:
+                    # 结束标记必须送达，否则消费者会一直等
+                    with contextlib.suppress(_StreamClosed):
+                        _put(None)
+
+        # 突发请求时排队等槽位，而不是同时开一堆线程抢同一个 ONNX session；
+        # 先拿到槽位的请求照常流式输出，排队的请求不占内存也不占线程
+        sem = _piper_semaphore(self._max_concurrency)
+        await sem.acquire()
+        try:
+            prod_task = asyncio.create_task(asyncio.to_thread(producer))
+        except BaseException:
+            sem.release()
+            raise
 
         try:
             while True:
                 item = await q.get()
+                slots.release()
                 if item is None:
                     break
                 if isinstance(item, Exception):
                     raise item
                 yield item  # bytes
         finally:
-            stop_flag.set()
-            if not prod_task.done():
-                prod_task.cancel()
-                try:
-                    await prod_task
-                except Exception:
-                    pass
+            closed = True
+            slots.release()
+            # to_thread 的线程取消不掉；生产者在下一次 _put 或下一个 Piper 分块时退出，
+            # 等线程真正结束再归还推理槽位，避免提前放行的请求和它抢 CPU
+            prod_task.add_done_callback(functools.partial(_release_slot, sem))
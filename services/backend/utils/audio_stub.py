@@ -1,11 +1,20 @@
+import functools
 import io
+import sys
 import wave
 import math
-import struct
+from array import array
 
+try:
+    import numpy as np  # 可选：向量化生成整段波形
+except ImportError:
+    np = None  # type: ignore
+
+@functools.lru_cache(maxsize=64)
 def synthesize_wav_stub(text: str, seconds: float = 1.0, sr: int = 16000) -> bytes:
     """
     生成一段 440Hz 的正弦波音频（嘟——声），用于测试音频传输
+    输出只由参数决定且 bytes 不可变，同样的参数直接返回缓存的整个 WAV
     """
     nframes = int(seconds * sr)
     buf = io.BytesIO()
@@ -15,16 +24,19 @@ def synthesize_wav_stub(text: str, seconds: float = 1.0, sr: int = 16000) -> byt
     volume = 0.3 * 32767    # 音量 (30% 的最大音量，防止太炸耳)，16-bit 最大是 32767
     
     # --- 生成波形数据 ---
-    audio_data = bytearray()
-    
-    for i in range(nframes):
-        # 核心数学公式：振幅 = 音量 * sin(2 * π * 频率 * 当前时间)
-        # i / sr 就是当前的时间点(秒)
-        sample_value = int(volume * math.sin(2 * math.pi * frequency * i / sr))
-        
-        # 将数值打包成 16-bit signed little-endian 格式 (Standard WAV format)
-        # "<h" 的意思是：小端序 (Little-endian), short (2 bytes)
-        audio_data.extend(struct.pack("<h", sample_value))
+    # 核心数学公式：振幅 = 音量 * sin(2 * π * 频率 * 当前时间)
+    # i / sr 就是当前的时间点(秒)
+    if np is not None:
+        # 整段一次算完：sin / 乘法都在 numpy 的 C 循环里做，不再逐个采样走 Python 字节码
+        t = np.arange(nframes, dtype=np.float64)
+        samples = volume * np.sin(2 * np.pi * frequency * t / sr)
+        # 16-bit signed little-endian (Standard WAV format)；astype 向零截断，与 int() 一致
+        audio_data = samples.astype("<i2").tobytes()
+    else:
+        pcm = array("h", (int(volume * math.sin(2 * math.pi * frequency * i / sr)) for i in range(nframes)))
+        if sys.byteorder == "big":
+            pcm.byteswap()
+        audio_data = pcm.tobytes()
 
     # --- 写入 WAV 文件头 ---
     with wave.open(buf, "wb") as wf:
@@ -33,4 +45,4 @@ def synthesize_wav_stub(text: str, seconds: float = 1.0, sr: int = 16000) -> byt
         wf.setframerate(sr)     # 采样率
         wf.writeframes(audio_data)
         
-    return buf.getvalue()
\ No newline at end of file
+    return buf.getvalue()
@@ -0,0 +1,25 @@
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+
+def start_queue_logging(name: str, level: str = "INFO", fmt: str = "%(message)s") -> QueueListener:
+    """
+    给 logger `name` 挂一个 QueueHandler：调用方线程只把 LogRecord 放进队列，
+    格式化和写 stdout 都在 QueueListener 的后台线程里做，不和推理线程抢 stdout 锁。
+    返回的 listener 由调用方在退出时 stop()，把队列里剩下的日志写完。
+    """
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    out = logging.StreamHandler(sys.stdout)
+    out.setFormatter(logging.Formatter(fmt))
+
+    log = logging.getLogger(name)
+    log.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    log.handlers[:] = [QueueHandler(q)]
+    # 只走自己的队列，不再经过 root / uvicorn 的 handler 重复输出
+    log.propagate = False
+
+    listener = QueueListener(q, out, respect_handler_level=False)
+    listener.start()
+    return listener